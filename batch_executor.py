@@ -0,0 +1,166 @@
+# coding:utf-8
+
+import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, as_completed, wait
+from video_prober import probe_videos
+from stage_metrics import pop_records, report_metrics
+from encoding_profiles import calibrate_batch_profiles
+
+# 每个任务同时驻留的帧数：解码缓冲 + 两块批处理的帧 + x264 lookahead
+DEFAULT_BUFFER_DEPTH = 64
+# 每个任务的固定开销（Python 解释器、moviepy、ffmpeg 进程本身）
+JOB_OVERHEAD_BYTES = 300 * 1024 * 1024
+
+def get_total_memory():
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    except (ValueError, AttributeError, OSError):
+        return None
+
+def estimate_job_memory(video_info, buffer_depth=DEFAULT_BUFFER_DEPTH):
+    width, height = video_info["size"] if video_info and video_info["size"] else (1920, 1080)
+    return width * height * 3 * buffer_depth + JOB_OVERHEAD_BYTES
+
+def plan_batch(video_paths, max_jobs=1, memory_budget=None, buffer_depth=DEFAULT_BUFFER_DEPTH):
+    cpu_count = os.cpu_count() or 1
+    if max_jobs is None or max_jobs <= 0:
+        max_jobs = cpu_count
+
+    if memory_budget is None:
+        total_memory = get_total_memory()
+        memory_budget = int(total_memory * 0.75) if total_memory else None
+
+    infos = probe_videos(video_paths)
+    estimates = {video_path: estimate_job_memory(infos[video_path], buffer_depth) for video_path in video_paths}
+
+    jobs = min(max_jobs, cpu_count, max(len(video_paths), 1))
+    if memory_budget is not None and estimates:
+        jobs = min(jobs, max(1, memory_budget // max(estimates.values())))
+
+    # 核心数在并行任务之间平分，每个任务的 ffmpeg 编码线程数不超过分到的核心数
+    threads = max(1, cpu_count // jobs)
+    return jobs, threads, memory_budget, estimates
+
+def _run_job(func, video_path, args=(), kwargs=None):
+    # 在工作进程里运行一个任务，把任务的返回值（输出文件）和产生的统计记录带回主进程
+    pop_records()
+    outputs = func(video_path, *args, **(kwargs or {}))
+    return outputs, pop_records()
+
+def _finish_job(manifest, video_path, outputs, job_params=None):
+    if manifest is not None:
+        manifest.mark_done(video_path, outputs, job_params)
+
+def _fail_job(manifest, video_path, error, job_params=None):
+    print(f"Error processing {video_path}: {error}")
+    if manifest is not None:
+        manifest.mark_failed(video_path, error, job_params)
+
+def _tag_records(records, func, queue_depth, running_jobs):
+    # 记录上标注任务名和提交时的队列深度（还在排队的视频数、已在运行的任务数）
+    for record in records:
+        record.update({"job": func.__name__, "queue_depth": queue_depth, "running_jobs": running_jobs})
+    return records
+
+def run_batch(func, video_paths, args=(), max_jobs=1, memory_budget=None, buffer_depth=DEFAULT_BUFFER_DEPTH, metrics_path=None, prom_path=None, manifest=None, job_kwargs=None, profile=None):
+    # manifest 是输出目录的 RunManifest：已经完成的视频直接跳过，其余的在开始和结束时更新状态。
+    # job_kwargs 和 video_paths 一一对应，是每个任务自己的关键字参数，同一个视频可以按不同参数出现多次。
+    # profile 是任务的编码配置名（或和 video_paths 一一对应的列表），auto 在提交任务之前测速
+    video_paths = list(video_paths)
+    if manifest is not None:
+        indices = manifest.pending_indices(video_paths, job_kwargs)
+        video_paths = [video_paths[i] for i in indices]
+        job_kwargs = [job_kwargs[i] for i in indices] if job_kwargs is not None else None
+        profile = [profile[i] for i in indices] if isinstance(profile, list) else profile
+        if not video_paths:
+            return
+    jobs, threads, memory_budget, estimates = plan_batch(video_paths, max_jobs, memory_budget, buffer_depth)
+    calibrate_batch_profiles(profile, video_paths, threads)
+    collected = []
+
+    def job_params(i):
+        return job_kwargs[i] if job_kwargs is not None else None
+
+    if jobs == 1:
+        for i, video_path in enumerate(video_paths):
+            if manifest is not None:
+                manifest.mark_running(video_path, job_params(i))
+            try:
+                outputs, records = _run_job(func, video_path, args, dict(job_params(i) or {}, threads=threads))
+                _finish_job(manifest, video_path, outputs, job_params(i))
+            except Exception as e:
+                _fail_job(manifest, video_path, e, job_params(i))
+                records = pop_records()
+            collected += _tag_records(records, func, len(video_paths) - i - 1, 0)
+        report_metrics(collected, metrics_path, prom_path)
+        return
+
+    print(f"Processing {len(video_paths)} videos with {jobs} jobs, {threads} encoder threads each")
+    pending = list(range(len(video_paths)))
+    running = {}
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        while pending or running:
+            # 按内存预算放行任务，至少保证有一个任务在运行
+            while pending and len(running) < jobs:
+                memory_in_use = sum(estimates[video_paths[i]] for i in running.values())
+                if running and memory_budget is not None and memory_in_use + estimates[video_paths[pending[0]]] > memory_budget:
+                    break
+                i = pending.pop(0)
+                if manifest is not None:
+                    manifest.mark_running(video_paths[i], job_params(i))
+                future = executor.submit(_run_job, func, video_paths[i], args, dict(job_params(i) or {}, threads=threads))
+                running[future] = i
+                future.queue_depth = (len(pending), len(running) - 1)
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                i = running.pop(future)
+                try:
+                    outputs, records = future.result()
+                    _finish_job(manifest, video_paths[i], outputs, job_params(i))
+                    collected += _tag_records(records, func, *future.queue_depth)
+                except Exception as e:
+                    _fail_job(manifest, video_paths[i], e, job_params(i))
+    report_metrics(collected, metrics_path, prom_path)
+
+def run_interactive_batch(select_func, func, video_paths, kwargs=None, max_jobs=1, memory_budget=None, buffer_depth=DEFAULT_BUFFER_DEPTH, metrics_path=None, prom_path=None, manifest=None, profile=None):
+    # 交互式的选择在主进程里逐个视频进行，每个视频选完就交给后台进程编码，
+    # 操作者选下一个视频的时候 CPU 已经在编码前面的视频；已经完成的视频不再让操作者选择
+    kwargs = kwargs or {}
+    if manifest is not None:
+        video_paths = manifest.pending(video_paths)
+        if not video_paths:
+            return
+    jobs, threads, _, _ = plan_batch(video_paths, max_jobs, memory_budget, buffer_depth)
+    # auto 配置在第一次选择之前测速，后台还没有编码任务
+    calibrate_batch_profiles(profile, video_paths, threads)
+    print(f"Encoding in the background with {jobs} jobs, {threads} encoder threads each")
+    collected = []
+
+    running = {}
+    # 选择时主进程已经打开过 cv2 的窗口、启动了界面线程，fork 出来的子进程可能死锁，后台进程用 spawn 重新启动解释器
+    with ProcessPoolExecutor(max_workers=jobs, mp_context=multiprocessing.get_context("spawn")) as executor:
+        for i, video_path in enumerate(video_paths):
+            try:
+                selection = select_func(video_path)
+            except Exception as e:
+                print(f"Error selecting {video_path}: {e}")
+                continue
+            if selection is None:
+                print(f"Skipping {video_path}: nothing selected")
+                continue
+            if manifest is not None:
+                manifest.mark_running(video_path)
+            future = executor.submit(_run_job, func, video_path, (), dict(kwargs, threads=threads, **selection))
+            future.queue_depth = (len(video_paths) - i - 1, sum(not f.done() for f in running))
+            running[future] = video_path
+
+        for future in as_completed(running):
+            try:
+                outputs, records = future.result()
+                _finish_job(manifest, running[future], outputs)
+                collected += _tag_records(records, func, *future.queue_depth)
+            except Exception as e:
+                _fail_job(manifest, running[future], e)
+    report_metrics(collected, metrics_path, prom_path)
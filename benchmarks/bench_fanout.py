@@ -0,0 +1,53 @@
+# coding:utf-8
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import cv2
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from frame_io import BACKENDS, batch_from_frame_func, fan_out_video, transform_video
+from bench_frame_io import RESOLUTIONS, make_synthetic_video
+
+def run_separately(video_path, variants, backend, profile):
+    # 原来的做法：每个尺寸、每个速度单独解码、编码一遍
+    start = time.perf_counter()
+    for output_path, size, speed in variants:
+        batch_func = batch_from_frame_func(lambda frame, size=size: cv2.resize(frame, size, interpolation=cv2.INTER_AREA)) if size else None
+        transform_video(video_path, output_path, batch_func, backend, audio=False, profile=profile, speed=speed)
+    return time.perf_counter() - start
+
+def run_fanout(video_path, variants, backend, profile):
+    start = time.perf_counter()
+    fan_out_video(video_path, variants, backend, audio=False, profile=profile)
+    return time.perf_counter() - start
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare writing several resized / speed-changed variants in one decode against one pass per variant.")
+    parser.add_argument("-r", "--resolutions", default="1080p", help="Comma separated source resolutions to test. Default is '1080p'.")
+    parser.add_argument("-n", "--frames", type=int, default=120, help="Number of frames in each synthetic video. Default is 120.")
+    parser.add_argument("--sizes", default="640x480,1280x720,2560x1080", help="Comma separated output sizes. Default is '640x480,1280x720,2560x1080'.")
+    parser.add_argument("--speeds", default="1", help="Comma separated speed factors. Default is '1'.")
+    parser.add_argument("-b", "--backend", choices=BACKENDS, default="ffmpeg", help="Frame reader backend. Default is 'ffmpeg'.")
+    parser.add_argument("-p", "--profile", default="fast", help="Encoding profile of the variants. Default is 'fast'.")
+    args = parser.parse_args()
+
+    sizes = [tuple(int(v) for v in item.split("x")) for item in args.sizes.split(",")]
+    speeds = [float(v) for v in args.speeds.split(",")]
+    work_dir = tempfile.mkdtemp(prefix="bench_fanout_")
+    print(f"{'resolution':<12}{'variants':>9}{'separate s':>12}{'fan-out s':>11}{'speedup':>9}")
+    try:
+        for name in args.resolutions.split(","):
+            video_path = os.path.join(work_dir, f"{name}.mp4")
+            make_synthetic_video(video_path, RESOLUTIONS[name], args.frames)
+            variants = [(os.path.join(work_dir, f"{name}_{size[0]}x{size[1]}_{speed}.mp4"), size, speed) for size in sizes for speed in speeds]
+
+            separate = run_separately(video_path, variants, args.backend, args.profile)
+            fanout = run_fanout(video_path, variants, args.backend, args.profile)
+            print(f"{name:<12}{len(variants):>9}{separate:>12.2f}{fanout:>11.2f}{separate / fanout:>8.2f}x")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
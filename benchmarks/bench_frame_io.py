@@ -0,0 +1,72 @@
+# coding:utf-8
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from frame_io import BACKENDS, FFmpegPipeWriter, open_reader, transform_video
+from mask_inpainter import make_mask_func
+
+RESOLUTIONS = {"1080p": (1920, 1080), "4k": (3840, 2160)}
+
+def make_synthetic_video(path, size, frame_count, fps=30):
+    width, height = size
+    yy, xx = np.mgrid[0:height, 0:width]
+    writer = FFmpegPipeWriter(path, size, fps)
+    for i in range(frame_count):
+        frame = np.empty((height, width, 3), dtype=np.uint8)
+        frame[..., 0] = (xx + i * 4) % 256
+        frame[..., 1] = yy % 256
+        frame[..., 2] = (xx + yy) % 256
+        cv2.putText(frame, "WATERMARK", (width - 420, height - 60), cv2.FONT_HERSHEY_SIMPLEX, 1.5, (255, 255, 255), 4)
+        writer.write_frame(frame)
+    writer.close()
+
+def make_watermark_mask(size):
+    width, height = size
+    mask = np.zeros((height, width), dtype=np.uint8)
+    cv2.putText(mask, "WATERMARK", (width - 420, height - 60), cv2.FONT_HERSHEY_SIMPLEX, 1.5, 255, 4)
+    return cv2.dilate(mask, np.ones((5, 5), np.uint8))
+
+def bench_decode(video_path, backend):
+    start = time.perf_counter()
+    reader = open_reader(video_path, backend)
+    frames = sum(1 for _ in reader)
+    reader.close()
+    return frames / (time.perf_counter() - start)
+
+def bench_transform(video_path, output_path, backend, batch_func, frame_count):
+    start = time.perf_counter()
+    transform_video(video_path, output_path, batch_func, backend, audio=False)
+    return frame_count / (time.perf_counter() - start)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the frame reader/writer backends.")
+    parser.add_argument("-r", "--resolutions", default="1080p,4k", help="Comma separated resolutions to test. Default is '1080p,4k'.")
+    parser.add_argument("-n", "--frames", type=int, default=120, help="Number of frames in each synthetic video. Default is 120.")
+    parser.add_argument("-b", "--backends", default=",".join(BACKENDS), help="Comma separated backends to test. Default is all backends.")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="bench_frame_io_")
+    print(f"{'resolution':<12}{'backend':<10}{'decode fps':>12}{'copy fps':>12}{'inpaint fps':>14}")
+    for name in args.resolutions.split(","):
+        size = RESOLUTIONS[name]
+        video_path = os.path.join(work_dir, f"{name}.mp4")
+        make_synthetic_video(video_path, size, args.frames)
+        mask_func = make_mask_func(make_watermark_mask(size))
+
+        for backend in args.backends.split(","):
+            output_path = os.path.join(work_dir, f"{name}_{backend}.mp4")
+            decode_fps = bench_decode(video_path, backend)
+            copy_fps = bench_transform(video_path, output_path, backend, None, args.frames)
+            inpaint_fps = bench_transform(video_path, output_path, backend, mask_func.apply_batch, args.frames)
+            print(f"{name:<12}{backend:<10}{decode_fps:>12.1f}{copy_fps:>12.1f}{inpaint_fps:>14.1f}")
+
+    shutil.rmtree(work_dir, ignore_errors=True)
@@ -0,0 +1,90 @@
+# coding:utf-8
+
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+from bench_suite import get_git_commit
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPTS = ("video_skipper", "video_cliper", "watermark_remover", "video_resizer", "video_recer", "video_speedchanger", "video_sliencer",
+           "video_darkness_skipper", "video_fanout", "video_pipeline", "video_pipeline_multi_select", "job_runner")
+# 启动时不应该加载的重模块：moviepy.editor 会连带加载所有特效和预览模块，imageio 由 moviepy.config 带进来，cv2 单独导入也要上百毫秒
+HEAVY_MODULES = ("moviepy.editor", "moviepy.video.io.VideoFileClip", "imageio", "tqdm", "scipy", "cv2")
+
+def run_help(script, importtime=False):
+    # 只跑到 argparse 的 --help 就退出，耗时基本都是模块导入
+    cmd = [sys.executable] + (["-X", "importtime"] if importtime else []) + [os.path.join(ROOT_DIR, f"{script}.py"), "--help"]
+    start = time.perf_counter()
+    result = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, cwd=ROOT_DIR)
+    elapsed = time.perf_counter() - start
+    if result.returncode != 0:
+        raise RuntimeError(f"{script}.py --help failed: {result.stderr.decode('utf8', errors='ignore')[-2000:]}")
+    return elapsed, result.stderr.decode("utf8", errors="ignore")
+
+def parse_importtime(output):
+    # -X importtime 每行是 "import time: 自身微秒 | 累计微秒 | 模块名"，返回 {模块名: 累计秒数}
+    modules = {}
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        parts = line[len("import time:"):].split("|")
+        try:
+            modules[parts[2].strip()] = int(parts[1]) / 1e6
+        except (IndexError, ValueError):
+            continue
+    return modules
+
+def measure_script(script, repeat):
+    times = [run_help(script)[0] for _ in range(repeat)]
+    modules = parse_importtime(run_help(script, importtime=True)[1])
+    heavy = {name: modules[name] for name in HEAVY_MODULES if name in modules}
+    return {"script": script, "min_s": min(times), "median_s": statistics.median(times), "modules": len(modules), "heavy": heavy}
+
+def compare_results(baseline, results):
+    old = {item["script"]: item for item in baseline["results"]}
+    print(f"\nCompared with {baseline.get('commit') or 'baseline'}:")
+    print(f"{'script':<30}{'min s':>18}{'median s':>18}")
+    for item in results:
+        before = old.get(item["script"])
+        if before is None:
+            continue
+
+        def change(name):
+            delta = (item[name] - before[name]) / before[name] * 100 if before[name] else 0.0
+            return f"{item[name]:.3f} ({delta:+.0f}%)"
+
+        print(f"{item['script']:<30}{change('min_s'):>18}{change('median_s'):>18}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure the startup time of every command line script (running it with --help) and list the heavy modules it imports.")
+    parser.add_argument("-s", "--scripts", default=",".join(SCRIPTS), help="Comma separated scripts to measure, without the .py suffix. Default is all scripts.")
+    parser.add_argument("-n", "--repeat", type=int, default=5, help="Number of timed runs per script. Default is 5.")
+    parser.add_argument("-o", "--output", default="bench_startup.json", help="Path of the JSON results file. Default is 'bench_startup.json'.")
+    parser.add_argument("-c", "--compare", default=None, help="Baseline JSON file from an earlier run to compare against.")
+    parser.add_argument("--fail_on_heavy", action="store_true", help="Exit with status 1 if any script imports one of the heavy modules at startup.")
+    args = parser.parse_args()
+
+    results = []
+    print(f"{'script':<30}{'min s':>8}{'median s':>10}{'modules':>9}  heavy modules")
+    for script in args.scripts.split(","):
+        item = measure_script(script, args.repeat)
+        results.append(item)
+        heavy = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in item["heavy"].items()) or "-"
+        print(f"{script:<30}{item['min_s']:>8.3f}{item['median_s']:>10.3f}{item['modules']:>9}  {heavy}")
+
+    report = {"commit": get_git_commit(), "created": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": sys.version.split()[0],
+              "settings": {"repeat": args.repeat}, "results": results}
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Saved results to {args.output}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            compare_results(json.load(f), results)
+
+    if args.fail_on_heavy and any(item["heavy"] for item in results):
+        sys.exit(1)
@@ -0,0 +1,284 @@
+# coding:utf-8
+
+import os
+import sys
+import json
+import time
+import wave
+import shutil
+import argparse
+import tempfile
+import subprocess
+import multiprocessing
+import cv2
+import numpy as np
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from frame_io import BACKENDS, FFmpegPipeWriter, open_reader
+
+RESOLUTIONS = {"360p": (640, 360), "720p": (1280, 720), "1080p": (1920, 1080), "4k": (3840, 2160)}
+STAGES = ("skipper", "cliper", "remover", "resizer", "recer", "speedchanger", "silencer", "darkness_skipper", "pipeline", "pipeline_multi_select")
+FPS = 30
+# 开头这一段压暗，给 darkness_skipper 留出要跳过的部分
+DARK_FRACTION = 0.25
+WATERMARK_TEXT = "WATERMARK"
+
+def _even(value):
+    return int(value) // 2 * 2
+
+def get_watermark_geometry(size):
+    # 水印位置和字号都随分辨率缩放，剪辑区域包含整个水印
+    width, height = size
+    scale = 1.5 * width / 1280
+    thickness = max(1, int(round(4 * width / 1280)))
+    origin = (int(width * 0.45), int(height * 0.85))
+    clip_roi = (_even(width * 0.25), _even(height * 0.25), _even(width * 0.7), _even(height * 0.7))
+    return scale, thickness, origin, clip_roi
+
+def make_clean_frame(size, index, frame_count, grid=None):
+    # 只由帧号决定的画面，修复结果可以和重新生成的原图比较
+    width, height = size
+    yy, xx = grid if grid is not None else np.mgrid[0:height, 0:width].astype(np.float32)
+    frame = np.empty((height, width, 3), dtype=np.float32)
+    frame[..., 0] = 128 + 90 * np.sin((xx + index * 3) / (width / 13.0))
+    frame[..., 1] = 128 + 90 * np.cos((yy - index * 2) / (height / 7.0))
+    frame[..., 2] = 128 + 50 * np.sin((xx + yy) / 37.0) + 25 * np.sin(xx / 5.0)
+    if index < frame_count * DARK_FRACTION:
+        frame *= 0.1
+    return np.clip(frame, 0, 255).astype(np.uint8)
+
+def make_watermark_mask(size):
+    width, height = size
+    scale, thickness, origin, _ = get_watermark_geometry(size)
+    mask = np.zeros((height, width), dtype=np.uint8)
+    cv2.putText(mask, WATERMARK_TEXT, origin, cv2.FONT_HERSHEY_SIMPLEX, scale, 255, thickness)
+    return cv2.dilate(mask, np.ones((5, 5), np.uint8))
+
+def write_sine_wave(path, duration, rate=44100):
+    samples = (np.sin(2 * np.pi * 440 * np.arange(int(duration * rate)) / rate) * 8000).astype(np.int16)
+    with wave.open(path, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(rate)
+        f.writeframes(samples.tobytes())
+
+def make_synthetic_video(path, size, duration):
+    # 画面用 NumPy 生成后烧进白色文字水印，音轨是一段正弦波
+    width, height = size
+    frame_count = int(duration * FPS)
+    scale, thickness, origin, _ = get_watermark_geometry(size)
+    grid = np.mgrid[0:height, 0:width].astype(np.float32)
+    audio_path = os.path.splitext(path)[0] + ".wav"
+    write_sine_wave(audio_path, duration)
+
+    writer = FFmpegPipeWriter(path, size, FPS, audio_source=audio_path, profile="fast")
+    for index in range(frame_count):
+        frame = make_clean_frame(size, index, frame_count, grid)
+        cv2.putText(frame, WATERMARK_TEXT, origin, cv2.FONT_HERSHEY_SIMPLEX, scale, (255, 255, 255), thickness)
+        writer.write_frame(frame)
+    writer.close()
+    os.remove(audio_path)
+    return frame_count
+
+def run_stage(stage, video_path, output_dir, size, duration, backend, profile):
+    # 每个阶段都用预设的参数直接调用脚本里的处理函数，不弹出任何选择窗口
+    _, _, _, clip_roi = get_watermark_geometry(size)
+    mask = make_watermark_mask(size)
+    x, y, w, h = clip_roi
+    clipped_mask = mask[y:y + h, x:x + w]
+
+    if stage == "skipper":
+        from video_skipper import process_video_file
+        process_video_file(video_path, output_dir, 0.5, 0.5, duration, backend, profile)
+    elif stage == "cliper":
+        from video_cliper import clip_video_file
+        clip_video_file(video_path, output_dir, clip_roi, None, backend, profile)
+    elif stage == "remover":
+        from watermark_remover import process_video_file
+        process_video_file(video_path, output_dir, mask, 1, None, backend, profile=profile)
+    elif stage == "resizer":
+        from video_resizer import process_video_file
+        process_video_file(video_path, output_dir, _even(size[0] / 2), _even(size[1] / 2), backend, profile)
+    elif stage == "recer":
+        from video_recer import process_video_file
+        process_video_file(video_path, output_dir, duration * 2, profile)
+    elif stage == "speedchanger":
+        from video_speedchanger import speed_change_video_file
+        speed_change_video_file(video_path, output_dir, 1.25, profile)
+    elif stage == "silencer":
+        from video_sliencer import process_video_file
+        process_video_file(video_path, output_dir, True, profile)
+    elif stage == "darkness_skipper":
+        from brightness_profiler import compute_brightness_profile, select_bright_frames
+        from video_darkness_skipper import process_video_file
+        brightness = compute_brightness_profile(video_path, 10)
+        bright_frames = select_bright_frames(brightness, FPS, duration, 10, 10, 10)
+        process_video_file(video_path, output_dir, bright_frames[0][0] / FPS, backend, profile)
+    elif stage == "pipeline":
+        from video_pipeline import process_single_video
+        process_single_video(video_path, output_dir, clip_roi=clip_roi, watermark_mask=clipped_mask, backend=backend, profile=profile)
+    elif stage == "pipeline_multi_select":
+        from video_pipeline_multi_select import process_single_video_fused
+        process_single_video_fused(video_path, output_dir, clip_roi=[clip_roi], watermark_mask=clipped_mask, backend=backend, profile=profile)
+    else:
+        raise ValueError(f"Unknown stage: {stage}")
+
+def _get_peak_rss_mb(who):
+    if resource is None:
+        return None
+    peak = resource.getrusage(who).ru_maxrss
+    # Linux 以 KB 为单位，macOS 以字节为单位
+    return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+def _measure_stage(args):
+    start = time.perf_counter()
+    run_stage(*args)
+    wall_time = time.perf_counter() - start
+    return {
+        "wall_s": wall_time,
+        "peak_rss_mb": _get_peak_rss_mb(resource.RUSAGE_SELF) if resource else None,
+        # ffmpeg 子进程里最大的一个
+        "peak_child_rss_mb": _get_peak_rss_mb(resource.RUSAGE_CHILDREN) if resource else None,
+    }
+
+def measure_stage(*args):
+    # 每个阶段在新的进程里运行，峰值内存互不影响
+    pool = multiprocessing.get_context("spawn").Pool(1)
+    try:
+        return pool.apply(_measure_stage, (args,))
+    finally:
+        pool.close()
+        pool.join()
+
+def find_output(output_dir):
+    outputs = [name for name in os.listdir(output_dir) if name.endswith(".mp4")]
+    return os.path.join(output_dir, sorted(outputs)[0]) if len(outputs) == 1 else None
+
+def count_frames(video_path):
+    reader = open_reader(video_path, "ffmpeg")
+    try:
+        return sum(1 for _ in reader)
+    finally:
+        reader.close()
+
+def masked_psnr(video_path, size, frame_count, crop=None):
+    # 逐帧和重新生成的原图比较遮罩内的像素，输出和输入按帧号对齐
+    mask = make_watermark_mask(size) > 0
+    grid = np.mgrid[0:size[1], 0:size[0]].astype(np.float32)
+    if crop is not None:
+        x, y, w, h = crop
+        mask = mask[y:y + h, x:x + w]
+
+    squared_error = 0.0
+    pixels = 0
+    reader = open_reader(video_path, "ffmpeg")
+    try:
+        for index, frame in enumerate(reader):
+            if index >= frame_count:
+                break
+            reference = make_clean_frame(size, index, frame_count, grid)
+            if crop is not None:
+                reference = reference[y:y + h, x:x + w]
+            diff = frame[mask].astype(np.float64) - reference[mask].astype(np.float64)
+            squared_error += float(np.sum(diff ** 2))
+            pixels += diff.size
+    finally:
+        reader.close()
+    if pixels == 0:
+        return None
+    mse = squared_error / pixels
+    return float("inf") if mse == 0 else float(10 * np.log10(255.0 ** 2 / mse))
+
+def get_git_commit():
+    try:
+        result = subprocess.run(["git", "rev-parse", "--short", "HEAD"], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                cwd=os.path.dirname(os.path.abspath(__file__)))
+        return result.stdout.decode().strip() or None
+    except OSError:
+        return None
+
+def compare_results(baseline, results):
+    # 按 阶段/分辨率/时长/后端 对齐两次的结果，打印相对变化
+    def key(item):
+        return (item["stage"], item["resolution"], item["duration"], item["backend"])
+
+    old = {key(item): item for item in baseline["results"]}
+    print(f"\nCompared with {baseline.get('commit') or 'baseline'}:")
+    print(f"{'stage':<24}{'res':<7}{'dur':>5}{'wall s':>16}{'fps':>18}{'peak MB':>18}{'PSNR':>16}")
+    for item in results:
+        before = old.get(key(item))
+        if before is None:
+            continue
+
+        def change(name, digits=1):
+            if item[name] is None or before[name] is None:
+                return "-"
+            delta = (item[name] - before[name]) / before[name] * 100 if before[name] else 0.0
+            return f"{item[name]:.{digits}f} ({delta:+.0f}%)"
+
+        psnr = "-" if item["masked_psnr"] is None or before["masked_psnr"] is None else f"{item['masked_psnr']:.2f} ({item['masked_psnr'] - before['masked_psnr']:+.2f})"
+        print(f"{item['stage']:<24}{item['resolution']:<7}{item['duration']:>5g}{change('wall_s', 2):>16}{change('fps'):>18}{change('peak_rss_mb'):>18}{psnr:>16}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run every processing stage headlessly on synthetic watermarked videos and record a JSON baseline.")
+    parser.add_argument("-r", "--resolutions", default="360p,720p", help="Comma separated resolutions to test. Default is '360p,720p'.")
+    parser.add_argument("-d", "--durations", default="4", help="Comma separated video lengths in seconds. Default is '4'.")
+    parser.add_argument("-s", "--stages", default=",".join(STAGES), help="Comma separated stages to run. Default is all stages.")
+    parser.add_argument("-b", "--backend", choices=BACKENDS, default="moviepy", help="Frame reader/writer backend passed to the stages. Default is 'moviepy'.")
+    parser.add_argument("-p", "--profile", default=None, help="Encoding profile passed to the stages. Default is the scripts' default.")
+    parser.add_argument("-o", "--output", default="bench_results.json", help="Path of the JSON results file. Default is 'bench_results.json'.")
+    parser.add_argument("-c", "--compare", default=None, help="Baseline JSON file from an earlier run to compare against.")
+    parser.add_argument("--keep", action="store_true", help="Keep the synthetic videos and stage outputs.")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="bench_suite_")
+    results = []
+    print(f"{'stage':<24}{'res':<7}{'dur':>5}{'wall s':>9}{'fps':>9}{'peak MB':>10}{'ffmpeg MB':>11}{'PSNR':>8}")
+    try:
+        for name in args.resolutions.split(","):
+            size = RESOLUTIONS[name]
+            for duration in [float(d) for d in args.durations.split(",")]:
+                video_path = os.path.join(work_dir, f"{name}_{duration:g}s.mp4")
+                frame_count = make_synthetic_video(video_path, size, duration)
+                _, _, _, clip_roi = get_watermark_geometry(size)
+
+                for stage in args.stages.split(","):
+                    output_dir = os.path.join(work_dir, f"{name}_{duration:g}s_{stage}")
+                    os.makedirs(output_dir)
+                    metrics = measure_stage(stage, video_path, output_dir, size, duration, args.backend, args.profile)
+
+                    output_path = find_output(output_dir)
+                    output_frames = count_frames(output_path) if output_path else 0
+                    psnr = None
+                    if output_path and stage in ("remover", "pipeline", "pipeline_multi_select"):
+                        psnr = masked_psnr(output_path, size, frame_count, clip_roi if stage != "remover" else None)
+
+                    item = {"stage": stage, "resolution": name, "duration": duration, "backend": args.backend,
+                            "frames": output_frames, "fps": output_frames / metrics["wall_s"], "masked_psnr": psnr, **metrics}
+                    results.append(item)
+                    peak = f"{item['peak_rss_mb']:.0f}" if item["peak_rss_mb"] is not None else "-"
+                    child_peak = f"{item['peak_child_rss_mb']:.0f}" if item["peak_child_rss_mb"] is not None else "-"
+                    psnr_text = f"{psnr:.2f}" if psnr is not None else "-"
+                    print(f"{stage:<24}{name:<7}{duration:>5g}{item['wall_s']:>9.2f}{item['fps']:>9.1f}{peak:>10}{child_peak:>11}{psnr_text:>8}")
+    finally:
+        if args.keep:
+            print(f"Kept benchmark files in {work_dir}")
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {"commit": get_git_commit(), "created": time.strftime("%Y-%m-%dT%H:%M:%S"), "cpu_count": os.cpu_count(),
+              "settings": {"resolutions": args.resolutions, "durations": args.durations, "backend": args.backend, "profile": args.profile},
+              "results": results}
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Saved results to {args.output}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            compare_results(json.load(f), results)
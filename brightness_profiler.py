@@ -0,0 +1,115 @@
+# coding:utf-8
+
+import os
+import glob
+import subprocess
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from video_prober import get_ffmpeg_binary, get_video_info
+
+# 亮度只看整体均值，缩到很小的灰度图就够了
+SCAN_HEIGHT = 64
+READ_BATCH_FRAMES = 256
+PROFILE_CACHE_DIR = ".brightness_cache"
+
+def _scan_range(video_path, fps, frame_step, first_sample, sample_count, scan_height=SCAN_HEIGHT):
+    # 从第 first_sample 个采样点开始，每 frame_step 帧取一帧，由 ffmpeg 直接输出缩小后的灰度图
+    cmd = [get_ffmpeg_binary(), "-loglevel", "error", "-threads", "1", "-skip_loop_filter", "all"]
+    start_time = first_sample * frame_step / fps
+    if start_time > 0:
+        cmd += ["-ss", f"{start_time:.6f}"]
+    cmd += ["-i", video_path, "-map", "0:v:0", "-an",
+            "-vf", f"select='not(mod(n,{frame_step}))',scale={scan_height}:{scan_height}:flags=area,format=gray",
+            "-vsync", "passthrough", "-frames:v", str(sample_count), "-f", "rawvideo", "-pix_fmt", "gray", "-"]
+
+    frame_bytes = scan_height * scan_height
+    profile = np.zeros(sample_count, dtype=np.float32)
+    filled = 0
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    try:
+        while filled < sample_count:
+            data = proc.stdout.read(frame_bytes * min(READ_BATCH_FRAMES, sample_count - filled))
+            count = len(data) // frame_bytes
+            if count == 0:
+                break
+            frames = np.frombuffer(data[:count * frame_bytes], dtype=np.uint8).reshape(count, frame_bytes)
+            profile[filled:filled + count] = frames.mean(axis=1)
+            filled += count
+    finally:
+        proc.stdout.close()
+        proc.wait()
+
+    # 文件尾部解码不出来的采样点沿用最后一个有效值
+    if 0 < filled < sample_count:
+        profile[filled:] = profile[filled - 1]
+    return profile
+
+def compute_brightness_profile(video_path, frame_step=10, workers=None):
+    # 返回第 0, frame_step, 2*frame_step, ... 帧的平均亮度；整段按时间切成几块，各由一个 ffmpeg 进程并行解码
+    info = get_video_info(video_path)
+    if info is None:
+        raise IOError(f"Could not open video file: {video_path}")
+    fps = info["fps"]
+    total_frames = info["frame_count"]
+    sample_total = max(1, (total_frames + frame_step - 1) // frame_step)
+
+    workers = workers or os.cpu_count() or 1
+    chunk = max(1, -(-sample_total // workers))
+    ranges = [(first, min(chunk, sample_total - first)) for first in range(0, sample_total, chunk)]
+
+    with ThreadPoolExecutor(max_workers=len(ranges)) as executor:
+        parts = executor.map(lambda r: _scan_range(video_path, fps, frame_step, r[0], r[1]), ranges)
+        return np.concatenate(list(parts))
+
+def _get_profile_cache_path(video_path, frame_step, scan_height=SCAN_HEIGHT):
+    # 文件名里带上文件大小、修改时间和采样参数，视频被替换或参数变了就不会命中旧的缓存
+    stat = os.stat(video_path)
+    cache_dir = os.path.join(os.path.dirname(os.path.abspath(video_path)), PROFILE_CACHE_DIR)
+    file_key = f"{os.path.basename(video_path)}.{stat.st_size}_{stat.st_mtime_ns}"
+    return cache_dir, file_key, f"{file_key}.step{frame_step}_h{scan_height}.npy"
+
+def get_brightness_profile(video_path, frame_step=10, workers=None):
+    cache_dir, file_key, name = _get_profile_cache_path(video_path, frame_step)
+    cache_path = os.path.join(cache_dir, name)
+    if os.path.isfile(cache_path):
+        try:
+            return np.load(cache_path)
+        except (OSError, ValueError) as e:
+            print(f"Could not read brightness cache {cache_path}, Error: {e}")
+
+    profile = compute_brightness_profile(video_path, frame_step, workers)
+
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        # 同一个视频旧版本的缓存已经用不上了，直接删掉
+        for stale_path in glob.glob(os.path.join(glob.escape(cache_dir), glob.escape(os.path.basename(video_path)) + ".*.npy")):
+            if not os.path.basename(stale_path).startswith(file_key + "."):
+                os.remove(stale_path)
+        fd, temp_path = tempfile.mkstemp(suffix=".npy", dir=cache_dir)
+        with os.fdopen(fd, "wb") as f:
+            np.save(f, profile)
+        os.replace(temp_path, cache_path)
+    except OSError as e:
+        print(f"Could not write brightness cache {cache_path}, Error: {e}")
+    return profile
+
+def select_bright_frames(profile, fps, duration, frame_step=10, top_k=10, time_window=10):
+    # 每个时间窗口取最亮的采样帧，再从中选出前 top_k 个，按帧索引排序返回 [(帧索引, 亮度)]
+    frame_indices = np.arange(len(profile)) * frame_step
+    window_size = duration / time_window
+
+    bright_frames = []
+    for window in range(time_window):
+        start_frame = int(window * window_size * fps)
+        end_frame = int((window + 1) * window_size * fps)
+        lo, hi = np.searchsorted(frame_indices, [start_frame, end_frame])
+        if lo >= hi:
+            continue
+        best = lo + int(np.argmax(profile[lo:hi]))
+        bright_frames.append((int(frame_indices[best]), float(profile[best])))
+
+    bright_frames.sort(key=lambda x: x[1], reverse=True)
+    top_bright_frames = bright_frames[:top_k]
+    top_bright_frames.sort(key=lambda x: x[0])
+    return top_bright_frames
@@ -0,0 +1,155 @@
+# coding:utf-8
+
+import os
+import json
+import time
+import platform
+import tempfile
+import subprocess
+from video_prober import get_ffmpeg_binary, get_video_info
+
+# fast：中间文件，编码快、质量高、关键帧密，后面的脚本剪切定位快
+# archival：存档，慢预设换更小的体积和更高的质量
+# delivery：成品，和以前 moviepy 默认的编码参数一致（medium、CRF 23、x264 默认 GOP）
+PROFILES = {
+    "fast": {"preset": "veryfast", "crf": 18, "pix_fmt": "yuv420p", "gop_seconds": 1, "threads": None},
+    "archival": {"preset": "slow", "crf": 16, "pix_fmt": "yuv420p", "gop_seconds": 10, "threads": None},
+    "delivery": {"preset": "medium", "crf": 23, "pix_fmt": "yuv420p", "gop_seconds": None, "threads": None},
+}
+PROFILE_NAMES = tuple(PROFILES) + ("auto",)
+DEFAULT_PROFILE = "delivery"
+
+# auto 在 delivery 的基础上，从这些预设里选出编码速度仍能达到目标倍速的最慢一个
+AUTO_PRESETS = ("ultrafast", "superfast", "veryfast", "faster", "fast", "medium", "slow", "slower")
+AUTO_BASE_PROFILE = "delivery"
+AUTO_TARGET_SPEED = 1.0
+AUTO_SAMPLE_SECONDS = 3.0
+
+# 同一进程里分辨率、帧率、线程数相同的视频只测一次；测出的预设同时按机器记在用户目录下的缓存文件里，
+# 批处理的各个子进程和以后的运行直接读取，不再重新测速
+_calibration_cache = {}
+CALIBRATION_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "watermark_remover", "encoding_calibration.json")
+
+def _calibration_key(key):
+    return json.dumps([platform.node(), os.cpu_count()] + list(key))
+
+def _load_calibrations():
+    try:
+        with open(CALIBRATION_CACHE_PATH, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _save_calibration(key, preset):
+    calibrations = _load_calibrations()
+    calibrations[_calibration_key(key)] = preset
+    directory = os.path.dirname(CALIBRATION_CACHE_PATH)
+    try:
+        os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(suffix=".json", dir=directory)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(calibrations, f, indent=1)
+        os.replace(temp_path, CALIBRATION_CACHE_PATH)
+    except OSError as e:
+        print(f"Could not write encoding calibration cache {CALIBRATION_CACHE_PATH}, Error: {e}")
+
+def _measure_speed(video_path, start_time, duration, profile, threads):
+    # 用真实的输入编码一小段并丢弃结果，返回编码速度相对实时播放的倍数；ffmpeg 出错时返回 None
+    cmd = [get_ffmpeg_binary(), "-loglevel", "error", "-ss", f"{start_time:.6f}", "-t", f"{duration:.6f}",
+           "-i", video_path, "-an", "-map", "0:v:0"]
+    cmd += ffmpeg_video_args(profile, threads=threads)
+    cmd += ["-f", "null", "-"]
+    start = time.perf_counter()
+    result = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        error = result.stderr.decode("utf8", errors="ignore").strip().splitlines()
+        print(f"Encoding speed test failed for {video_path}, using the '{DEFAULT_PROFILE}' profile: {error[-1] if error else result.returncode}")
+        return None
+    return duration / max(time.perf_counter() - start, 1e-6)
+
+def calibrate_auto_profile(video_path, threads=None, target_speed=AUTO_TARGET_SPEED, sample_seconds=AUTO_SAMPLE_SECONDS):
+    profile = dict(PROFILES[AUTO_BASE_PROFILE])
+    info = get_video_info(video_path)
+    if info is None:
+        return profile
+
+    key = (tuple(info["size"]), round(info["fps"], 3), threads, target_speed)
+    if key not in _calibration_cache:
+        preset = _load_calibrations().get(_calibration_key(key))
+        if preset in AUTO_PRESETS:
+            _calibration_cache[key] = preset
+    if key in _calibration_cache:
+        profile["preset"] = _calibration_cache[key]
+        return profile
+
+    # 取视频中间的一段，避开片头的黑场；编码速度随预设单调变慢，二分查找满足目标的最慢预设
+    duration = min(sample_seconds, info["duration"])
+    start_time = max(0.0, (info["duration"] - duration) / 2)
+    low, high = 0, len(AUTO_PRESETS) - 1
+    best = 0
+    while low <= high:
+        middle = (low + high) // 2
+        profile["preset"] = AUTO_PRESETS[middle]
+        speed = _measure_speed(video_path, start_time, duration, profile, threads)
+        if speed is None:
+            # 测速失败的结果不能当作“够快”，不再继续查找，直接用默认配置；这个结果不写进缓存文件
+            profile = dict(PROFILES[DEFAULT_PROFILE])
+            _calibration_cache[key] = profile["preset"]
+            return profile
+        if speed >= target_speed:
+            best = middle
+            low = middle + 1
+        else:
+            high = middle - 1
+
+    profile["preset"] = AUTO_PRESETS[best]
+    _calibration_cache[key] = profile["preset"]
+    _save_calibration(key, profile["preset"])
+    print(f"Auto encoding profile for {info['size'][0]}x{info['size'][1]}: preset {profile['preset']}")
+    return profile
+
+def calibrate_batch_profiles(profiles, video_paths, threads=None):
+    # 批处理在提交任务之前调用：auto 配置在主进程里按分辨率各测一次速，这时还没有别的任务占用 CPU，
+    # 子进程再取配置时直接命中缓存，不会各自在负载下测出不同的预设。profiles 是一个配置名或和 video_paths 一一对应的列表
+    if not isinstance(profiles, (list, tuple)):
+        profiles = [profiles] * len(video_paths)
+    for profile, video_path in zip(profiles, video_paths):
+        if profile == "auto":
+            calibrate_auto_profile(video_path, threads)
+
+def get_profile(profile=None, video_path=None, threads=None):
+    # 接受配置名或已经解析好的配置字典；auto 需要输入视频才能测速，没有时退回 delivery
+    if isinstance(profile, dict):
+        return profile
+    name = profile or DEFAULT_PROFILE
+    if name == "auto":
+        if video_path is None:
+            return dict(PROFILES[AUTO_BASE_PROFILE])
+        return calibrate_auto_profile(video_path, threads)
+    if name not in PROFILES:
+        raise ValueError(f"Unknown encoding profile: {name}, expected one of {', '.join(PROFILE_NAMES)}")
+    return dict(PROFILES[name])
+
+def get_threads(profile, threads=None):
+    # 配置里的 threads 是上限，批处理分给每个任务的线程更少时以分配的为准
+    if profile["threads"] is None:
+        return threads
+    return profile["threads"] if threads is None else min(threads, profile["threads"])
+
+def ffmpeg_video_args(profile, fps=None, threads=None):
+    args = ["-c:v", "libx264", "-preset", profile["preset"], "-crf", str(profile["crf"]), "-pix_fmt", profile["pix_fmt"]]
+    if profile["gop_seconds"] is not None and fps:
+        args += ["-g", str(max(1, int(round(profile["gop_seconds"] * fps))))]
+    threads = get_threads(profile, threads)
+    if threads is not None:
+        args += ["-threads", str(threads)]
+    return args
+
+def moviepy_write_kwargs(profile, fps=None, threads=None):
+    # moviepy 对偶数尺寸的 libx264 输出总会在最后追加 -pix_fmt yuv420p，其他像素格式只在 ffmpeg/opencv 后端下生效
+    ffmpeg_params = ["-crf", str(profile["crf"])]
+    if profile["pix_fmt"] != "yuv420p":
+        ffmpeg_params += ["-pix_fmt", profile["pix_fmt"]]
+    if profile["gop_seconds"] is not None and fps:
+        ffmpeg_params += ["-g", str(max(1, int(round(profile["gop_seconds"] * fps))))]
+    return {"codec": "libx264", "preset": profile["preset"], "threads": get_threads(profile, threads), "ffmpeg_params": ffmpeg_params}
@@ -0,0 +1,390 @@
+# coding:utf-8
+
+import time
+import subprocess
+import numpy as np
+from video_prober import get_ffmpeg_binary, get_video_info
+from encoding_profiles import ffmpeg_video_args, get_profile, moviepy_write_kwargs
+from stage_metrics import VideoMetrics
+
+BACKENDS = ("moviepy", "ffmpeg", "opencv")
+DEFAULT_BUFFER_COUNT = 4
+# 批处理时一块最多放的帧数，同时限制一块的字节数，4K 视频不会一次占用太多内存
+MAX_BATCH_FRAMES = 32
+MAX_BATCH_BYTES = 64 * 1024 * 1024
+
+def get_batch_frames(size, batch_frames=None):
+    width, height = size
+    if batch_frames is None:
+        batch_frames = MAX_BATCH_BYTES // (width * height * 3)
+    return max(1, min(batch_frames, MAX_BATCH_FRAMES))
+
+def _iter_batches(size, batch_frames, read_into):
+    # 两块 (N, H, W, 3) 缓冲区轮流使用，read_into 把一帧直接写进块里的对应位置，读完时返回 False
+    width, height = size
+    blocks = [np.empty((batch_frames, height, width, 3), dtype=np.uint8) for _ in range(2)]
+    index = 0
+    while True:
+        block = blocks[index % 2]
+        count = 0
+        while count < batch_frames and read_into(block[count]):
+            count += 1
+        if count == 0:
+            break
+        yield block[:count]
+        if count < batch_frames:
+            break
+        index += 1
+
+# moviepy、cv2、tqdm 都在用到的地方才导入：只读 ffmpeg 管道的后端和只看 --help 的脚本都不用加载它们，
+# 直接导入 moviepy.editor 会连带加载所有特效和预览模块，启动要慢半秒以上
+
+class MoviepyFrameReader:
+    def __init__(self, video_path, start_time=0, end_time=None):
+        from moviepy.video.io.VideoFileClip import VideoFileClip
+
+        self.video_clip = VideoFileClip(video_path, audio=False)
+        self.fps = self.video_clip.fps
+        self.size = tuple(self.video_clip.size)
+        self.clip = self.video_clip
+        if start_time > 0 or end_time is not None:
+            self.clip = self.video_clip.subclip(start_time, end_time)
+        self.frame_count = len(np.arange(0, self.clip.duration, 1.0 / self.fps))
+
+    def __iter__(self):
+        return self.clip.iter_frames(fps=self.fps, dtype="uint8")
+
+    def iter_batches(self, batch_frames=None):
+        frames = iter(self)
+
+        def read_into(buffer):
+            frame = next(frames, None)
+            if frame is None:
+                return False
+            np.copyto(buffer, frame)
+            return True
+
+        return _iter_batches(self.size, get_batch_frames(self.size, batch_frames), read_into)
+
+    def close(self):
+        self.video_clip.close()
+
+class FFmpegPipeReader:
+    # 通过 rawvideo 管道读帧，直接 readinto 预先分配好的一组缓冲区，不再每帧新建数组
+    def __init__(self, video_path, start_time=0, end_time=None, buffer_count=DEFAULT_BUFFER_COUNT):
+        infos = get_video_info(video_path)
+        if infos is None:
+            raise IOError(f"Could not open video file: {video_path}")
+        self.fps = infos["fps"]
+        self.size = tuple(infos["size"])
+        duration = (end_time if end_time is not None else infos["duration"]) - start_time
+        self.frame_count = len(np.arange(0, duration, 1.0 / self.fps))
+
+        width, height = self.size
+        self.buffers = [np.empty((height, width, 3), dtype=np.uint8) for _ in range(buffer_count)]
+
+        cmd = [get_ffmpeg_binary(), "-loglevel", "error"]
+        if start_time > 0:
+            cmd += ["-ss", f"{start_time:.6f}"]
+        cmd += ["-i", video_path]
+        if end_time is not None:
+            cmd += ["-t", f"{end_time - start_time:.6f}"]
+        cmd += ["-f", "rawvideo", "-pix_fmt", "rgb24", "-an", "-"]
+        self.proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, bufsize=width * height * 3)
+
+    def _read_into(self, buffer):
+        view = memoryview(buffer).cast("B")
+        filled = 0
+        while filled < len(view):
+            n = self.proc.stdout.readinto(view[filled:])
+            if not n:
+                return False
+            filled += n
+        return True
+
+    def __iter__(self):
+        index = 0
+        while True:
+            buffer = self.buffers[index % len(self.buffers)]
+            if not self._read_into(buffer):
+                break
+            yield buffer
+            index += 1
+
+    def iter_batches(self, batch_frames=None):
+        return _iter_batches(self.size, get_batch_frames(self.size, batch_frames), self._read_into)
+
+    def close(self):
+        if self.proc.poll() is None:
+            self.proc.kill()
+        self.proc.stdout.close()
+        self.proc.wait()
+
+class OpenCVFrameReader:
+    def __init__(self, video_path, start_time=0, end_time=None, buffer_count=DEFAULT_BUFFER_COUNT):
+        import cv2
+
+        self.capture = cv2.VideoCapture(video_path)
+        if not self.capture.isOpened():
+            raise IOError(f"Could not open video file: {video_path}")
+        self.fps = self.capture.get(cv2.CAP_PROP_FPS)
+        width = int(self.capture.get(cv2.CAP_PROP_FRAME_WIDTH))
+        height = int(self.capture.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        self.size = (width, height)
+
+        total_frames = int(self.capture.get(cv2.CAP_PROP_FRAME_COUNT))
+        duration = (end_time if end_time is not None else total_frames / self.fps) - start_time
+        self.frame_count = len(np.arange(0, duration, 1.0 / self.fps))
+        if start_time > 0:
+            self.capture.set(cv2.CAP_PROP_POS_MSEC, start_time * 1000)
+
+        self.frames_read = 0
+        self.bgr_buffer = np.empty((height, width, 3), dtype=np.uint8)
+        self.buffers = [np.empty((height, width, 3), dtype=np.uint8) for _ in range(buffer_count)]
+
+    def _read_into(self, buffer):
+        import cv2
+
+        if self.frames_read >= self.frame_count:
+            return False
+        ok, _ = self.capture.read(self.bgr_buffer)
+        if not ok:
+            return False
+        cv2.cvtColor(self.bgr_buffer, cv2.COLOR_BGR2RGB, dst=buffer)
+        self.frames_read += 1
+        return True
+
+    def __iter__(self):
+        index = 0
+        while True:
+            buffer = self.buffers[index % len(self.buffers)]
+            if not self._read_into(buffer):
+                break
+            yield buffer
+            index += 1
+
+    def iter_batches(self, batch_frames=None):
+        return _iter_batches(self.size, get_batch_frames(self.size, batch_frames), self._read_into)
+
+    def close(self):
+        self.capture.release()
+
+def atempo_filter(speed):
+    # atempo 每一级只支持 0.5 到 2 倍，超出范围时串联几级
+    factors = []
+    while speed > 2.0:
+        factors.append(2.0)
+        speed /= 2.0
+    while speed < 0.5:
+        factors.append(0.5)
+        speed /= 0.5
+    factors.append(speed)
+    return ",".join(f"atempo={factor:.6f}" for factor in factors)
+
+class FFmpegPipeWriter:
+    # 处理后的帧直接写进编码器的 stdin，音频从源文件对应的时间段复用过来。
+    # speed 不为 1 时按 fps * speed 读入原始帧，再由 ffmpeg 按原帧率丢帧或补帧，音频用 atempo 变速（不变调）
+    def __init__(self, output_path, size, fps, threads=None, audio_source=None, audio_start=0, audio_duration=None, profile=None, speed=1.0):
+        width, height = size
+        cmd = [get_ffmpeg_binary(), "-y", "-loglevel", "error",
+               "-f", "rawvideo", "-pix_fmt", "rgb24", "-s", f"{width}x{height}", "-r", f"{fps * speed:.6f}", "-i", "-"]
+        if audio_source is not None:
+            if audio_start > 0:
+                cmd += ["-ss", f"{audio_start:.6f}"]
+            if audio_duration is not None:
+                cmd += ["-t", f"{audio_duration:.6f}"]
+            cmd += ["-i", audio_source, "-map", "0:v:0", "-map", "1:a:0?", "-c:a", "aac", "-shortest"]
+            if speed != 1:
+                cmd += ["-filter:a", atempo_filter(speed)]
+        if speed != 1:
+            # fps 滤镜按时间戳取帧，输出帧数和变速后的时长一致（输出端 -r 会在结尾多补帧）
+            cmd += ["-filter:v", f"fps={fps:.6f}"]
+        cmd += ffmpeg_video_args(get_profile(profile), fps, threads)
+        cmd += [output_path]
+        self.output_path = output_path
+        self.proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    def write_frame(self, frame):
+        # 单帧和 (N, H, W, 3) 的整块都可以，一块连续内存一次写进管道
+        try:
+            self.proc.stdin.write(memoryview(np.ascontiguousarray(frame)).cast("B"))
+        except BrokenPipeError:
+            error = self.proc.stderr.read().decode("utf8", errors="ignore")
+            raise IOError(f"ffmpeg error while writing {self.output_path}: {error}")
+
+    def close(self):
+        self.proc.stdin.close()
+        error = self.proc.stderr.read().decode("utf8", errors="ignore")
+        if self.proc.wait() != 0:
+            raise IOError(f"ffmpeg error while writing {self.output_path}: {error}")
+
+def open_reader(video_path, backend="ffmpeg", start_time=0, end_time=None):
+    if backend == "moviepy":
+        return MoviepyFrameReader(video_path, start_time, end_time)
+    if backend == "ffmpeg":
+        return FFmpegPipeReader(video_path, start_time, end_time)
+    if backend == "opencv":
+        return OpenCVFrameReader(video_path, start_time, end_time)
+    raise ValueError(f"Unknown frame backend: {backend}")
+
+def batch_from_frame_func(frame_func):
+    # 只能逐帧处理的函数（比如缩放）包装成批处理函数，结果写进一块预先分配的输出
+    def batch_func(frames):
+        out = None
+        for i, frame in enumerate(frames):
+            result = frame_func(frame)
+            if out is None:
+                same_shape = result.shape == frame.shape and frames.flags.writeable
+                out = frames if same_shape else np.empty((len(frames),) + result.shape, dtype=np.uint8)
+            if result is not frame:
+                out[i] = result
+        return out
+
+    return batch_func
+
+def transform_video(input_path, output_path, batch_func=None, backend="moviepy", start_time=0, end_time=None, threads=None, audio=True, batch_frames=None, profile=None, speed=1.0):
+    # batch_func 接收 (N, H, W, 3) 的一块帧，返回处理后的一块；可以原地修改，也可以返回切片视图
+    # profile 是编码配置名或 get_profile 解析好的字典，auto 用这个输入视频测速
+    # speed 不为 1 时在同一次编码里变速，不再单独解码、编码一遍
+    from tqdm import tqdm
+
+    profile = get_profile(profile, input_path, threads)
+    metrics = VideoMetrics("transform", input_path, output_path, backend)
+    if backend == "moviepy":
+        from moviepy.video.io.VideoFileClip import VideoFileClip
+        from moviepy.video.fx.speedx import speedx
+
+        video_clip = VideoFileClip(input_path, audio=audio)
+        if start_time > 0 or end_time is not None:
+            video_clip = video_clip.subclip(start_time, end_time)
+        progress_bar = tqdm(total=len(np.arange(0, video_clip.duration / speed, 1.0 / video_clip.fps)), desc="Processing Frames", unit="frames")
+        # moviepy 建新片段时会先取一次第 0 帧探测尺寸，这一次不计入进度和统计
+        writing = [False]
+
+        # moviepy 只能逐帧回调，每帧当成只有一帧的块交给 batch_func；编码在 moviepy 内部，记为剩下的时间
+        def process_frame(get_frame, t):
+            decode_start = time.perf_counter()
+            frame = get_frame(t)
+            transform_start = time.perf_counter()
+            result = batch_func(frame[np.newaxis])[0] if batch_func is not None else frame
+            if writing[0]:
+                metrics.add_block(1, transform_start - decode_start, time.perf_counter() - transform_start, raw_bytes=result.nbytes)
+                progress_bar.update(1)
+            return result
+
+        try:
+            processed_clip = video_clip.fl(process_frame, apply_to=[])
+            if speed != 1:
+                # 和 video_speedchanger.py 一样用 speedx，音频跟着变速
+                processed_clip = processed_clip.fx(speedx, speed)
+            writing[0] = True
+            processed_clip.write_videofile(output_path, audio=audio, **moviepy_write_kwargs(profile, video_clip.fps, threads))
+        finally:
+            progress_bar.close()
+            video_clip.close()
+        metrics.finish("encode")
+        return
+
+    reader = open_reader(input_path, backend, start_time, end_time)
+    progress_bar = tqdm(total=reader.frame_count, desc="Processing Frames", unit="frames")
+    writer = None
+    try:
+        batches = iter(reader.iter_batches(batch_frames))
+        while True:
+            # 等待读取器给出下一块的时间算解码，写进编码器管道的时间算编码
+            decode_start = time.perf_counter()
+            frames = next(batches, None)
+            if frames is None:
+                break
+            transform_start = time.perf_counter()
+            result = batch_func(frames) if batch_func is not None else frames
+            encode_start = time.perf_counter()
+            if writer is None:
+                # 输出尺寸以第一块处理结果为准（剪辑后尺寸会变小）
+                audio_duration = end_time - start_time if end_time is not None else None
+                writer = FFmpegPipeWriter(output_path, (result.shape[2], result.shape[1]), reader.fps, threads,
+                                          input_path if audio else None, start_time, audio_duration, profile, speed)
+            writer.write_frame(result)
+            metrics.add_block(len(frames), transform_start - decode_start, encode_start - transform_start,
+                              time.perf_counter() - encode_start, result.nbytes)
+            progress_bar.update(len(frames))
+    finally:
+        progress_bar.close()
+        reader.close()
+        if writer is not None:
+            # 编码器收尾（刷出缓存的帧、封装音频）也算编码时间
+            close_start = time.perf_counter()
+            writer.close()
+            metrics.add_time("encode", time.perf_counter() - close_start)
+    metrics.finish()
+
+def fan_out_video(input_path, variants, backend="ffmpeg", start_time=0, end_time=None, threads=None, audio=True, batch_frames=None, profile=None):
+    # 一次解码写出多个版本：variants 是 (输出路径, 尺寸, 速度) 的列表，尺寸为 None 时保持原尺寸。
+    # 尺寸相同的输出共用一次 cv2.resize（INTER_AREA），变速在各自的编码器里完成；每块帧同时交给各尺寸的线程缩放、写管道，
+    # 各编码器是独立的 ffmpeg 进程，并行编码。编码线程在各输出之间平分
+    import cv2
+    from concurrent.futures import ThreadPoolExecutor
+    from tqdm import tqdm
+
+    profile = get_profile(profile, input_path, threads)
+    reader = open_reader(input_path, backend, start_time, end_time)
+    encoder_threads = max(1, threads // len(variants)) if threads else None
+    audio_duration = end_time - start_time if end_time is not None else None
+    groups = {}
+    progress_bar = tqdm(total=reader.frame_count, desc="Processing Frames", unit="frames")
+    executor = None
+    completed = False
+    try:
+        for output_path, size, speed in variants:
+            size = tuple(size) if size else reader.size
+            writer = FFmpegPipeWriter(output_path, size, reader.fps, encoder_threads, input_path if audio else None,
+                                      start_time, audio_duration, profile, speed)
+            groups.setdefault(size, []).append((writer, VideoMetrics("fanout", input_path, output_path, backend)))
+        buffers = {size: np.empty((get_batch_frames(reader.size, batch_frames), size[1], size[0], 3), dtype=np.uint8)
+                   for size in groups if size != reader.size}
+
+        def write_group(size, frames):
+            transform_start = time.perf_counter()
+            resized = frames
+            if size in buffers:
+                resized = buffers[size][:len(frames)]
+                for i, frame in enumerate(frames):
+                    cv2.resize(frame, size, dst=resized[i], interpolation=cv2.INTER_AREA)
+            transform = time.perf_counter() - transform_start
+            for writer, metrics in groups[size]:
+                encode_start = time.perf_counter()
+                writer.write_frame(resized)
+                metrics.add_block(len(frames), None, transform, time.perf_counter() - encode_start, resized.nbytes)
+
+        # 解码只做一次，等待读取器的时间记在第一个输出上
+        first_metrics = next(iter(groups.values()))[0][1]
+        executor = ThreadPoolExecutor(max_workers=len(groups))
+        batches = iter(reader.iter_batches(batch_frames))
+        while True:
+            decode_start = time.perf_counter()
+            frames = next(batches, None)
+            if frames is None:
+                break
+            first_metrics.add_time("decode", time.perf_counter() - decode_start)
+            # 读取器轮流复用两块缓冲区，所有尺寸都写完这一块才去取下一块
+            list(executor.map(lambda size: write_group(size, frames), groups))
+            progress_bar.update(len(frames))
+        completed = True
+    finally:
+        progress_bar.close()
+        reader.close()
+        if executor is not None:
+            executor.shutdown()
+        # 每个编码器都要关闭，出错的编码器不影响其他输出收尾；处理过程没有出错时再抛出第一个关闭时的错误
+        error = None
+        for writer, metrics in (item for items in groups.values() for item in items):
+            close_start = time.perf_counter()
+            try:
+                writer.close()
+            except IOError as e:
+                error = error or e
+            metrics.add_time("encode", time.perf_counter() - close_start)
+        if completed and error is not None:
+            raise error
+    for writer, metrics in (item for items in groups.values() for item in items):
+        metrics.finish()
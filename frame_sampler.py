@@ -0,0 +1,110 @@
+# coding:utf-8
+
+import subprocess
+import numpy as np
+from video_prober import get_ffmpeg_binary, get_video_info
+
+# 和 moviepy 一样，目标帧在当前位置之后 100 帧以内时顺序解码过去，比重新定位更快
+MAX_FORWARD_FRAMES = 100
+
+class FrameSampler:
+    # 均匀分布的采样时间点只取一次：所有时间点放进同一个 ffmpeg 进程按顺序解码，
+    # 结果缓存起来，ROI 选择、有效帧判断和遮罩投票共用同一批帧
+    def __init__(self, video_path, start_time=0, end_time=None, num_frames=10, times=None):
+        info = get_video_info(video_path)
+        if info is None:
+            raise IOError(f"Could not open video file: {video_path}")
+        self.video_path = video_path
+        self.fps = info["fps"]
+        self.size = tuple(info["size"])
+
+        if times is not None:
+            self.times = list(times)
+        else:
+            duration = (end_time if end_time is not None else info["duration"]) - start_time
+            total_frames = int(duration * self.fps)
+            self.times = [start_time + int(i * total_frames / num_frames) / self.fps for i in range(num_frames)]
+        self.cache = {}
+
+    def _get_output_size(self, max_height):
+        width, height = self.size
+        if max_height is None or max_height >= height:
+            return width, height
+        return int(round(width * max_height / height / 2)) * 2, max_height
+
+    def _group_times(self, keyframes_only):
+        # 相邻时间点离得近时放进同一个输入顺序往后解码，离得远时另起一个输入直接定位过去
+        unique_times = sorted(set(self.times))
+        if keyframes_only:
+            return [[t] for t in unique_times]
+        groups = []
+        for t in unique_times:
+            if groups and (t - groups[-1][-1]) * self.fps <= MAX_FORWARD_FRAMES:
+                groups[-1].append(t)
+            else:
+                groups.append([t])
+        return groups
+
+    def _sweep(self, keyframes_only, max_height):
+        width, height = self._get_output_size(max_height)
+        groups = self._group_times(keyframes_only)
+        cmd = [get_ffmpeg_binary(), "-loglevel", "error"]
+        filters = []
+        # 输出按组、组内按帧偏移排列，每个时间点记下它对应第几个输出帧；同一帧上的多个时间点共用一个输出帧
+        slots = {}
+        frame_index = 0
+        for i, group in enumerate(groups):
+            if keyframes_only:
+                # 只解码关键帧，定位到时间点之前最近的关键帧后不再向后解码
+                cmd += ["-skip_frame", "nokey", "-noaccurate_seek"]
+            # -t 限制每个输入只读到这一组最后一个时间点，取完帧后不会继续解码到文件结尾
+            cmd += ["-ss", f"{group[0]:.6f}", "-t", f"{group[-1] - group[0] + 2.0 / self.fps:.6f}", "-i", self.video_path]
+            offsets = sorted({round((t - group[0]) * self.fps) for t in group})
+            for t in group:
+                slots[t] = frame_index + offsets.index(round((t - group[0]) * self.fps))
+            frame_index += len(offsets)
+            select = "+".join(f"eq(n,{offset})" for offset in offsets)
+            filters.append(f"[{i}:v:0]select='{select}',setpts=PTS-STARTPTS,scale={width}:{height}[v{i}]")
+        filters.append("".join(f"[v{i}]" for i in range(len(groups))) + f"concat=n={len(groups)}:v=1:a=0[out]")
+        cmd += ["-filter_complex", ";".join(filters), "-map", "[out]", "-vsync", "passthrough",
+                "-f", "rawvideo", "-pix_fmt", "rgb24", "-"]
+
+        result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        frame_bytes = width * height * 3
+        frame_count = len(result.stdout) // frame_bytes
+        if frame_count == 0:
+            error = result.stderr.decode("utf8", errors="ignore")
+            raise IOError(f"Could not sample frames from {self.video_path}: {error}")
+        frames = np.frombuffer(result.stdout[:frame_count * frame_bytes], dtype=np.uint8).reshape(frame_count, height, width, 3)
+
+        # 时间点按顺序排列，只有文件尾部之后的时间点会取不到帧，也就是最后几个输出帧；这些时间点不放进结果
+        return {t: frames[slot] for t, slot in slots.items() if slot < frame_count}
+
+    def get_frames(self, keyframes_only=False, max_height=None):
+        # 按 self.times 的顺序返回帧，重复的时间点重复返回同一帧，没有解码到的时间点跳过
+        frame_map = self.get_frame_map(keyframes_only, max_height)
+        return [frame_map[t] for t in self.times if t in frame_map]
+
+    def get_frame_map(self, keyframes_only=False, max_height=None):
+        # 返回 {时间点: 帧}，只包含实际解码到的时间点
+        key = (keyframes_only, max_height)
+        if key not in self.cache:
+            full_key = (keyframes_only, None)
+            if max_height is not None and full_key in self.cache:
+                # 已经有全分辨率的帧时直接缩小，不再解码
+                import cv2
+
+                size = self._get_output_size(max_height)
+                self.cache[key] = {t: cv2.resize(frame, size, interpolation=cv2.INTER_AREA) for t, frame in self.cache[full_key].items()}
+            elif keyframes_only and (False, max_height) in self.cache:
+                self.cache[key] = self.cache[(False, max_height)]
+            else:
+                self.cache[key] = self._sweep(keyframes_only, max_height)
+        return self.cache[key]
+
+    def get_first_valid_frame(self, threshold=10, keyframes_only=False, max_height=None):
+        frames = self.get_frames(keyframes_only, max_height)
+        for frame in frames:
+            if frame.mean() > threshold:
+                return frame
+        return frames[0]
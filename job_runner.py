@@ -0,0 +1,320 @@
+# coding:utf-8
+
+import os
+import glob
+import json
+import shutil
+import tempfile
+import argparse
+import numpy as np
+from batch_executor import run_batch
+from frame_io import BACKENDS, batch_from_frame_func, transform_video
+from encoding_profiles import DEFAULT_PROFILE, PROFILE_NAMES, get_profile
+from mask_inpainter import INPAINT_METHODS, make_mask_func, report_inpaint_stats
+from mask_store import load_mask, load_mask_template, mask_exists
+from mask_aligner import fit_mask_to_video
+from brightness_profiler import get_brightness_profile
+from video_looper import loop_video_file
+from video_remuxer import can_remux, remux_video
+from video_prober import filter_valid_videos, get_video_info
+from run_manifest import RunManifest
+from video_common import ensure_directory_exists
+
+# 阶段名和各个脚本输出文件名的后缀一致
+STAGE_SUFFIXES = {
+    "skip": "_skip",
+    "darkness": "_bright",
+    "clip": "_clip",
+    "watermark": "_rmwtmk",
+    "resize": "_resized",
+    "speed": "_speed_{speed}x",
+    "silence": "_no_audio",
+    "loop": "_rec",
+}
+STAGES = tuple(STAGE_SUFFIXES)
+# 各阶段必须给出的参数，其余参数都有默认值
+STAGE_REQUIRED_KEYS = {
+    "clip": ("clip_roi",),
+    "watermark": ("watermark_mask",),
+    "resize": ("width", "height"),
+    "speed": ("speed",),
+    "loop": ("loop_duration",),
+}
+# 只改画面、音频或速度的阶段和循环的先后无关，写在 loop 后面也提前到循环之前，和前面的阶段一起编码
+LOOP_COMMUTING_STAGES = ("clip", "watermark", "resize", "speed", "silence")
+DEFAULT_BRIGHT_RATIO = 0.5
+
+def load_job_file(path):
+    # JSON 不需要额外依赖；YAML 需要安装 PyYAML
+    with open(path, "r", encoding="utf-8") as f:
+        if path.lower().endswith((".yaml", ".yml")):
+            try:
+                import yaml
+            except ImportError:
+                raise ImportError("YAML job files require PyYAML: pip install pyyaml")
+            return yaml.safe_load(f)
+        return json.load(f)
+
+def plan_passes(stages):
+    # 把有序的阶段列表拆成尽量少的几遍处理：每一遍最多解码、编码一次（跳过首尾、剪辑、去水印、缩放、变速、去声音
+    # 都在同一次 解码 -> 处理 -> 编码 中完成），之后可选地流复制循环。
+    # 循环之后还要跳过首尾或跳过暗场时才需要对循环后的视频再编码一遍
+    for stage in stages:
+        if stage not in STAGE_SUFFIXES:
+            raise ValueError(f"Unknown stage: {stage}, expected one of {', '.join(STAGES)}")
+    if len(set(stages)) != len(stages):
+        raise ValueError(f"Each stage can appear only once: {stages}")
+
+    passes = [{"stages": [], "loop": False, "speed_after_loop": False}]
+    for stage in stages:
+        current = passes[-1]
+        if stage == "loop":
+            current["loop"] = True
+        elif current["loop"] and stage not in LOOP_COMMUTING_STAGES:
+            passes.append({"stages": [stage], "loop": False, "speed_after_loop": False})
+        else:
+            current["stages"].append(stage)
+            if current["loop"] and stage == "speed":
+                # 先变速再循环时循环时长要换算，最终时长才和 loop_duration 一致
+                current["speed_after_loop"] = True
+    return passes
+
+def describe_plan(passes):
+    steps = []
+    for plan in passes:
+        if plan["stages"] == ["silence"]:
+            steps.append("drop audio by stream copy")
+        elif plan["stages"]:
+            steps.append(f"1 encode ({', '.join(plan['stages'])})")
+        if plan["loop"]:
+            steps.append("loop by stream copy")
+    return " + ".join(steps) or "nothing to do"
+
+def get_output_name(job, video_path):
+    name = job.get("name") or os.path.splitext(os.path.basename(video_path))[0]
+    return name + "".join(STAGE_SUFFIXES[stage].format(**job) for stage in job["stages"])
+
+def find_bright_start(video_path, start_time, end_time, frame_skip=10, bright_ratio=DEFAULT_BRIGHT_RATIO):
+    # 不交互时取处理范围内第一个亮度达到最亮采样帧 bright_ratio 的采样点作为起点
+    info = get_video_info(video_path)
+    profile = get_brightness_profile(video_path, frame_skip)
+    times = np.arange(len(profile)) * frame_skip / info["fps"]
+    in_range = (times >= start_time) & (times < (end_time if end_time is not None else info["duration"]))
+    if not in_range.any():
+        return start_time
+    threshold = profile[in_range].max() * bright_ratio
+    return float(times[np.argmax(in_range & (profile >= threshold))])
+
+def _as_rois(clip_roi):
+    # 一个 [x, y, w, h]，或者依次裁剪的多个区域（和 video_pipeline_multi_select.py 一样）
+    return [clip_roi] if isinstance(clip_roi[0], (int, float)) else list(clip_roi)
+
+def build_pass(job, video_path, stages):
+    import cv2
+
+    # 把一遍处理里的阶段换算成 源视频的时间范围 + 变速倍数 + 是否保留音频 + 逐块处理的函数链
+    info = get_video_info(video_path)
+    start_time, end_time = 0.0, info["duration"]
+    speed = 1.0
+    audio = True
+    frame_funcs = []
+    spatial = []
+    mask_funcs = []
+
+    for stage in stages:
+        if stage == "skip":
+            # 变速之后的跳过时间按变速后的时间轴理解，换算回源视频的时间
+            skip_start, skip_end = job.get("skip_start", 0) * speed, job.get("skip_end", 0) * speed
+            if skip_start + skip_end >= end_time - start_time:
+                raise ValueError(f"Skipping duration ({skip_start}s + {skip_end}s) is longer than or equal to video duration ({end_time - start_time}s)")
+            start_time, end_time = start_time + skip_start, end_time - skip_end
+            if job.get("max_duration") is not None:
+                end_time = min(end_time, start_time + job["max_duration"] * speed)
+        elif stage == "darkness":
+            if job.get("start_time") is not None:
+                start_time = max(start_time, job["start_time"])
+            else:
+                start_time = find_bright_start(video_path, start_time, end_time, job.get("frame_skip", 10), job.get("bright_ratio", DEFAULT_BRIGHT_RATIO))
+        elif stage == "clip":
+            for x, y, w, h in _as_rois(job["clip_roi"]):
+                frame_funcs.append(lambda frames, x=x, y=y, w=w, h=h: frames[:, y:y + h, x:x + w])
+            spatial.append(["clip", job["clip_roi"]])
+        elif stage == "watermark":
+            mask_func = make_mask_func_for_video(job, video_path, start_time, end_time, list(frame_funcs), list(spatial))
+            frame_funcs.append(mask_func.apply_batch)
+            mask_funcs.append(mask_func)
+        elif stage == "resize":
+            size = (job["width"], job["height"])
+            frame_funcs.append(batch_from_frame_func(lambda frame: cv2.resize(frame, size, interpolation=cv2.INTER_AREA)))
+            spatial.append(["resize", list(size)])
+        elif stage == "speed":
+            speed *= job["speed"]
+        elif stage == "silence":
+            audio = False
+
+    def batch_func(frames):
+        for frame_func in frame_funcs:
+            frames = frame_func(frames)
+        return frames
+
+    batch_func.mask_funcs = mask_funcs
+    end_time = None if end_time >= info["duration"] else end_time
+    return start_time, end_time, speed, audio, batch_func if frame_funcs else None
+
+def make_mask_func_for_video(job, video_path, start_time, end_time, previous_funcs, spatial):
+    # 遮罩定义在前面的剪辑、缩放之后的画面上；保存遮罩时带了模板就在这个视频上对齐
+    watermark_mask = load_mask(job["watermark_mask"])
+    mask_template = load_mask_template(job["watermark_mask"])
+
+    def clip_func(frame):
+        frames = frame[np.newaxis]
+        for frame_func in previous_funcs:
+            frames = frame_func(frames)
+        return frames[0]
+
+    watermark_mask = fit_mask_to_video(watermark_mask, mask_template, video_path, start_time, end_time, spatial, clip_func)
+    return make_mask_func(watermark_mask, method=job.get("inpaint_method", "ns"), reuse_tolerance=job.get("reuse_tolerance"))
+
+def run_pass(job, source_path, output_path, plan, threads=None):
+    # 一遍处理：需要时解码、编码一次，然后可选地流复制循环；返回这一遍写出的文件
+    profile = get_profile(job.get("profile"), source_path, threads)
+    backend = job.get("backend", "moviepy")
+    output_dir = os.path.dirname(os.path.abspath(output_path))
+    temp_path = None
+    # 循环只出现在第一趟，这一趟的输入就是原始视频；循环的输入可能是本趟写出的临时文件，统计表里按原始视频记录
+    input_path = source_path
+
+    try:
+        if plan["stages"]:
+            encoded_path = output_path
+            if plan["loop"]:
+                fd, temp_path = tempfile.mkstemp(suffix=".mp4", dir=output_dir)
+                os.close(fd)
+                encoded_path = temp_path
+            start_time, end_time, speed, audio, batch_func = build_pass(job, source_path, plan["stages"])
+            if batch_func is None and start_time == 0 and end_time is None and speed == 1 and not audio and can_remux(source_path, drop_audio=True):
+                # 只去声音时流复制
+                remux_video(source_path, encoded_path, drop_audio=True)
+            else:
+                transform_video(source_path, encoded_path, batch_func, backend, start_time, end_time, threads, audio=audio, profile=profile, speed=speed)
+            if batch_func is not None:
+                for mask_func in batch_func.mask_funcs:
+                    report_inpaint_stats(mask_func, os.path.basename(source_path))
+            source_path = encoded_path
+
+        if plan["loop"]:
+            loop_duration = job["loop_duration"]
+            if plan["speed_after_loop"]:
+                loop_duration /= job["speed"]
+            loop_video_file(source_path, output_path, loop_duration, threads, profile, source_video=input_path)
+    finally:
+        if temp_path is not None and os.path.exists(temp_path):
+            os.remove(temp_path)
+    return output_path
+
+def run_job(video_path, job=None, threads=None):
+    # 批处理的任务函数：job 是这个视频合并了默认值之后的完整参数
+    output_dir = job["output"]
+    ensure_directory_exists(output_dir)
+    output_path = os.path.join(output_dir, get_output_name(job, video_path) + ".mp4")
+    passes = plan_passes(job["stages"])
+    print(f"{os.path.basename(video_path)}: {describe_plan(passes)}")
+
+    source_path = video_path
+    temp_dirs = []
+    try:
+        for i, plan in enumerate(passes):
+            if i == len(passes) - 1:
+                pass_output = output_path
+            else:
+                # 中间结果放进单独的临时目录、沿用原文件名：探测缓存跟着目录一起删掉，统计表里也显示原视频名
+                temp_dir = tempfile.mkdtemp(dir=output_dir)
+                temp_dirs.append(temp_dir)
+                pass_output = os.path.join(temp_dir, os.path.splitext(os.path.basename(video_path))[0] + ".mp4")
+            if not plan["stages"] and not plan["loop"]:
+                # 没有任何阶段时只换封装
+                remux_video(source_path, pass_output)
+            else:
+                run_pass(job, source_path, pass_output, plan, threads)
+            source_path = pass_output
+    finally:
+        for temp_dir in temp_dirs:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+    print(f"Successfully processed {os.path.basename(video_path)} to {output_path}")
+    return output_path
+
+def expand_jobs(spec):
+    # 顶层除 jobs 以外的键是所有任务的默认值，每个任务可以覆盖；输入是目录时展开成目录下的每个视频
+    defaults = {key: value for key, value in spec.items() if key != "jobs"}
+    defaults.setdefault("backend", "moviepy")
+    defaults.setdefault("profile", DEFAULT_PROFILE)
+    video_paths, jobs = [], []
+    for index, entry in enumerate(spec.get("jobs", [])):
+        job = dict(defaults, **entry)
+        if "input" not in job or "output" not in job or "stages" not in job:
+            raise ValueError(f"Every job needs input, output and stages: {entry}")
+        plan_passes(job["stages"])
+        # 缺参数的任务在提交之前就报错，不要等到子进程里抛 KeyError、完成清单已经记成失败
+        for stage in job["stages"]:
+            for key in STAGE_REQUIRED_KEYS.get(stage, ()):
+                if job.get(key) is None:
+                    raise ValueError(f"Job {index + 1} ({job['input']}): stage '{stage}' needs '{key}'")
+        if "watermark" in job["stages"] and not mask_exists(job["watermark_mask"]):
+            raise ValueError(f"Job {index + 1} ({job['input']}): watermark mask not found: {job['watermark_mask']}")
+        if job["backend"] not in BACKENDS:
+            raise ValueError(f"Unknown frame backend: {job['backend']}")
+        if job["profile"] not in PROFILE_NAMES:
+            raise ValueError(f"Unknown encoding profile: {job['profile']}")
+        if job.get("inpaint_method", "ns") not in INPAINT_METHODS:
+            raise ValueError(f"Unknown inpaint method: {job['inpaint_method']}")
+
+        if os.path.isdir(job["input"]):
+            inputs = filter_valid_videos(glob.glob(os.path.join(job["input"], "*")))
+            if job.get("name"):
+                raise ValueError(f"A job with a directory input cannot set name: {entry}")
+        else:
+            inputs = filter_valid_videos([job["input"]])
+        for video_path in inputs:
+            video_paths.append(video_path)
+            jobs.append(job)
+    return video_paths, jobs
+
+'''
+python job_runner.py -i jobs.json --jobs 0
+'''
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a JSON or YAML job file: each job lists its inputs, ordered stages and per-video parameters, and every video is processed with as few decode/encode passes as possible.")
+    parser.add_argument("-i", "--input", default="jobs.json", help="Path to the job file (.json, or .yaml/.yml with PyYAML installed). Default is 'jobs.json'.")
+    parser.add_argument("--dry_run", action="store_true", help="Print the planned passes of every job without processing anything.")
+    parser.add_argument("--force", action="store_true", help="Process every job again, even if the manifest records it as completed with the same parameters.")
+    parser.add_argument("--jobs", type=int, default=1, help="Number of videos to process at the same time. Use 0 to pick from the CPU count and memory budget. Default is 1.")
+    parser.add_argument("--memory_budget", type=float, default=None, help="Memory budget in GB shared by all parallel jobs. Default is 75%% of the physical memory.")
+    parser.add_argument("--metrics", default=None, help="Append per-video throughput records (frames, fps, decode/transform/encode time) as JSON lines to this file.")
+    parser.add_argument("--metrics_prom", default=None, help="Write the throughput metrics of this run to a Prometheus textfile-collector file.")
+    args = parser.parse_args()
+
+    job_file = args.input
+    dry_run = args.dry_run
+    force = args.force
+    max_jobs = args.jobs
+    memory_budget = int(args.memory_budget * 1024 ** 3) if args.memory_budget else None
+    metrics_path = args.metrics
+    prom_path = args.metrics_prom
+
+    spec = load_job_file(job_file)
+    video_paths, jobs = expand_jobs(spec)
+    if not video_paths:
+        print(f"No valid video files found in {job_file}")
+        exit(1)
+
+    if dry_run:
+        for video_path, job in zip(video_paths, jobs):
+            print(f"{video_path} -> {os.path.join(job['output'], get_output_name(job, video_path))}.mp4: {describe_plan(plan_passes(job['stages']))}")
+        exit(0)
+
+    # 完成清单放在顶层的输出目录（没有时放在任务文件旁边），每个任务按自己的完整参数记录
+    manifest_dir = spec.get("output") or os.path.dirname(os.path.abspath(job_file))
+    ensure_directory_exists(manifest_dir)
+    manifest = RunManifest(manifest_dir, ["job_runner"], force)
+    run_batch(run_job, video_paths, (), max_jobs, memory_budget, metrics_path=metrics_path, prom_path=prom_path, manifest=manifest, job_kwargs=[{"job": job} for job in jobs], profile=[job["profile"] for job in jobs])
@@ -0,0 +1,148 @@
+# coding:utf-8
+
+import os
+import json
+import tempfile
+import numpy as np
+from frame_sampler import FrameSampler
+from mask_store import resize_mask
+from run_manifest import hash_params
+
+# 模板在遮罩外接框外多留的边距，边缘特征更完整
+TEMPLATE_MARGIN = 8
+# 在按分辨率换算出的比例附近再试这些倍数，台标大小和分辨率不完全成比例时也能找到
+SCALE_FACTORS = (0.8, 0.9, 1.0, 1.1, 1.25)
+# 细调比例时的初始步长和最小步长（相对值）
+REFINE_STEP = 0.05
+MIN_REFINE_STEP = 0.002
+# 匹配得分低于这个值时不信任匹配结果，退回按分辨率等比缩放遮罩
+MIN_MATCH_SCORE = 0.5
+ALIGN_SAMPLE_FRAMES = 5
+ALIGN_CACHE_DIR = ".mask_align_cache"
+
+def _median_gray(frames):
+    import cv2
+
+    # 采样帧逐像素取中位数：画面在变，水印不变，中位数上水印最清楚
+    return np.median(np.stack([cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) for frame in frames]), axis=0).astype(np.uint8)
+
+def _gradient(gray):
+    import cv2
+
+    # 用梯度幅值匹配，水印底下的画面颜色不同也不影响
+    gx = cv2.Sobel(gray, cv2.CV_32F, 1, 0, ksize=3)
+    gy = cv2.Sobel(gray, cv2.CV_32F, 0, 1, ksize=3)
+    return cv2.magnitude(gx, gy)
+
+def build_template(frames, mask):
+    # 模板是遮罩外接框（加边距）范围内采样帧的中位数灰度图，记录它在原视频里的位置和原视频的分辨率
+    ys, xs = np.nonzero(mask)
+    if len(xs) == 0:
+        return None
+    height, width = mask.shape
+    x0, y0 = max(0, xs.min() - TEMPLATE_MARGIN), max(0, ys.min() - TEMPLATE_MARGIN)
+    x1, y1 = min(width, xs.max() + 1 + TEMPLATE_MARGIN), min(height, ys.max() + 1 + TEMPLATE_MARGIN)
+    return {"image": _median_gray(frames)[y0:y1, x0:x1], "box": [int(x0), int(y0), int(x1 - x0), int(y1 - y0)], "resolution": [int(width), int(height)]}
+
+def _match_at_scale(target, template_image, scale):
+    import cv2
+
+    width = int(round(template_image.shape[1] * scale))
+    height = int(round(template_image.shape[0] * scale))
+    if width < 8 or height < 8 or width > target.shape[1] or height > target.shape[0]:
+        return -1.0, (0, 0)
+    scaled = _gradient(cv2.resize(template_image, (width, height), interpolation=cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR))
+    _, score, _, location = cv2.minMaxLoc(cv2.matchTemplate(target, scaled, cv2.TM_CCOEFF_NORMED))
+    return float(score), location
+
+def match_template(template, frames):
+    # 在几个采样帧的中位数图上多尺度匹配，返回 (得分, 缩放比例, 模板左上角位置)。
+    # 先在几个粗略的比例上找，再在最好的比例附近逐步缩小步长细调，模板很宽时比例差一点边缘就会偏开好几个像素
+    target = _gradient(_median_gray(frames))
+    template_image = template["image"]
+    base_scale = target.shape[1] / template["resolution"][0]
+    scales = sorted({round(base_scale * factor, 4) for factor in SCALE_FACTORS} | {float(factor) for factor in SCALE_FACTORS})
+
+    best = (-1.0, base_scale, (0, 0))
+    for scale in scales:
+        score, location = _match_at_scale(target, template_image, scale)
+        if score > best[0]:
+            best = (score, scale, location)
+
+    step = REFINE_STEP
+    while step >= MIN_REFINE_STEP:
+        improved = False
+        for scale in (best[1] * (1 - step), best[1] * (1 + step)):
+            score, location = _match_at_scale(target, template_image, scale)
+            if score > best[0]:
+                best = (score, scale, location)
+                improved = True
+        if not improved:
+            step /= 2
+    return best
+
+def place_mask(mask, template, size, scale, location):
+    # 把模板框里的遮罩按匹配到的比例缩放，贴到新视频里匹配到的位置
+    x, y, w, h = template["box"]
+    crop = mask[y:y + h, x:x + w]
+    crop = resize_mask(crop, (max(1, int(round(w * scale))), max(1, int(round(h * scale)))))
+    width, height = size
+    placed = np.zeros((height, width), dtype=np.uint8)
+    left, top = location
+    x0, y0 = max(0, left), max(0, top)
+    x1, y1 = min(width, left + crop.shape[1]), min(height, top + crop.shape[0])
+    if x1 > x0 and y1 > y0:
+        placed[y0:y1, x0:x1] = crop[y0 - top:y1 - top, x0 - left:x1 - left]
+    return placed
+
+def _get_cache_path(video_path, template, extra):
+    # 和亮度缓存一样放在视频目录下，文件名带上视频大小、修改时间、模板和剪辑参数
+    stat = os.stat(video_path)
+    cache_dir = os.path.join(os.path.dirname(os.path.abspath(video_path)), ALIGN_CACHE_DIR)
+    key = hash_params([template, extra])[:16]
+    return os.path.join(cache_dir, f"{os.path.basename(video_path)}.{stat.st_size}_{stat.st_mtime_ns}.{key}.json")
+
+def _load_match(cache_path):
+    try:
+        with open(cache_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _save_match(cache_path, match):
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(suffix=".json", dir=os.path.dirname(cache_path))
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(match, f)
+        os.replace(temp_path, cache_path)
+    except OSError as e:
+        print(f"Could not write mask alignment cache {cache_path}, Error: {e}")
+
+def fit_mask_to_video(mask, template, video_path, start_time=0, end_time=None, clip_roi=None, clip_func=None):
+    # 把遮罩变换到这个视频上：有模板时按匹配到的位置和比例放置，没有模板或匹配不可信时按分辨率等比缩放。
+    # clip_func 是流水线里的剪辑函数，遮罩定义在剪辑后的画面上；clip_roi 只用来区分缓存
+    sampler = FrameSampler(video_path, start_time, end_time, num_frames=ALIGN_SAMPLE_FRAMES)
+    width, height = sampler.size
+    if clip_func is not None:
+        clipped = clip_func(np.empty((height, width, 3), dtype=np.uint8))
+        height, width = clipped.shape[:2]
+    if template is None:
+        return resize_mask(mask, (width, height))
+
+    cache_path = _get_cache_path(video_path, template, [start_time, end_time, clip_roi])
+    match = _load_match(cache_path)
+    if match is None:
+        frames = sampler.get_frames()
+        if clip_func is not None:
+            frames = [clip_func(frame) for frame in frames]
+        score, scale, location = match_template(template, frames)
+        match = {"score": score, "scale": scale, "location": [int(location[0]), int(location[1])]}
+        _save_match(cache_path, match)
+
+    name = os.path.basename(video_path)
+    if match["score"] < MIN_MATCH_SCORE:
+        print(f"Watermark template match for {name} is weak ({match['score']:.2f}), scaling the mask to {width}x{height} instead")
+        return resize_mask(mask, (width, height))
+    print(f"Aligned watermark mask for {name}: scale {match['scale']:.3f}, offset {tuple(match['location'])}, score {match['score']:.2f}")
+    return place_mask(mask, template, (width, height), match["scale"], match["location"])
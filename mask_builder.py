@@ -0,0 +1,40 @@
+# coding:utf-8
+
+import numpy as np
+from mask_store import DEFAULT_KERNEL_SIZE, save_mask
+from mask_aligner import build_template
+
+def detect_watermark_adaptive(frame, roi):
+    import cv2
+
+    roi_frame = frame[roi[1]:roi[1] + roi[3], roi[0]:roi[0] + roi[2]]
+    gray_frame = cv2.cvtColor(roi_frame, cv2.COLOR_BGR2GRAY)
+    _, binary_frame = cv2.threshold(gray_frame, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+
+    mask = np.zeros_like(frame[:, :, 0], dtype=np.uint8)
+    mask[roi[1]:roi[1] + roi[3], roi[0]:roi[0] + roi[2]] = binary_frame
+
+    return mask
+
+def vote_watermark_mask(frames, rois, min_frame_count=7, kernel_size=DEFAULT_KERNEL_SIZE):
+    import cv2
+
+    # 每个区域在每个采样帧上分别二值化，多个区域的结果一起投票
+    masks = []
+    for roi in rois:
+        masks.extend([detect_watermark_adaptive(frame, roi) for frame in frames])
+
+    final_mask = sum((mask == 255).astype(np.uint8) for mask in masks)
+    # 根据像素点在至少min_frame_count张以上的帧中的出现来生成最终的遮罩
+    final_mask = np.where(final_mask >= min_frame_count, 255, 0).astype(np.uint8)
+
+    kernel = np.ones((kernel_size, kernel_size), np.uint8)
+    return cv2.dilate(final_mask, kernel)
+
+def build_watermark_mask(frames, rois, min_frame_count=7, save_name=None):
+    # 投票生成遮罩，同时生成水印模板（其他分辨率、位置不同的视频靠它对齐遮罩）；给了名字就一起存进遮罩库
+    watermark_mask = vote_watermark_mask(frames, rois, min_frame_count)
+    template = build_template(frames, watermark_mask)
+    if save_name is not None:
+        save_mask(save_name, watermark_mask, rois, len(frames), min_frame_count, DEFAULT_KERNEL_SIZE, template=template)
+    return watermark_mask, template
@@ -0,0 +1,246 @@
+# coding:utf-8
+
+import time
+import numpy as np
+
+# 复用上一次修复结果的最长帧数，超过后强制重新修复一次
+DEFAULT_REFRESH_INTERVAL = 30
+
+# ns/telea 每帧调用 OpenCV 重新修复；harmonic/biharmonic 对固定遮罩预先分解线性方程组，每帧只做回代
+INPAINT_METHODS = ("ns", "telea", "harmonic", "biharmonic")
+# cv2.INPAINT_NS、cv2.INPAINT_TELEA 的值，写成常量后导入本模块时不用加载 cv2
+OPENCV_METHODS = {"ns": 0, "telea": 1}
+
+def find_mask_regions(mask, padding=16):
+    import cv2
+
+    # 找出遮罩的连通域，每个连通域外扩 padding 像素作为修复区域
+    height, width = mask.shape[:2]
+    binary_mask = (mask > 0).astype(np.uint8)
+    num_labels, _, stats, _ = cv2.connectedComponentsWithStats(binary_mask, connectivity=8)
+
+    boxes = []
+    for label in range(1, num_labels):
+        x, y, w, h = stats[label, :4]
+        boxes.append([max(x - padding, 0), max(y - padding, 0), min(x + w + padding, width), min(y + h + padding, height)])
+
+    # 合并互相重叠的区域，避免同一块像素被修复两次
+    merged = True
+    while merged:
+        merged = False
+        result = []
+        for box in boxes:
+            for other in result:
+                if box[0] < other[2] and other[0] < box[2] and box[1] < other[3] and other[1] < box[3]:
+                    other[0], other[1] = min(other[0], box[0]), min(other[1], box[1])
+                    other[2], other[3] = max(other[2], box[2]), max(other[3], box[3])
+                    merged = True
+                    break
+            else:
+                result.append(box)
+        boxes = result
+
+    return [tuple(int(v) for v in box) for box in boxes]
+
+def inpaint_regions(frame, mask, regions, radius=3, method=OPENCV_METHODS["ns"]):
+    import cv2
+
+    # moviepy 读出的帧是只读的，需要先复制一份
+    if not frame.flags.writeable:
+        frame = frame.copy()
+
+    for x0, y0, x1, y1 in regions:
+        frame[y0:y1, x0:x1] = cv2.inpaint(frame[y0:y1, x0:x1], mask[y0:y1, x0:x1], radius, method)
+
+    return frame
+
+class OpenCVInpainter:
+    # cv2.inpaint 只能一帧一帧地修复，批处理时逐帧原地修改
+    def __init__(self, mask, regions, radius=3, method=OPENCV_METHODS["ns"]):
+        self.mask = mask
+        self.regions = regions
+        self.radius = radius
+        self.method = method
+
+    def __call__(self, frame):
+        return inpaint_regions(frame, self.mask, self.regions, self.radius, self.method)
+
+    def apply_batch(self, frames):
+        if not frames.flags.writeable:
+            frames = frames.copy()
+        for frame in frames:
+            inpaint_regions(frame, self.mask, self.regions, self.radius, self.method)
+        return frames
+
+def _build_laplacian(height, width):
+    # 区域内 4 邻域的图拉普拉斯矩阵，区域边缘的像素只和区域内的邻居相连
+    import scipy.sparse as sp
+
+    index = np.arange(height * width).reshape(height, width)
+    rows, cols = [], []
+    for a, b in ((index[:, :-1], index[:, 1:]), (index[:-1, :], index[1:, :])):
+        rows += [a.ravel(), b.ravel()]
+        cols += [b.ravel(), a.ravel()]
+    rows = np.concatenate(rows)
+    cols = np.concatenate(cols)
+    adjacency = sp.csr_matrix((np.ones(len(rows)), (rows, cols)), shape=(height * width, height * width))
+    degree = np.asarray(adjacency.sum(axis=1)).ravel()
+    return (sp.diags(degree) - adjacency).tocsr()
+
+class LinearInpainter:
+    # 遮罩在整批视频里不变，洞内像素满足 L x = 0（harmonic）或 L^2 x = 0（biharmonic），
+    # 洞内部分的系数矩阵只和遮罩有关，预先做一次稀疏 LU 分解；每帧只需把边界像素乘上耦合矩阵再回代，三个通道一起解
+    def __init__(self, mask, regions, order=1):
+        try:
+            from scipy.sparse.linalg import splu
+        except ImportError:
+            raise ImportError("The harmonic and biharmonic inpaint methods require scipy: pip install scipy")
+
+        self.regions = []
+        for x0, y0, x1, y1 in regions:
+            hole = mask[y0:y1, x0:x1] > 0
+            operator = _build_laplacian(y1 - y0, x1 - x0)
+            if order == 2:
+                operator = (operator @ operator).tocsr()
+
+            flat_hole = hole.ravel()
+            rows = operator[np.flatnonzero(flat_hole)]
+            hole_system = rows[:, flat_hole].tocsc()
+            coupling = rows[:, ~flat_hole].tocsc()
+            # 只保留和洞内像素有关联的已知像素，每帧只读取这一圈边界
+            used = np.flatnonzero(coupling.getnnz(axis=0))
+            boundary = np.zeros(hole.size, dtype=bool)
+            boundary[np.flatnonzero(~flat_hole)[used]] = True
+
+            self.regions.append({"box": (x0, y0, x1, y1), "hole": hole, "boundary": boundary.reshape(hole.shape),
+                                 "coupling": (-coupling[:, used]).tocsr(), "solver": splu(hole_system)})
+
+    def solve_region(self, index, view):
+        region = self.regions[index]
+        values = region["coupling"] @ view[region["boundary"]].astype(np.float64)
+        return np.clip(region["solver"].solve(values) + 0.5, 0, 255).astype(np.uint8)
+
+    def __call__(self, frame):
+        if not frame.flags.writeable:
+            frame = frame.copy()
+
+        for index, region in enumerate(self.regions):
+            x0, y0, x1, y1 = region["box"]
+            view = frame[y0:y1, x0:x1]
+            view[region["hole"]] = self.solve_region(index, view)
+
+        return frame
+
+    def apply_batch(self, frames):
+        # 整块帧的边界像素排成 (边界像素数, N*3) 的矩阵，一次乘法、一次回代解出所有帧所有通道
+        if not frames.flags.writeable:
+            frames = frames.copy()
+        count = len(frames)
+
+        for region in self.regions:
+            x0, y0, x1, y1 = region["box"]
+            view = frames[:, y0:y1, x0:x1]
+            boundary = view[:, region["boundary"]].transpose(1, 0, 2).reshape(-1, count * 3).astype(np.float64)
+            values = region["solver"].solve(region["coupling"] @ boundary)
+            patch = np.clip(values + 0.5, 0, 255).astype(np.uint8)
+            view[:, region["hole"]] = patch.reshape(-1, count, 3).transpose(1, 0, 2)
+
+        return frames
+
+class InpaintCache:
+    # 延时摄影里水印下面的画面几乎不变：每个修复区域记住上次修复时遮罩外圈的像素，
+    # 外圈变化不超过 tolerance 时直接复用上次修复出的像素，不再重新求解
+    def __init__(self, mask, regions, radius=3, method=OPENCV_METHODS["ns"], tolerance=2.0, refresh_interval=DEFAULT_REFRESH_INTERVAL, solver=None):
+        import cv2
+
+        self.radius = radius
+        self.method = method
+        self.solver = solver
+        self.tolerance = tolerance
+        self.refresh_interval = refresh_interval
+        self.hits = 0
+        self.misses = 0
+        self.solve_time = 0.0
+        self.compare_time = 0.0
+
+        kernel = np.ones((2 * radius + 3, 2 * radius + 3), np.uint8)
+        self.regions = []
+        for x0, y0, x1, y1 in regions:
+            region_mask = mask[y0:y1, x0:x1]
+            hole = region_mask > 0
+            ring = (cv2.dilate(hole.astype(np.uint8), kernel) > 0) & ~hole
+            self.regions.append({"box": (x0, y0, x1, y1), "mask": region_mask, "hole": hole, "ring": ring,
+                                 "ref_ring": None, "patch": None, "age": 0})
+
+    def __call__(self, frame):
+        if not frame.flags.writeable:
+            frame = frame.copy()
+
+        for index, region in enumerate(self.regions):
+            x0, y0, x1, y1 = region["box"]
+            view = frame[y0:y1, x0:x1]
+
+            start = time.perf_counter()
+            ring = view[region["ring"]].astype(np.int16)
+            reuse = (region["patch"] is not None and region["age"] < self.refresh_interval
+                     and np.abs(ring - region["ref_ring"]).mean() <= self.tolerance)
+            self.compare_time += time.perf_counter() - start
+
+            if reuse:
+                view[region["hole"]] = region["patch"]
+                region["age"] += 1
+                self.hits += 1
+                continue
+
+            start = time.perf_counter()
+            if self.solver is not None:
+                patch = self.solver.solve_region(index, view)
+            else:
+                import cv2
+
+                patch = cv2.inpaint(view, region["mask"], self.radius, self.method)[region["hole"]]
+            self.solve_time += time.perf_counter() - start
+            view[region["hole"]] = patch
+            region["patch"] = patch
+            region["ref_ring"] = ring
+            region["age"] = 0
+            self.misses += 1
+
+        return frame
+
+    def apply_batch(self, frames):
+        # 是否复用取决于上一帧的结果，块内仍按顺序逐帧处理
+        if not frames.flags.writeable:
+            frames = frames.copy()
+        for frame in frames:
+            self(frame)
+        return frames
+
+    def get_stats(self):
+        total = self.hits + self.misses
+        average_solve_time = self.solve_time / self.misses if self.misses else 0.0
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            # 命中的区域按平均求解时间估算省下的时间，再扣掉比较外圈像素的开销
+            "time_saved": self.hits * average_solve_time - self.compare_time,
+        }
+
+def report_inpaint_stats(mask_func, name=""):
+    if not isinstance(mask_func, InpaintCache):
+        return
+    stats = mask_func.get_stats()
+    print(f"Inpaint cache {name}: hit rate {stats['hit_rate']:.1%} ({stats['hits']}/{stats['hits'] + stats['misses']} regions), "
+          f"saved about {stats['time_saved']:.1f}s")
+
+def make_mask_func(mask, radius=3, method="ns", padding=16, reuse_tolerance=None, refresh_interval=DEFAULT_REFRESH_INTERVAL):
+    if method not in INPAINT_METHODS:
+        raise ValueError(f"Unknown inpaint method: {method}, expected one of {', '.join(INPAINT_METHODS)}")
+    regions = find_mask_regions(mask, padding)
+    solver = LinearInpainter(mask, regions, 2 if method == "biharmonic" else 1) if method not in OPENCV_METHODS else None
+    if reuse_tolerance is not None:
+        return InpaintCache(mask, regions, radius, OPENCV_METHODS.get(method), reuse_tolerance, refresh_interval, solver)
+    if solver is not None:
+        return solver
+    return OpenCVInpainter(mask, regions, radius, OPENCV_METHODS[method])
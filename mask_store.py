@@ -0,0 +1,104 @@
+# coding:utf-8
+
+import os
+import json
+import numpy as np
+
+DEFAULT_MASK_STORE = "masks"
+DEFAULT_KERNEL_SIZE = 5
+
+def get_mask_paths(name_or_path, store_dir=DEFAULT_MASK_STORE):
+    # 带扩展名或带目录的参数按路径处理，否则当作遮罩库里的名字
+    if name_or_path.lower().endswith(".png") or os.path.dirname(name_or_path):
+        png_path = name_or_path if name_or_path.lower().endswith(".png") else name_or_path + ".png"
+    else:
+        png_path = os.path.join(store_dir, name_or_path + ".png")
+    return png_path, os.path.splitext(png_path)[0] + ".json"
+
+def mask_exists(name_or_path, store_dir=DEFAULT_MASK_STORE):
+    return os.path.isfile(get_mask_paths(name_or_path, store_dir)[0])
+
+def get_template_path(png_path):
+    return os.path.splitext(png_path)[0] + ".template.png"
+
+def _write_png(path, image, description):
+    import cv2
+
+    # 用 imencode + tofile 写文件，中文路径在 Windows 下也能正常保存
+    ok, encoded = cv2.imencode(".png", image)
+    if not ok:
+        raise IOError(f"Could not encode {description}: {path}")
+    encoded.tofile(path)
+
+def save_mask(name_or_path, mask, rois, num_frames, min_frame_count, kernel_size=DEFAULT_KERNEL_SIZE, store_dir=DEFAULT_MASK_STORE, template=None):
+    png_path, json_path = get_mask_paths(name_or_path, store_dir)
+    directory = os.path.dirname(png_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    _write_png(png_path, mask, "watermark mask")
+
+    metadata = {
+        "resolution": [int(mask.shape[1]), int(mask.shape[0])],
+        "rois": [[int(v) for v in roi] for roi in rois],
+        "num_frames": num_frames,
+        "min_frame_count": min_frame_count,
+        "kernel_size": kernel_size,
+    }
+    if template is not None:
+        # 水印模板（采样帧中位数的灰度图）另存一张 PNG，用来在分辨率、位置不同的视频里找到水印
+        _write_png(get_template_path(png_path), template["image"], "watermark template")
+        metadata["template"] = {"box": template["box"], "resolution": template["resolution"]}
+    with open(json_path, "w", encoding="utf-8") as f:
+        json.dump(metadata, f, ensure_ascii=False, indent=2)
+
+    print(f"Saved watermark mask to {png_path}")
+    return png_path
+
+def load_mask_metadata(name_or_path, store_dir=DEFAULT_MASK_STORE):
+    json_path = get_mask_paths(name_or_path, store_dir)[1]
+    if not os.path.isfile(json_path):
+        return None
+    with open(json_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def resize_mask(mask, size):
+    import cv2
+
+    width, height = size
+    if mask.shape[1] == width and mask.shape[0] == height:
+        return mask
+    # 缩放后只要有覆盖就保留，宁可多修一点也不漏掉水印边缘
+    interpolation = cv2.INTER_AREA if width < mask.shape[1] else cv2.INTER_LINEAR
+    resized = cv2.resize(mask, (width, height), interpolation=interpolation)
+    return np.where(resized > 0, 255, 0).astype(np.uint8)
+
+def load_mask(name_or_path, size=None, store_dir=DEFAULT_MASK_STORE):
+    import cv2
+
+    png_path = get_mask_paths(name_or_path, store_dir)[0]
+    if not os.path.isfile(png_path):
+        raise FileNotFoundError(f"Watermark mask not found: {png_path}")
+
+    mask = cv2.imdecode(np.fromfile(png_path, dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+    if mask is None:
+        raise IOError(f"Could not read watermark mask: {png_path}")
+    mask = np.where(mask > 0, 255, 0).astype(np.uint8)
+
+    if size is not None and (mask.shape[1], mask.shape[0]) != tuple(size):
+        print(f"Rescaling watermark mask {png_path} from {mask.shape[1]}x{mask.shape[0]} to {size[0]}x{size[1]}")
+        mask = resize_mask(mask, size)
+    return mask
+
+def load_mask_template(name_or_path, store_dir=DEFAULT_MASK_STORE):
+    import cv2
+
+    # 以前保存的遮罩没有模板，返回 None，调用方按分辨率等比缩放
+    metadata = load_mask_metadata(name_or_path, store_dir)
+    template_path = get_template_path(get_mask_paths(name_or_path, store_dir)[0])
+    if metadata is None or "template" not in metadata or not os.path.isfile(template_path):
+        return None
+    image = cv2.imdecode(np.fromfile(template_path, dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+    if image is None:
+        raise IOError(f"Could not read watermark template: {template_path}")
+    return {"image": image, "box": metadata["template"]["box"], "resolution": metadata["template"]["resolution"]}
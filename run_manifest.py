@@ -0,0 +1,106 @@
+# coding:utf-8
+
+import os
+import json
+import time
+import hashlib
+import tempfile
+import numpy as np
+
+MANIFEST_FILE_NAME = ".batch_manifest.json"
+
+def _normalize(value):
+    # 把处理参数转成可以稳定序列化的形式，遮罩这类数组只记内容的摘要
+    if isinstance(value, np.ndarray):
+        return {"ndarray": hashlib.sha1(np.ascontiguousarray(value).tobytes()).hexdigest(), "shape": list(value.shape), "dtype": str(value.dtype)}
+    if isinstance(value, dict):
+        return {str(k): _normalize(v) for k, v in sorted(value.items(), key=lambda item: str(item[0]))}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(v) for v in value]
+    if isinstance(value, np.generic):
+        return value.item()
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    return repr(value)
+
+def hash_params(params):
+    return hashlib.sha1(json.dumps(_normalize(params), sort_keys=True).encode("utf8")).hexdigest()
+
+def input_identity(video_path):
+    # 文件名、大小、修改时间都没变就认为是同一个输入，不用读整个文件算哈希
+    stat = os.stat(video_path)
+    return {"name": os.path.basename(video_path), "size": stat.st_size, "mtime": stat.st_mtime_ns}
+
+def _output_sizes(outputs):
+    if outputs is None:
+        return {}
+    if isinstance(outputs, str):
+        outputs = [outputs]
+    return {os.path.abspath(path): os.path.getsize(path) for path in outputs if path is not None and os.path.isfile(path)}
+
+class RunManifest:
+    # 输出目录下的完成记录：每个输入按 输入身份 + 处理参数 的哈希记一条，
+    # 只在主进程里读写，每次更新都整体替换文件，中途被杀掉也不会留下写了一半的记录
+    def __init__(self, output_dir, params, force=False):
+        # force 时照常记录状态，但不跳过已完成的视频
+        self.path = os.path.join(output_dir, MANIFEST_FILE_NAME)
+        self.params_hash = hash_params(params)
+        self.force = force
+        self.entries = self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self):
+        directory = os.path.dirname(self.path)
+        try:
+            fd, temp_path = tempfile.mkstemp(prefix=MANIFEST_FILE_NAME, dir=directory)
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(self.entries, f, ensure_ascii=False, indent=1)
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            print(f"Could not write batch manifest in {directory}, Error: {e}")
+
+    def key(self, video_path, job_params=None):
+        # job_params 是这个视频自己的参数（同一个输入按不同参数处理多次时各记一条）
+        identity = json.dumps(input_identity(video_path), sort_keys=True)
+        params_hash = self.params_hash if job_params is None else f"{self.params_hash}:{hash_params(job_params)}"
+        return hashlib.sha1(f"{identity}:{params_hash}".encode("utf8")).hexdigest()
+
+    def is_complete(self, video_path, job_params=None):
+        # 记录为完成、且每个输出文件都还在并且大小没变才算完成；上次运行中断时状态停在 running，会重新处理
+        entry = self.entries.get(self.key(video_path, job_params))
+        if entry is None or entry["status"] != "done":
+            return False
+        return all(os.path.isfile(path) and os.path.getsize(path) == size for path, size in entry["outputs"].items())
+
+    def pending_indices(self, video_paths, job_params=None):
+        # 返回还需要处理的任务下标；job_params 和 video_paths 一一对应
+        job_params = job_params if job_params is not None else [None] * len(video_paths)
+        if self.force:
+            return list(range(len(video_paths)))
+        pending = [i for i, video_path in enumerate(video_paths) if not self.is_complete(video_path, job_params[i])]
+        if len(pending) < len(video_paths):
+            print(f"Skipping {len(video_paths) - len(pending)} videos already completed in {self.path}")
+        return pending
+
+    def pending(self, video_paths):
+        return [video_paths[i] for i in self.pending_indices(video_paths)]
+
+    def _update(self, video_path, status, job_params=None, **fields):
+        self.entries[self.key(video_path, job_params)] = dict({"input": os.path.abspath(video_path), "status": status,
+                                                   "params": self.params_hash, "time": time.strftime("%Y-%m-%dT%H:%M:%S"), "outputs": {}}, **fields)
+        self._save()
+
+    def mark_running(self, video_path, job_params=None):
+        self._update(video_path, "running", job_params)
+
+    def mark_done(self, video_path, outputs=None, job_params=None):
+        self._update(video_path, "done", job_params, outputs=_output_sizes(outputs))
+
+    def mark_failed(self, video_path, error, job_params=None):
+        self._update(video_path, "failed", job_params, error=str(error))
@@ -0,0 +1,115 @@
+# coding:utf-8
+
+import os
+import math
+import time
+import shutil
+import subprocess
+import numpy as np
+from multiprocessing import Pool, shared_memory
+from mask_inpainter import make_mask_func, report_inpaint_stats
+from frame_io import transform_video
+from encoding_profiles import get_profile
+from video_prober import get_ffmpeg_binary, get_video_info
+from stage_metrics import add_records, pop_records, record_pass
+from run_manifest import hash_params, input_identity
+
+_worker_mask = None
+_worker_shm = None
+
+def count_output_frames(duration, fps):
+    # 与 write_videofile 内部 np.arange(0, duration, 1 / fps) 的帧数保持一致
+    return len(np.arange(0, duration, 1.0 / fps))
+
+def split_frame_range(total_frames, workers, max_segment_frames=None):
+    # 至少分成 workers 段；给了 max_segment_frames 时每段不超过这么多帧，长视频中断后可以从完成的分段继续
+    count = workers
+    if max_segment_frames:
+        count = max(count, math.ceil(total_frames / max_segment_frames))
+    bounds = np.linspace(0, total_frames, count + 1).astype(int)
+    return [(int(start), int(end)) for start, end in zip(bounds[:-1], bounds[1:]) if end > start]
+
+def _init_worker(shm_name, shape, dtype):
+    global _worker_mask, _worker_shm
+    _worker_shm = shared_memory.SharedMemory(name=shm_name)
+    _worker_mask = np.ndarray(shape, dtype=dtype, buffer=_worker_shm.buf)
+
+def _process_segment(job):
+    video_path, segment_path, start_frame, end_frame, fps, backend, reuse_tolerance, inpaint_method, profile, threads = job
+    mask_func = make_mask_func(_worker_mask, method=inpaint_method, reuse_tolerance=reuse_tolerance)
+    # 先写到 .part 文件，编码完整结束后才改成正式的名字，正式名字存在就说明这一段已经完成
+    part_path = os.path.splitext(segment_path)[0] + ".part.mp4"
+    # 结束时间往前收半帧，保证每段恰好输出 end_frame - start_frame 帧
+    transform_video(video_path, part_path, mask_func.apply_batch, backend, start_frame / fps, (end_frame - 0.5) / fps, threads, audio=False, profile=profile)
+    os.replace(part_path, segment_path)
+    report_inpaint_stats(mask_func, os.path.basename(segment_path))
+    # 子进程里的统计记录随结果带回主进程
+    return segment_path, pop_records()
+
+def concat_segments(segment_paths, output_path, audio_source=None, duration=None):
+    list_path = os.path.splitext(output_path)[0] + "_segments.txt"
+    with open(list_path, "w", encoding="utf-8") as f:
+        for segment_path in segment_paths:
+            escaped_path = os.path.abspath(segment_path).replace("'", "'\\''")
+            f.write(f"file '{escaped_path}'\n")
+
+    cmd = [get_ffmpeg_binary(), "-y", "-loglevel", "error", "-f", "concat", "-safe", "0", "-i", list_path]
+    if audio_source is not None:
+        cmd += ["-i", audio_source, "-map", "0:v:0", "-map", "1:a:0?", "-c:a", "aac"]
+        if duration is not None:
+            cmd += ["-t", f"{duration:.6f}"]
+    cmd += ["-c:v", "copy", output_path]
+
+    try:
+        subprocess.run(cmd, check=True)
+    finally:
+        os.remove(list_path)
+
+def get_segment_dir(video_path, output_path, params):
+    # 分段目录由输入身份和处理参数决定，重新运行同样的任务会找到上次完成的分段
+    key = hash_params([input_identity(video_path), params])[:12]
+    return os.path.splitext(output_path)[0] + f"_segments_{key}"
+
+def process_video_segments(video_path, output_path, watermark_mask, workers, max_frames=None, backend="moviepy", reuse_tolerance=None, inpaint_method="ns", profile=None, max_segment_frames=None, threads=None):
+    # threads 是批处理分给这个视频的编码线程数，由各分段进程平分，不会每个分段都占满所有核
+    info = get_video_info(video_path)
+    fps, duration = info["fps"], info["duration"]
+    if max_frames is not None:
+        duration = min(duration, max_frames / fps)
+
+    total_frames = count_output_frames(duration, fps)
+    segments = split_frame_range(total_frames, workers, max_segment_frames)
+
+    # 遮罩只通过共享内存传一次，各进程直接映射使用
+    shm = shared_memory.SharedMemory(create=True, size=watermark_mask.nbytes)
+    shared_mask = np.ndarray(watermark_mask.shape, dtype=watermark_mask.dtype, buffer=shm.buf)
+    shared_mask[:] = watermark_mask
+
+    # 分段目录按配置名而不是测速结果区分，auto 重新测速选了别的预设也能接着用已完成的分段
+    segment_dir = get_segment_dir(video_path, output_path, [segments, backend, reuse_tolerance, inpaint_method, profile, watermark_mask])
+    os.makedirs(segment_dir, exist_ok=True)
+    segment_paths = [os.path.join(segment_dir, f"segment_{i:04d}.mp4") for i in range(len(segments))]
+    pending = sum(1 for segment_path in segment_paths if not os.path.isfile(segment_path))
+    segment_threads = max(1, (threads or os.cpu_count() or 1) // max(1, min(workers, pending)))
+    # auto 配置在这里按每个分段的线程数测一次速，所有分段用同一个预设编码
+    profile = get_profile(profile, video_path, segment_threads)
+    jobs = [(video_path, segment_path, start, end, fps, backend, reuse_tolerance, inpaint_method, profile, segment_threads)
+            for segment_path, (start, end) in zip(segment_paths, segments) if not os.path.isfile(segment_path)]
+    if len(jobs) < len(segments):
+        print(f"Resuming {os.path.basename(video_path)}: {len(segments) - len(jobs)} of {len(segments)} segments already finished")
+
+    try:
+        if jobs:
+            with Pool(min(workers, len(jobs)), initializer=_init_worker, initargs=(shm.name, watermark_mask.shape, watermark_mask.dtype)) as pool:
+                for _, records in pool.imap_unordered(_process_segment, jobs):
+                    add_records(records)
+    finally:
+        del shared_mask
+        shm.close()
+        shm.unlink()
+
+    start = time.perf_counter()
+    concat_segments(segment_paths, output_path, audio_source=video_path, duration=total_frames / fps)
+    record_pass("concat", video_path, output_path, total_frames, start)
+    # 只有拼接成功后才删除分段，中途失败时保留已完成的分段供下次继续
+    shutil.rmtree(segment_dir, ignore_errors=True)
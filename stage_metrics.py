@@ -0,0 +1,161 @@
+# coding:utf-8
+
+import os
+import json
+import time
+import tempfile
+import numpy as np
+
+# 当前进程里已经完成、还没被批处理取走的记录；子进程的记录随任务的返回值带回主进程
+_records = []
+
+class VideoMetrics:
+    # 一次 解码 -> 处理 -> 编码 的耗时统计。管道后端下解码、编码在 ffmpeg 进程里并行进行，
+    # 这里记的是主进程等待解码输出和等待编码器接收数据的时间，也就是它们拖慢处理的部分
+    def __init__(self, kind, input_path, output_path, backend=None):
+        self.kind = kind
+        self.input_path = input_path
+        self.output_path = output_path
+        self.backend = backend
+        self.start = time.perf_counter()
+        self.frames = 0
+        self.raw_bytes = 0
+        self.max_block_frames = 0
+        self.totals = {"decode": 0.0, "transform": 0.0, "encode": 0.0}
+        self.per_frame = {"decode": [], "transform": [], "encode": []}
+
+    def add_block(self, frames, decode=None, transform=None, encode=None, raw_bytes=0):
+        # 一块帧的各阶段耗时，同时按帧平均记下来，用来算每帧耗时的分位数；None 表示这个阶段没有单独计时
+        self.frames += frames
+        self.raw_bytes += raw_bytes
+        self.max_block_frames = max(self.max_block_frames, frames)
+        for phase, seconds in (("decode", decode), ("transform", transform), ("encode", encode)):
+            if seconds is None:
+                continue
+            self.totals[phase] += seconds
+            if frames:
+                self.per_frame[phase].append(seconds / frames)
+
+    def add_time(self, phase, seconds):
+        self.totals[phase] += seconds
+
+    def finish(self, remainder_phase=None):
+        # remainder_phase：无法单独计时的部分（比如 moviepy 内部的编码）记为总耗时减去其他阶段
+        wall_time = time.perf_counter() - self.start
+        if remainder_phase is not None:
+            self.totals[remainder_phase] = max(0.0, wall_time - sum(v for k, v in self.totals.items() if k != remainder_phase))
+
+        record = {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "kind": self.kind,
+            "input": self.input_path,
+            "output": self.output_path,
+            "backend": self.backend,
+            "frames": self.frames,
+            "wall_s": wall_time,
+            "fps": self.frames / wall_time if wall_time > 0 else 0.0,
+            "raw_bytes": self.raw_bytes,
+            "output_bytes": os.path.getsize(self.output_path) if self.output_path and os.path.isfile(self.output_path) else None,
+            "block_frames": self.max_block_frames,
+        }
+        for phase, seconds in self.totals.items():
+            record[f"{phase}_s"] = seconds
+            samples = self.per_frame[phase]
+            record[f"{phase}_ms_per_frame"] = seconds / self.frames * 1000 if self.frames else None
+            record[f"{phase}_ms_p95"] = float(np.percentile(samples, 95)) * 1000 if samples else None
+        _records.append(record)
+        return record
+
+def record_pass(kind, input_path, output_path, frames=0, start=None, backend=None):
+    # 流复制、moviepy 整体写文件这类无法逐帧计时的步骤，只记总耗时，全部算作编码
+    metrics = VideoMetrics(kind, input_path, output_path, backend)
+    if start is not None:
+        metrics.start = start
+    metrics.frames = frames
+    return metrics.finish("encode")
+
+def add_records(records):
+    _records.extend(records)
+
+def pop_records():
+    records = list(_records)
+    del _records[:]
+    return records
+
+def write_jsonl(path, records):
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    with open(path, "a", encoding="utf-8") as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+def _escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _prometheus_labels(record):
+    # 分段模式、一次输出多个版本时同一个视频有多条记录，不同目录下也可能有同名视频：
+    # 标签带上输入、输出的完整路径，node_exporter 遇到重复的序列会拒收整个文件
+    output = os.path.abspath(record["output"]) if record["output"] else ""
+    return (f'video="{_escape_label(os.path.basename(record["input"]))}",input="{_escape_label(os.path.abspath(record["input"]))}",'
+            f'output="{_escape_label(output)}",kind="{_escape_label(record["kind"])}"')
+
+def _merge_prometheus_records(records):
+    # 标签完全相同的记录（比如同一批里重复处理同一个输出）合并成一条：耗时、帧数、字节数相加，帧率按合并后的值重算
+    merged = {}
+    for record in records:
+        labels = _prometheus_labels(record)
+        if labels not in merged:
+            merged[labels] = dict(record)
+            continue
+        total = merged[labels]
+        for key in ("frames", "wall_s", "raw_bytes", "decode_s", "transform_s", "encode_s"):
+            total[key] += record[key]
+        total["fps"] = total["frames"] / total["wall_s"] if total["wall_s"] > 0 else 0.0
+        if record["output_bytes"] is not None:
+            total["output_bytes"] = record["output_bytes"]
+    return merged
+
+def write_prometheus(path, records):
+    # node_exporter textfile 格式，先写临时文件再替换，采集时不会读到一半
+    merged = _merge_prometheus_records(records)
+    lines = [
+        "# HELP watermark_stage_seconds Time spent per processing phase.",
+        "# TYPE watermark_stage_seconds gauge",
+    ]
+    for labels, record in merged.items():
+        for phase in ("decode", "transform", "encode"):
+            lines.append(f'watermark_stage_seconds{{{labels},phase="{phase}"}} {record[f"{phase}_s"]:.6f}')
+    for name, key, help_text in (("watermark_stage_frames", "frames", "Frames written."),
+                                 ("watermark_stage_fps", "fps", "Frames per second over the whole pass."),
+                                 ("watermark_stage_raw_bytes", "raw_bytes", "Raw frame bytes sent to the encoder."),
+                                 ("watermark_stage_output_bytes", "output_bytes", "Size of the output file.")):
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge"]
+        for labels, record in merged.items():
+            if record[key] is None:
+                continue
+            lines.append(f"{name}{{{labels}}} {record[key]}")
+
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(suffix=".prom", dir=directory)
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+    os.replace(temp_path, path)
+
+def print_summary(records):
+    if not records:
+        return
+    print(f"\n{'video':<32}{'pass':<10}{'frames':>7}{'fps':>8}{'wall s':>9}{'decode':>9}{'transform':>11}{'encode':>9}{'queue':>7}")
+    for record in records:
+        wall = record["wall_s"] or 1e-9
+        shares = [f"{record[f'{phase}_s'] / wall:.0%}" for phase in ("decode", "transform", "encode")]
+        queue = record.get("queue_depth")
+        print(f"{os.path.basename(record['input'])[:31]:<32}{record['kind']:<10}{record['frames']:>7}{record['fps']:>8.1f}{record['wall_s']:>9.2f}"
+              f"{shares[0]:>9}{shares[1]:>11}{shares[2]:>9}{'-' if queue is None else queue:>7}")
+
+def report_metrics(records, metrics_path=None, prom_path=None):
+    print_summary(records)
+    if metrics_path:
+        write_jsonl(metrics_path, records)
+    if prom_path:
+        write_prometheus(prom_path, records)
@@ -1,71 +1,58 @@
-import cv2
 import os
-from moviepy.editor import VideoFileClip
 import argparse
-
-def ensure_directory_exists(directory):
-    if not os.path.exists(directory):
-        try:
-            os.makedirs(directory)
-            print(f"Created directory: {directory}")
-        except OSError as error:
-            print(f"Error creating directory {directory}: {error}")
-            raise
-
-def get_first_valid_frame(video_clip, threshold=10, num_frames=10):
-    total_frames = int(video_clip.fps * video_clip.duration)
-    frame_indices = [int(i * total_frames / num_frames) for i in range(num_frames)]
-
-    for idx in frame_indices:
-        frame = video_clip.get_frame(idx / video_clip.fps)
-        if frame.mean() > threshold:
-            return frame
-
-    return video_clip.get_frame(0)
-
-def select_roi_for_clipping(video_clip):
-    frame = get_first_valid_frame(video_clip)
-
-    # 将视频帧调整为720p显示
-    display_height = 720
-    scale_factor = display_height / frame.shape[0]
-    display_width = int(frame.shape[1] * scale_factor)
-    display_frame = cv2.resize(frame, (display_width, display_height))
-
-    instructions = "Select ROI for clipping and press SPACE or ENTER"
-    font = cv2.FONT_HERSHEY_SIMPLEX
-    cv2.putText(display_frame, instructions, (10, 30), font, 1, (255, 255, 255), 2, cv2.LINE_AA)
-
-    r = cv2.selectROI(display_frame)
-    cv2.destroyAllWindows()
-
-    r_original = (int(r[0] / scale_factor), int(r[1] / scale_factor), int(r[2] / scale_factor), int(r[3] / scale_factor))
-
-    return r_original
-
-def clip_video(video_clip, roi, output_path, max_frames=None):
-    def clip_frame(frame):
-        return frame[roi[1]:roi[1] + roi[3], roi[0]:roi[0] + roi[2]]
-
+from batch_executor import run_batch
+from frame_io import BACKENDS, transform_video
+from encoding_profiles import DEFAULT_PROFILE, PROFILE_NAMES
+from video_prober import get_video_info
+from frame_sampler import FrameSampler
+from video_common import ensure_directory_exists, select_roi
+
+def select_roi_for_clipping(video_path):
+    # 选剪辑区域不需要全分辨率，只解码缩小到显示尺寸的关键帧
+    sampler = FrameSampler(video_path)
+    frame = sampler.get_first_valid_frame(keyframes_only=True, max_height=720)
+    return select_roi(frame, "Select ROI for clipping and press SPACE or ENTER", sampler.size[1])
+
+def clip_video(video_file, roi, output_path, max_frames=None, threads=None, backend="moviepy", profile=None):
+    # 整块 (N, H, W, 3) 的帧一次切片，不复制数据
+    def clip_frames(frames):
+        return frames[:, roi[1]:roi[1] + roi[3], roi[0]:roi[0] + roi[2]]
+
+    end_time = None
     if max_frames is not None:
-        video_clip = video_clip.subclip(0, min(video_clip.duration, max_frames / video_clip.fps))
+        info = get_video_info(video_file)
+        end_time = min(info["duration"], max_frames / info["fps"])
 
-    clipped_video = video_clip.fl_image(clip_frame)
-    try:
-        clipped_video.write_videofile(output_path, codec="libx264")
-    except:
-        print("clipped_video write error")
+    # 写入失败时异常交给批处理记录，不再吞掉
+    transform_video(video_file, output_path, clip_frames, backend, 0, end_time, threads, profile=profile)
+
+def clip_video_file(video_file, output_dir, clip_roi, max_frames=None, backend="moviepy", profile=None, threads=None):
+    clipped_video_path = os.path.join(output_dir, f"{os.path.splitext(os.path.basename(video_file))[0]}_clip.mp4")
+    clip_video(video_file, clip_roi, clipped_video_path, max_frames, threads, backend, profile)
+    print(f"Successfully clipped {video_file} to {clipped_video_path}")
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Clip a video based on a selected region of interest (ROI).")
     parser.add_argument("-i", "--input", default="video", help="Path to the input video file or directory containing videos. Default is 'video'.")
     parser.add_argument("-o", "--output", default=None, help="Path to the output directory. If not provided, it will be generated as input_path + '_clip'.")
     parser.add_argument("-f", "--frames", type=int, default=None, help="Number of frames to clip. If not provided, the entire video will be processed.")
+    parser.add_argument("--jobs", type=int, default=1, help="Number of videos to process at the same time. Use 0 to pick from the CPU count and memory budget. Default is 1.")
+    parser.add_argument("--memory_budget", type=float, default=None, help="Memory budget in GB shared by all parallel jobs. Default is 75%% of the physical memory.")
+    parser.add_argument("--profile", choices=PROFILE_NAMES, default=DEFAULT_PROFILE, help="Encoding profile: 'fast' for intermediate files, 'archival', 'delivery' (moviepy's previous defaults), or 'auto' to benchmark a few seconds of the input and pick the slowest preset that still encodes in real time. Default is 'delivery'.")
+    parser.add_argument("--metrics", default=None, help="Append per-video throughput records (frames, fps, decode/transform/encode time) as JSON lines to this file.")
+    parser.add_argument("--metrics_prom", default=None, help="Write the throughput metrics of this run to a Prometheus textfile-collector file.")
+    parser.add_argument("--backend", choices=BACKENDS, default="moviepy", help="Frame reader/writer backend. 'ffmpeg' pipes raw frames into reused buffers, 'opencv' reads with cv2.VideoCapture. Default is 'moviepy'.")
     args = parser.parse_args()
 
     input_path = args.input
     output_dir = args.output
     max_frames = args.frames
+    backend = args.backend
+    max_jobs = args.jobs
+    memory_budget = int(args.memory_budget * 1024 ** 3) if args.memory_budget else None
+    profile = args.profile
+    metrics_path = args.metrics
+    prom_path = args.metrics_prom
 
     # 如果未提供 output_dir，则根据 input_path 生成
     if output_dir is None:
@@ -87,18 +74,11 @@ if __name__ == "__main__":
         print(f"Invalid input path: {input_path}")
         exit(1)
 
-    # 初始化默认的 clip_roi
-    default_clip_roi = None
-
-    for video_file in video_files:
-        video_clip = VideoFileClip(video_file)
-
-        # 如果还没有默认的 clip_roi，则选择一个
-        if default_clip_roi is None:
-            default_clip_roi = select_roi_for_clipping(video_clip)
+    if not video_files:
+        print(f"No video files found in {input_path}")
+        exit(1)
 
-        # 使用默认的 clip_roi 进行裁剪
-        clipped_video_path = os.path.join(output_dir, f"{os.path.splitext(os.path.basename(video_file))[0]}_clip.mp4")
-        clip_video(video_clip, default_clip_roi, clipped_video_path, max_frames)
+    # 在第一个视频上选定默认的 clip_roi，所有视频都使用它进行裁剪
+    default_clip_roi = select_roi_for_clipping(video_files[0])
 
-        print(f"Successfully clipped {video_file} to {clipped_video_path}")
+    run_batch(clip_video_file, video_files, (output_dir, default_clip_roi, max_frames, backend, profile), max_jobs, memory_budget, metrics_path=metrics_path, prom_path=prom_path, profile=profile)
@@ -0,0 +1,92 @@
+# coding:utf-8
+
+import os
+from video_prober import get_video_info
+
+# 各个脚本共用的小函数。这里只依赖标准库和 video_prober，cv2 在用到的函数里才导入，
+# 只跳过首尾、去声音这类脚本启动时不用加载它；时长、帧率都从缓存的头信息里读取，不打开视频
+
+def ensure_directory_exists(directory):
+    if not os.path.exists(directory):
+        try:
+            os.makedirs(directory)
+            print(f"Created directory: {directory}")
+        except OSError as error:
+            print(f"Error creating directory {directory}: {error}")
+            raise
+
+def is_valid_video_file(file):
+    # 只读取头信息，结果按路径、大小和修改时间缓存在目录下的索引文件里
+    if get_video_info(file) is None:
+        print(f"Invalid video file: {file}")
+        return False
+    return True
+
+def _show_for_selection(frame, instructions, source_height=None):
+    import cv2
+
+    # 将视频帧调整为720p显示
+    display_height = 720
+    scale_factor = display_height / frame.shape[0]
+    display_width = int(frame.shape[1] * scale_factor)
+    display_frame = cv2.resize(frame, (display_width, display_height))
+    if source_height is not None:
+        # 低分辨率采样的帧要按原视频的高度换算回原始坐标
+        scale_factor = display_height / source_height
+
+    font = cv2.FONT_HERSHEY_SIMPLEX
+    cv2.putText(display_frame, instructions, (10, 30), font, 1, (255, 255, 255), 2, cv2.LINE_AA)
+    return display_frame, scale_factor
+
+def select_roi(frame, instructions, source_height=None):
+    import cv2
+
+    display_frame, scale_factor = _show_for_selection(frame, instructions, source_height)
+    r = cv2.selectROI(display_frame)
+    cv2.destroyAllWindows()
+
+    r_original = (int(r[0] / scale_factor), int(r[1] / scale_factor), int(r[2] / scale_factor), int(r[3] / scale_factor))
+
+    return r_original
+
+def select_rois(frame, instructions, source_height=None):
+    # 连续框选多个区域，空选择结束
+    import cv2
+
+    display_frame, scale_factor = _show_for_selection(frame, instructions, source_height)
+    rois = []
+    while True:
+        r = cv2.selectROI("Select ROI", display_frame)
+        if r == (0, 0, 0, 0):  # 如果用户按下c键，退出选择
+            break
+        rois.append(r)
+        cv2.rectangle(display_frame, (r[0], r[1]), (r[0] + r[2], r[1] + r[3]), (0, 255, 0), 2)
+        cv2.imshow("Select ROI", display_frame)
+        key = cv2.waitKey(1) & 0xFF
+        if key == ord('c'):  # 如果用户按下 'c' 键，取消选择
+            rois = []
+            break
+
+    cv2.destroyAllWindows()
+
+    rois_original = [(int(r[0] / scale_factor), int(r[1] / scale_factor), int(r[2] / scale_factor), int(r[3] / scale_factor)) for r in rois]
+
+    return rois_original
+
+def get_time_range(video, skip_start=0, skip_end=0, max_duration=None, max_frames=None):
+    # 时长和帧率从缓存的头信息里读取，不打开视频：先跳过首尾，再限制最长长度
+    info = get_video_info(video)
+    total_duration = info["duration"]
+    start_time, end_time = 0, None
+    if skip_start > 0 or skip_end > 0 or max_duration is not None:
+        if skip_start + skip_end >= total_duration:
+            print(f"Skipping duration ({skip_start}s + {skip_end}s) is longer than or equal to video duration ({total_duration}s). Skipping entire video.")
+            return None
+        start_time, end_time = skip_start, total_duration - skip_end
+        if max_duration is not None and end_time - start_time > max_duration:
+            end_time = start_time + max_duration
+
+    if max_frames is not None:
+        end_time = min(end_time if end_time is not None else total_duration, start_time + max_frames / info["fps"])
+
+    return start_time, end_time
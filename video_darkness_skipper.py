@@ -1,76 +1,30 @@
 # coding:utf-8
 
-import cv2
 import os
-import numpy as np
-from moviepy.editor import VideoFileClip
 import argparse
-from tqdm import tqdm
-
-def ensure_directory_exists(directory):
-    if not os.path.exists(directory):
-        try:
-            os.makedirs(directory)
-            print(f"Created directory: {directory}")
-        except OSError as error:
-            print(f"Error creating directory {directory}: {error}")
-            raise
-
-def is_valid_video_file(file):
-    try:
-        with VideoFileClip(file) as video_clip:
-            return True
-    except Exception as e:
-        print(f"Invalid video file: {file}, Error: {e}")
-        return False
-
-def calculate_brightness(frame):
-    gray_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-    return np.mean(gray_frame)
-
-def select_bright_frames(video_clip, top_k=10, time_window=10, frame_skip=10, take_one_step = 50):
-    assert take_one_step > 0
-    assert type(take_one_step) == type(0)
-    total_frames = int(video_clip.fps * video_clip.duration)
-    total_duration = video_clip.duration
-    window_size = total_duration / time_window
-
-    bright_frames = []
-
-    print("start time_window")
-    for window in tqdm(range(time_window)):
-        start_time = window * window_size
-        end_time = (window + 1) * window_size
-
-        window_frames = []
-        for i in tqdm(range(int(start_time * video_clip.fps), int(end_time * video_clip.fps), frame_skip)):
-            if i % take_one_step == 0:
-                frame = video_clip.get_frame(i / video_clip.fps)
-                brightness = calculate_brightness(frame)
-                window_frames.append((i, brightness))
-        if not window_frames:
-            for i in tqdm(range(int(start_time * video_clip.fps), int(end_time * video_clip.fps), frame_skip)):
-                if i % 1 == 0:
-                    frame = video_clip.get_frame(i / video_clip.fps)
-                    brightness = calculate_brightness(frame)
-                    window_frames.append((i, brightness))
-
-        # 选择当前时间窗口内最明亮的帧
-        window_frames.sort(key=lambda x: x[1], reverse=True)
-        if window_frames:
-            bright_frames.append(window_frames[0])
-
-    # 选择前 top_k 个明亮帧
-    bright_frames.sort(key=lambda x: x[1], reverse=True)
-    top_bright_frames = bright_frames[:top_k]
-    top_bright_frames.sort(key=lambda x: x[0])  # 按帧索引排序
-
-    return top_bright_frames
-
-def interactive_frame_selection(video_clip, bright_frames):
+from frame_io import BACKENDS, transform_video
+from encoding_profiles import DEFAULT_PROFILE, PROFILE_NAMES
+from batch_executor import run_batch, run_interactive_batch
+from brightness_profiler import get_brightness_profile, select_bright_frames
+from frame_sampler import FrameSampler
+from video_prober import filter_valid_videos, get_video_info
+from video_common import ensure_directory_exists, is_valid_video_file
+
+def interactive_frame_selection(video_path, bright_frames):
+    import cv2
+
+    if not bright_frames:
+        return None
+
+    # 候选帧在一个 ffmpeg 进程里按顺序一次解码，直接缩小到显示尺寸
+    fps = get_video_info(video_path)["fps"]
+    sampler = FrameSampler(video_path, times=[frame_idx / fps for frame_idx, _ in bright_frames])
+    # 按时间点取帧，解码不到的候选帧（比如在文件尾部之后）直接跳过，不会错配成别的帧
+    frame_map = sampler.get_frame_map(max_height=720)
     for idx, (frame_idx, _) in enumerate(bright_frames):
-        frame = video_clip.get_frame(frame_idx / video_clip.fps)
-        frame = cv2.cvtColor(frame, cv2.COLOR_RGB2BGR)
+        if frame_idx / fps not in frame_map:
+            continue
+        frame = cv2.cvtColor(frame_map[frame_idx / fps], cv2.COLOR_RGB2BGR)
 
         # 将视频帧调整为720p显示
         display_height = 720
@@ -87,7 +41,7 @@ def interactive_frame_selection(video_clip, bright_frames):
 
         if key == ord('s'):
             cv2.destroyAllWindows()
-            return frame_idx / video_clip.fps
+            return frame_idx / fps
         elif key == ord('q'):
             cv2.destroyAllWindows()
             return None
@@ -95,54 +49,70 @@ def interactive_frame_selection(video_clip, bright_frames):
     cv2.destroyAllWindows()
     return None
 
-def process_video(video_clip, output_path, start_time):
+def process_video(video_path, output_path, start_time, backend="moviepy", profile=None, threads=None):
     if start_time is not None:
-        clipped_video = video_clip.subclip(start_time)
-        try:
-            clipped_video.write_videofile(f"{output_path}.mp4", codec="libx264")
-        except:
-            print("clipped_video write error")
+        # 写入失败时异常交给批处理记录，不再吞掉
+        transform_video(video_path, f"{output_path}.mp4", None, backend, start_time, None, threads, profile=profile)
     else:
         print("No frame selected.")
 
-def calculate_bright_frames_for_all_videos(input_path, top_k, time_window, frame_skip):
+def process_video_file(video_path, output_dir, start_time, backend="moviepy", profile=None, threads=None):
+    video_name = os.path.basename(video_path)
+    output_video_path = os.path.join(output_dir, os.path.splitext(video_name)[0])
+    process_video(video_path, output_video_path, start_time, backend, profile, threads)
+    print(f"Successfully processed {video_name}")
+
+def calculate_bright_frames_for_all_videos(input_path, top_k, time_window, frame_skip, workers=None):
+    from tqdm import tqdm
+
     bright_frames_dict = {}
 
     if os.path.isfile(input_path):
         videos = [input_path] if is_valid_video_file(input_path) else []
     elif os.path.isdir(input_path):
-        videos = [f for f in os.listdir(input_path) if is_valid_video_file(os.path.join(input_path, f))]
+        videos = [os.path.basename(f) for f in filter_valid_videos([os.path.join(input_path, f) for f in os.listdir(input_path)])]
     else:
         print(f"Invalid input path: {input_path}")
         exit(1)
 
     for video in tqdm(videos, desc="Calculating bright frames"):
-        video_clip = VideoFileClip(os.path.join(input_path, video))
-        bright_frames = select_bright_frames(video_clip, top_k, time_window, frame_skip)
-        bright_frames_dict[video] = bright_frames
+        video_path = os.path.join(input_path, video)
+        info = get_video_info(video_path)
+        # 亮度曲线按文件和采样间隔缓存成 .npy，只调整 top_k 或 time_window 重跑时不需要再解码
+        profile = get_brightness_profile(video_path, frame_skip, workers)
+        bright_frames_dict[video] = select_bright_frames(profile, info["fps"], info["duration"], frame_skip, top_k, time_window)
 
     return bright_frames_dict
 
 def select_start_times(input_path, bright_frames_dict):
+    from tqdm import tqdm
+
     start_times_dict = {}
 
     for video, bright_frames in tqdm(bright_frames_dict.items(), desc="Selecting start times"):
-        video_clip = VideoFileClip(os.path.join(input_path, video))
-        start_time = interactive_frame_selection(video_clip, bright_frames)
+        start_time = interactive_frame_selection(os.path.join(input_path, video), bright_frames)
         start_times_dict[video] = start_time
 
     return start_times_dict
 
-def process_selected_frames(input_path, output_dir, start_times_dict):
+def process_selected_frames(input_path, output_dir, start_times_dict, backend="moviepy", profile=None, metrics_path=None, prom_path=None):
     ensure_directory_exists(output_dir)
 
-    for video, start_time in tqdm(start_times_dict.items(), desc="Processing videos"):
-        video_clip = VideoFileClip(os.path.join(input_path, video))
-        video_name = os.path.basename(video)
-        output_video_path = os.path.join(output_dir, os.path.splitext(video_name)[0])
+    # 每个视频的起始时间作为它自己的参数，某个视频写入失败时只记录错误，其余视频继续处理
+    video_paths = [os.path.join(input_path, video) for video in start_times_dict]
+    job_kwargs = [{"start_time": start_time, "backend": backend, "profile": profile} for start_time in start_times_dict.values()]
+    run_batch(process_video_file, video_paths, (output_dir,), metrics_path=metrics_path, prom_path=prom_path, job_kwargs=job_kwargs, profile=profile)
 
-        process_video(video_clip, output_video_path, start_time)
-        print(f"Successfully processed {video_name}")
+def select_and_process_in_background(input_path, output_dir, bright_frames_dict, backend="moviepy", max_jobs=1, memory_budget=None, profile=None, metrics_path=None, prom_path=None):
+    # 选取和处理重叠进行：每个视频选好起始帧后立即在后台编码，操作者接着选下一个视频
+    ensure_directory_exists(output_dir)
+
+    def select_video(video_path):
+        start_time = interactive_frame_selection(video_path, bright_frames_dict[os.path.basename(video_path)])
+        return {"start_time": start_time} if start_time is not None else None
+
+    video_paths = [os.path.join(input_path, video) for video in bright_frames_dict]
+    run_interactive_batch(select_video, process_video_file, video_paths, {"output_dir": output_dir, "backend": backend, "profile": profile}, max_jobs, memory_budget, metrics_path=metrics_path, prom_path=prom_path, profile=profile)
 
 '''
 python video_darkness_skipper.py -i .\【原神延时摄影】全图27个钓鱼点白天黑夜风景全赏析_skip_3个  -k 10 -w 10 -s 10
@@ -155,6 +125,14 @@ if __name__ == "__main__":
     parser.add_argument("-k", "--top_k", type=int, default=10, help="Number of top bright frames to select from. Default is 10.")
     parser.add_argument("-w", "--time_window", type=int, default=10, help="Number of time windows to divide the video into. Default is 10.")
     parser.add_argument("-s", "--frame_skip", type=int, default=10, help="Number of frames to skip when calculating brightness. Default is 10.")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="Number of ffmpeg processes that scan time windows of one video in parallel. Default is the CPU count.")
+    parser.add_argument("--two_phase", action="store_true", help="Start encoding each video in the background as soon as its start frame is selected, instead of after all selections.")
+    parser.add_argument("--jobs", type=int, default=1, help="Number of videos to encode at the same time in two-phase mode. Use 0 to pick from the CPU count and memory budget. Default is 1.")
+    parser.add_argument("--memory_budget", type=float, default=None, help="Memory budget in GB shared by all parallel jobs. Default is 75%% of the physical memory.")
+    parser.add_argument("--profile", choices=PROFILE_NAMES, default=DEFAULT_PROFILE, help="Encoding profile: 'fast' for intermediate files, 'archival', 'delivery' (moviepy's previous defaults), or 'auto' to benchmark a few seconds of the input and pick the slowest preset that still encodes in real time. Default is 'delivery'.")
+    parser.add_argument("--metrics", default=None, help="Append per-video throughput records (frames, fps, decode/transform/encode time) as JSON lines to this file.")
+    parser.add_argument("--metrics_prom", default=None, help="Write the throughput metrics of this run to a Prometheus textfile-collector file.")
+    parser.add_argument("--backend", choices=BACKENDS, default="moviepy", help="Frame reader/writer backend. 'ffmpeg' pipes raw frames into reused buffers, 'opencv' reads with cv2.VideoCapture. Default is 'moviepy'.")
     args = parser.parse_args()
 
     input_path = args.input
@@ -162,6 +140,14 @@ if __name__ == "__main__":
     top_k = args.top_k
     time_window = args.time_window
     frame_skip = args.frame_skip
+    backend = args.backend
+    workers = args.workers
+    two_phase = args.two_phase
+    max_jobs = args.jobs
+    memory_budget = int(args.memory_budget * 1024 ** 3) if args.memory_budget else None
+    encoding_profile = args.profile
+    metrics_path = args.metrics
+    prom_path = args.metrics_prom
 
     if output_dir is None:
         if os.path.isfile(input_path):
@@ -173,6 +159,9 @@ if __name__ == "__main__":
             exit(1)
 
     #### 三个”集中“： 集中计算 集中选取 集中处理
-    bright_frames_dict = calculate_bright_frames_for_all_videos(input_path, top_k, time_window, frame_skip)
-    start_times_dict = select_start_times(input_path, bright_frames_dict)
-    process_selected_frames(input_path, output_dir, start_times_dict)
+    bright_frames_dict = calculate_bright_frames_for_all_videos(input_path, top_k, time_window, frame_skip, workers)
+    if two_phase:
+        select_and_process_in_background(input_path, output_dir, bright_frames_dict, backend, max_jobs, memory_budget, encoding_profile, metrics_path, prom_path)
+    else:
+        start_times_dict = select_start_times(input_path, bright_frames_dict)
+        process_selected_frames(input_path, output_dir, start_times_dict, backend, encoding_profile, metrics_path, prom_path)
@@ -0,0 +1,102 @@
+# coding:utf-8
+
+import os
+import argparse
+from batch_executor import DEFAULT_BUFFER_DEPTH, run_batch
+from frame_io import BACKENDS, fan_out_video
+from encoding_profiles import DEFAULT_PROFILE, PROFILE_NAMES
+from video_prober import filter_valid_videos
+from run_manifest import RunManifest
+from video_common import ensure_directory_exists, is_valid_video_file
+
+def parse_sizes(text):
+    # "640x480,1280x720" -> [(640, 480), (1280, 720)]
+    sizes = []
+    for item in text.split(","):
+        width, height = (int(v) for v in item.lower().split("x"))
+        if width <= 0 or height <= 0:
+            raise ValueError(f"Invalid size: {item}")
+        sizes.append((width, height))
+    return sizes
+
+def parse_speeds(text):
+    speeds = [float(v) for v in text.split(",")]
+    if any(speed <= 0 for speed in speeds):
+        raise ValueError(f"Invalid speeds: {text}")
+    return speeds
+
+def get_variant_name(video_name, size=None, speed=1.0):
+    # 尺寸写成 _宽x高，变速和 video_speedchanger.py 一样写成 _speed_倍数x，保持原样的部分不加后缀
+    name = os.path.splitext(video_name)[0]
+    if size is not None:
+        name += f"_{size[0]}x{size[1]}"
+    if speed != 1:
+        name += f"_speed_{speed}x"
+    return f"{name}.mp4"
+
+def process_video_file(video_path, output_dir, sizes, speeds, backend="ffmpeg", profile=None, threads=None):
+    video_name = os.path.basename(video_path)
+    variants = [(os.path.join(output_dir, get_variant_name(video_name, size, speed)), size, speed) for size in sizes for speed in speeds]
+    fan_out_video(video_path, variants, backend, threads=threads, profile=profile)
+    print(f"Successfully processed {video_name} into {len(variants)} variants")
+    return [output_path for output_path, _, _ in variants]
+
+'''
+python video_fanout.py -i .\原神风景视频（去水印）拣选后_少量文件 --sizes 640x480,1280x720,2560x1080
+python video_fanout.py -i .\原神变速测试 --speeds 0.75,0.95,1.25
+'''
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Decode every video once and write several resized and/or speed-changed variants of it in parallel.")
+    parser.add_argument("-i", "--input", default="video", help="Path to the input video file or directory containing videos. Default is 'video'.")
+    parser.add_argument("-o", "--output", default=None, help="Path to the output directory. If not provided, it will be generated as input_path + '_variants'.")
+    parser.add_argument("--sizes", default=None, help="Comma separated output sizes such as '640x480,1280x720,2560x1080'. Frames are resized with cv2.resize (INTER_AREA). If not provided, the original size is kept.")
+    parser.add_argument("--speeds", default="1", help="Comma separated speed factors such as '0.75,0.95,1.25'. Every size is written at every speed. Default is 1 (no change).")
+    parser.add_argument("--force", action="store_true", help="Process every video again, even if the manifest in the output directory records it as completed with the same parameters.")
+    parser.add_argument("--jobs", type=int, default=1, help="Number of videos to process at the same time. Use 0 to pick from the CPU count and memory budget. Default is 1.")
+    parser.add_argument("--memory_budget", type=float, default=None, help="Memory budget in GB shared by all parallel jobs. Default is 75%% of the physical memory.")
+    parser.add_argument("--profile", choices=PROFILE_NAMES, default=DEFAULT_PROFILE, help="Encoding profile: 'fast' for intermediate files, 'archival', 'delivery' (moviepy's previous defaults), or 'auto' to benchmark a few seconds of the input and pick the slowest preset that still encodes in real time. Default is 'delivery'.")
+    parser.add_argument("--metrics", default=None, help="Append per-video throughput records (frames, fps, decode/transform/encode time) as JSON lines to this file.")
+    parser.add_argument("--metrics_prom", default=None, help="Write the throughput metrics of this run to a Prometheus textfile-collector file.")
+    parser.add_argument("--backend", choices=BACKENDS, default="ffmpeg", help="Frame reader backend. The variants are always written through ffmpeg pipes. Default is 'ffmpeg'.")
+    args = parser.parse_args()
+
+    input_path = args.input
+    output_dir = args.output
+    try:
+        sizes = parse_sizes(args.sizes) if args.sizes else [None]
+        speeds = parse_speeds(args.speeds)
+    except ValueError as e:
+        parser.error(str(e))
+    force = args.force
+    backend = args.backend
+    max_jobs = args.jobs
+    memory_budget = int(args.memory_budget * 1024 ** 3) if args.memory_budget else None
+    profile = args.profile
+    metrics_path = args.metrics
+    prom_path = args.metrics_prom
+
+    # 如果未提供 output_dir，则根据 input_path 生成
+    if output_dir is None:
+        if os.path.isfile(input_path):
+            output_dir = os.path.splitext(input_path)[0] + "_variants"
+        elif os.path.isdir(input_path):
+            output_dir = input_path + "_variants"
+        else:
+            print(f"Invalid input path: {input_path}")
+            exit(1)
+
+    ensure_directory_exists(output_dir)
+
+    if os.path.isfile(input_path):
+        videos = [input_path] if is_valid_video_file(input_path) else []
+    elif os.path.isdir(input_path):
+        videos = filter_valid_videos([os.path.join(input_path, f) for f in os.listdir(input_path)])
+    else:
+        print(f"Invalid input path: {input_path}")
+        exit(1)
+
+    # 每个输出都有自己的编码器和 lookahead，估算内存时按输出个数放大每个任务驻留的帧数
+    buffer_depth = DEFAULT_BUFFER_DEPTH * len(sizes) * len(speeds)
+    manifest = RunManifest(output_dir, ["video_fanout", sizes, speeds, backend, profile], force)
+    run_batch(process_video_file, videos, (output_dir, sizes, speeds, backend, profile), max_jobs, memory_budget, buffer_depth, metrics_path=metrics_path, prom_path=prom_path, manifest=manifest, profile=profile)
@@ -0,0 +1,91 @@
+# coding:utf-8
+
+import os
+import math
+import itertools
+import time
+import subprocess
+import tempfile
+from video_remuxer import can_remux
+from video_prober import get_ffmpeg_binary, probe_video
+from encoding_profiles import get_profile, moviepy_write_kwargs
+from stage_metrics import record_pass
+
+def read_video_packet_pts(video_path):
+    # 流复制到 framecrc 只读取数据包、不解码，每个视频包按解码顺序输出一行（流、dts、pts、时长、大小、校验），
+    # 行数就是视频流的精确帧数
+    cmd = [get_ffmpeg_binary(), "-loglevel", "error", "-i", video_path, "-map", "0:v:0", "-c", "copy", "-f", "framecrc", "-"]
+    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    lines = [line for line in result.stdout.decode("utf8", errors="ignore").splitlines() if line and not line.startswith("#")]
+    return [int(line.split(",")[2]) for line in lines]
+
+def find_copy_cut(packet_pts, count):
+    # 流复制只能按解码顺序截掉后面的包，有 B 帧时截在中间会丢掉显示顺序更早的帧、在结尾留下空档；
+    # 从 count 往前找第一个位置，使前 k 个包正好是显示顺序的前 k 帧
+    prefix_max = list(itertools.accumulate(packet_pts, max))
+    suffix_min = list(itertools.accumulate(reversed(packet_pts), min))[::-1]
+    for k in range(min(count, len(packet_pts)), 0, -1):
+        if k == len(packet_pts) or prefix_max[k - 1] < suffix_min[k]:
+            return k
+    return count
+
+def write_concat_list(list_path, video_path, repeat, duration):
+    escaped_path = os.path.abspath(video_path).replace("'", "'\\''")
+    with open(list_path, "w", encoding="utf-8") as f:
+        for _ in range(repeat):
+            f.write(f"file '{escaped_path}'\n")
+            # 每段的时长固定为视频流时长，避免音频尾部的填充在接缝处累积成偏移
+            f.write(f"duration {duration:.6f}\n")
+
+def loop_video_file(input_path, output_path, loop_duration, threads=None, profile=None, source_video=None):
+    # input_path 是上一步写出的临时文件时，source_video 传原始视频，统计表里按原始视频记录
+    source_video = source_video or input_path
+    output_dir = os.path.dirname(os.path.abspath(output_path))
+    temp_paths = []
+
+    try:
+        source_path = input_path
+        info = probe_video(input_path)
+        if not can_remux(input_path, info=info):
+            # 不能直接放进 mp4 的源只编码这一次，之后全部流复制
+            fd, source_path = tempfile.mkstemp(suffix=".mp4", dir=output_dir)
+            os.close(fd)
+            temp_paths.append(source_path)
+            from moviepy.video.io.VideoFileClip import VideoFileClip
+
+            with VideoFileClip(input_path) as video_clip:
+                profile = get_profile(profile, input_path, threads)
+                start = time.perf_counter()
+                video_clip.write_videofile(source_path, logger=None, **moviepy_write_kwargs(profile, video_clip.fps, threads))
+                record_pass("encode", source_video, source_path, round(video_clip.duration * video_clip.fps), start, "moviepy")
+
+            info = probe_video(source_path)
+
+        fps = info["fps"]
+        packet_pts = read_video_packet_pts(source_path)
+        frame_count = len(packet_pts) or info["frame_count"]
+        source_duration = frame_count / fps
+
+        # 整段重复若干次，最后不足一段的部分在流复制时按帧数截断，截断点前移到不会留下空档的位置
+        repeat = max(1, math.ceil(loop_duration / source_duration))
+        target_frames = round(loop_duration * fps)
+        if packet_pts:
+            last_frames = target_frames - (repeat - 1) * frame_count
+            target_frames = (repeat - 1) * frame_count + find_copy_cut(packet_pts, last_frames)
+        fd, list_path = tempfile.mkstemp(suffix=".txt", dir=output_dir)
+        os.close(fd)
+        temp_paths.append(list_path)
+        write_concat_list(list_path, source_path, repeat, source_duration)
+
+        # 带 AAC 前导填充的源开头时间戳为负，concat 会把第一段的视频整体后移，-avoid_negative_ts 也不能移回来；
+        # -copyts 保留源里的时间戳，视频从 0 开始，按 -frames:v 正好截出目标帧数
+        cmd = [get_ffmpeg_binary(), "-y", "-loglevel", "error", "-copyts", "-f", "concat", "-safe", "0", "-i", list_path,
+               "-map", "0:v:0", "-map", "0:a?", "-c:v", "copy", "-c:a", "aac",
+               "-frames:v", str(target_frames), "-t", f"{target_frames / fps:.6f}", "-movflags", "+faststart", output_path]
+        start = time.perf_counter()
+        subprocess.run(cmd, check=True)
+        record_pass("loop", source_video, output_path, target_frames, start)
+    finally:
+        for temp_path in temp_paths:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
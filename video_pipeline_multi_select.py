@@ -1,201 +1,239 @@
 # coding:utf-8
 
-import cv2
 import os
-import numpy as np
-from moviepy.editor import VideoFileClip, concatenate_videoclips
 import argparse
-from tqdm import tqdm
-
-def ensure_directory_exists(directory):
-    if not os.path.exists(directory):
-        try:
-            os.makedirs(directory)
-            print(f"Created directory: {directory}")
-        except OSError as error:
-            print(f"Error creating directory {directory}: {error}")
-            raise
-
-def is_valid_video_file(file):
-    try:
-        with VideoFileClip(file) as video_clip:
-            return True
-    except Exception as e:
-        print(f"Invalid video file: {file}, Error: {e}")
-        return False
-
-def get_first_valid_frame(video_clip, threshold=10, num_frames=10):
-    total_frames = int(video_clip.fps * video_clip.duration)
-    frame_indices = [int(i * total_frames / num_frames) for i in range(num_frames)]
-
-    for idx in frame_indices:
-        frame = video_clip.get_frame(idx / video_clip.fps)
-        if frame.mean() > threshold:
-            return frame
-
-    return video_clip.get_frame(0)
-
-def select_roi(frame, instructions):
-    # 将视频帧调整为720p显示
-    display_height = 720
-    scale_factor = display_height / frame.shape[0]
-    display_width = int(frame.shape[1] * scale_factor)
-    display_frame = cv2.resize(frame, (display_width, display_height))
-
-    font = cv2.FONT_HERSHEY_SIMPLEX
-    cv2.putText(display_frame, instructions, (10, 30), font, 1, (255, 255, 255), 2, cv2.LINE_AA)
-
-    rois = []
-    while True:
-        r = cv2.selectROI("Select ROI", display_frame)
-        if r == (0, 0, 0, 0):  # 如果用户按下c键，退出选择
-            break
-        rois.append(r)
-        cv2.rectangle(display_frame, (r[0], r[1]), (r[0] + r[2], r[1] + r[3]), (0, 255, 0), 2)
-        cv2.imshow("Select ROI", display_frame)
-        key = cv2.waitKey(1) & 0xFF
-        if key == ord('c'):  # 如果用户按下 'c' 键，取消选择
-            rois = []
-            break
-
-    cv2.destroyAllWindows()
-
-    rois_original = [(int(r[0] / scale_factor), int(r[1] / scale_factor), int(r[2] / scale_factor), int(r[3] / scale_factor)) for r in rois]
-
-    return rois_original
-
-def skip_and_limit_video(video_clip, skip_start, skip_end, max_duration):
-    total_duration = video_clip.duration
-
-    if skip_start + skip_end >= total_duration:
-        print(f"Skipping duration ({skip_start}s + {skip_end}s) is longer than or equal to video duration ({total_duration}s). Skipping entire video.")
-        return None
-
-    end_time = total_duration - skip_end
-    skipped_clip = video_clip.subclip(skip_start, end_time)
-
-    if skipped_clip.duration > max_duration:
-        skipped_clip = skipped_clip.subclip(0, max_duration)
-
-    return skipped_clip
-
-def clip_video(video_clip, rois, max_frames=None):
+import tempfile
+from mask_inpainter import INPAINT_METHODS, make_mask_func, report_inpaint_stats
+from frame_sampler import FrameSampler
+from mask_store import load_mask, load_mask_template, resize_mask
+from mask_aligner import fit_mask_to_video
+from mask_builder import build_watermark_mask
+from watermark_locator import DEFAULT_MIN_CONFIDENCE, find_watermark_rois
+from batch_executor import run_batch, run_interactive_batch
+from run_manifest import RunManifest
+from video_looper import loop_video_file
+from frame_io import BACKENDS, transform_video
+from encoding_profiles import DEFAULT_PROFILE, PROFILE_NAMES, get_profile
+from video_prober import filter_valid_videos
+from video_common import ensure_directory_exists, get_time_range, is_valid_video_file, select_rois
+
+def make_clip_func(rois):
+    # 用 ... 切片，单帧 (H, W, 3) 和整块 (N, H, W, 3) 都能直接裁剪，不复制数据
     def clip_frame(frame):
         for roi in rois:
-            frame = frame[roi[1]:roi[1] + roi[3], roi[0]:roi[0] + roi[2]]
+            frame = frame[..., roi[1]:roi[1] + roi[3], roi[0]:roi[0] + roi[2], :]
         return frame
 
-    if max_frames is not None:
-        video_clip = video_clip.subclip(0, min(video_clip.duration, max_frames / video_clip.fps))
-
-    clipped_video = video_clip.fl_image(clip_frame)
-    return clipped_video
-
-def detect_watermark_adaptive(frame, roi):
-    roi_frame = frame[roi[1]:roi[1] + roi[3], roi[0]:roi[0] + roi[2]]
-    gray_frame = cv2.cvtColor(roi_frame, cv2.COLOR_BGR2GRAY)
-    _, binary_frame = cv2.threshold(gray_frame, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-
-    mask = np.zeros_like(frame[:, :, 0], dtype=np.uint8)
-    mask[roi[1]:roi[1] + roi[3], roi[0]:roi[0] + roi[2]] = binary_frame
-
-    return mask
-
-def generate_watermark_mask(video_clip, num_frames=10, min_frame_count=7):
-    total_frames = int(video_clip.duration * video_clip.fps)
-    frame_indices = [int(i * total_frames / num_frames) for i in range(num_frames)]
-
-    frames = [video_clip.get_frame(idx / video_clip.fps) for idx in frame_indices]
-    rois = select_roi(frames[0], "Select ROI for watermark and press SPACE or ENTER. Press 'c' to finish.")
-
-    masks = []
-    for roi in rois:
-        masks.extend([detect_watermark_adaptive(frame, roi) for frame in frames])
-
-    final_mask = sum((mask == 255).astype(np.uint8) for mask in masks)
-    final_mask = np.where(final_mask >= min_frame_count, 255, 0).astype(np.uint8)
-
-    kernel = np.ones((5, 5), np.uint8)
-    return cv2.dilate(final_mask, kernel)
-
-def process_video(video_clip, output_path, apply_mask_func, max_frames=None):
-    total_frames = int(video_clip.duration * video_clip.fps)
-    progress_bar = tqdm(total=total_frames, desc="Processing Frames", unit="frames")
+    return clip_frame
+
+def generate_watermark_mask(sampler, clip_roi=None, min_frame_count=7, save_name=None, detect=False, detect_confidence=DEFAULT_MIN_CONFIDENCE):
+    frames = sampler.get_frames()
+    if clip_roi is not None:
+        clip_func = make_clip_func(clip_roi)
+        frames = [clip_func(frame) for frame in frames]
+    rois = find_watermark_rois(frames, detect_confidence) if detect else None
+    if rois is None:
+        rois = select_rois(frames[0], "Select ROI for watermark and press SPACE or ENTER. Press 'c' to finish.")
+    # 模板取自剪辑后的帧，和遮罩在同一个坐标系里
+    return build_watermark_mask(frames, rois, min_frame_count, save_name)
+
+def make_batch_func(clip_roi=None, watermark_mask=None, reuse_tolerance=None, inpaint_method="ns"):
+    # 剪辑和去水印合成一个按块处理的函数，整个流程只解码、编码一次
+    clip_func = make_clip_func(clip_roi) if clip_roi is not None else None
+    if clip_func is None and watermark_mask is None:
+        return None
+    mask_funcs = {}
 
-    if max_frames is not None:
-        video_clip = video_clip.subclip(0, min(video_clip.duration, max_frames / video_clip.fps))
+    def batch_func(frames):
+        if clip_func is not None:
+            frames = clip_func(frames)
+        if watermark_mask is not None:
+            size = (frames.shape[2], frames.shape[1])
+            if size not in mask_funcs:
+                # 从遮罩库读取的遮罩分辨率可能和当前视频不同，按帧的尺寸缩放一次
+                mask_funcs[size] = make_mask_func(resize_mask(watermark_mask, size), method=inpaint_method, reuse_tolerance=reuse_tolerance)
+            frames = mask_funcs[size].apply_batch(frames)
+        return frames
+
+    batch_func.mask_funcs = mask_funcs
+    return batch_func
+
+def report_batch_func_stats(batch_func, name):
+    if batch_func is not None:
+        for mask_func in batch_func.mask_funcs.values():
+            report_inpaint_stats(mask_func, name)
+
+def prepare_pipeline_selections(videos, skip_start=0, skip_end=0, max_duration=None, clip_roi=None, max_frames=None, watermark_mask=None, save_mask_name=None, detect_confidence=DEFAULT_MIN_CONFIDENCE):
+    # 交互式的选择只在主进程里做一次，在第一个可用的视频上选定后所有视频共用；
+    # 最后一个返回值是生成遮罩的视频，遮罩本来就在它的坐标系里，处理它时不需要对齐
+    mask_template = None
+    if isinstance(watermark_mask, str) and watermark_mask not in ("auto", "detect"):
+        # 按名字或路径从遮罩库读取，不需要界面也不需要采样
+        mask_template = load_mask_template(watermark_mask)
+        watermark_mask = load_mask(watermark_mask)
+    need_clip_roi = isinstance(clip_roi, str) and clip_roi == "auto"
+    need_watermark_mask = isinstance(watermark_mask, str) and watermark_mask in ("auto", "detect")
+    if not need_clip_roi and not need_watermark_mask:
+        return clip_roi, watermark_mask, mask_template, None
 
-    def process_frame(frame):
-        result = apply_mask_func(frame)
-        progress_bar.update(1)
-        return result
+    for video in videos:
+        time_range = get_time_range(video, skip_start, skip_end, max_duration, max_frames)
+        if time_range is None:
+            continue
+        # 处理范围内的采样帧只解码一次，剪辑区域选择、有效帧判断和遮罩投票共用
+        sampler = FrameSampler(video, *time_range)
+
+        if need_clip_roi:
+            if need_watermark_mask:
+                frame = sampler.get_first_valid_frame()
+            else:
+                # 只选剪辑区域时不需要全分辨率，只解码缩小到显示尺寸的关键帧
+                frame = sampler.get_first_valid_frame(keyframes_only=True, max_height=720)
+            clip_roi = select_rois(frame, "Select ROI for clipping and press SPACE or ENTER. Press 'c' to finish.", sampler.size[1])
+
+        if need_watermark_mask:
+            watermark_mask, mask_template = generate_watermark_mask(sampler, clip_roi, save_name=save_mask_name, detect=watermark_mask == "detect", detect_confidence=detect_confidence)
+            return clip_roi, watermark_mask, mask_template, video
+
+        return clip_roi, watermark_mask, mask_template, None
+
+    return None, None, None, None
+
+def process_single_video(video, output_dir, skip_start=0, skip_end=0, max_duration=None, clip_roi=None, max_frames=None, watermark_mask=None, loop_duration=None, backend="moviepy", reuse_tolerance=None, inpaint_method="ns", profile=None, mask_template=None, mask_source=None, threads=None):
+    video_name = os.path.basename(video)
+    output_video_path = os.path.join(output_dir, os.path.splitext(video_name)[0])
+
+    # Step 1: Skip and limit video
+    time_range = get_time_range(video, skip_start, skip_end, max_duration, max_frames)
+    if time_range is None:
+        return
+    start_time, end_time = time_range
+    # auto 配置只在这里测一次速，后面去水印、循环前的编码都用同一个预设
+    profile = get_profile(profile, video, threads)
+    if watermark_mask is not None and mask_template is not None and video != mask_source:
+        # 遮罩来自分辨率或水印位置不同的视频时，在这个视频剪辑后的画面上匹配模板，把遮罩对齐过来
+        watermark_mask = fit_mask_to_video(watermark_mask, mask_template, video, start_time, end_time, clip_roi, make_clip_func(clip_roi) if clip_roi is not None else None)
+    if skip_start > 0 or skip_end > 0 or max_duration is not None:
+        output_video_path += "_skip"
+
+    # Step 2: Clip video
+    if clip_roi is not None:
+        output_video_path += "_clip"
+
+    batch_func = make_batch_func(clip_roi, watermark_mask, reuse_tolerance, inpaint_method)
+    loop_source = video if batch_func is None and start_time == 0 and end_time is None else None
+    temp_path = None
+    # 写出的文件交给批处理记进完成清单
+    outputs = []
+
+    # Step 3: Remove watermark
+    if watermark_mask is not None:
+        loop_source = output_video_path + "_rmwtmk.mp4"
+        transform_video(video, loop_source, batch_func, backend, start_time, end_time, threads, profile=profile)
+        report_batch_func_stats(batch_func, video_name)
+        outputs.append(loop_source)
+
+    # Step 4: Loop video
+    if loop_duration is not None:
+        if loop_source is None:
+            # 前面的步骤没有写出文件时，先把处理后的片段编码一次
+            fd, loop_source = tempfile.mkstemp(suffix=".mp4", dir=output_dir)
+            os.close(fd)
+            temp_path = loop_source
+        try:
+            if temp_path is not None:
+                transform_video(video, loop_source, batch_func, backend, start_time, end_time, threads, profile=profile)
+            loop_video_file(loop_source, output_video_path + "_rec.mp4", loop_duration, threads, profile, source_video=video)
+        finally:
+            if temp_path is not None:
+                os.remove(temp_path)
+        outputs.append(output_video_path + "_rec.mp4")
+
+    print(f"Successfully processed {video_name}")
+    return outputs
+
+def process_single_video_fused(video, output_dir, skip_start=0, skip_end=0, max_duration=None, clip_roi=None, max_frames=None, watermark_mask=None, loop_duration=None, keep_intermediate=False, backend="moviepy", reuse_tolerance=None, inpaint_method="ns", profile=None, mask_template=None, mask_source=None, threads=None):
+    # 跳过、剪辑、去水印在同一次 解码 -> 处理 -> 编码 中完成，循环只做流复制
+    video_name = os.path.basename(video)
+    output_video_path = os.path.join(output_dir, os.path.splitext(video_name)[0])
+
+    time_range = get_time_range(video, skip_start, skip_end, max_duration, max_frames)
+    if time_range is None:
+        return
+    start_time, end_time = time_range
+    # auto 配置只在这里测一次速，后面去水印、循环前的编码都用同一个预设
+    profile = get_profile(profile, video, threads)
+    if watermark_mask is not None and mask_template is not None and video != mask_source:
+        # 遮罩来自分辨率或水印位置不同的视频时，在这个视频剪辑后的画面上匹配模板，把遮罩对齐过来
+        watermark_mask = fit_mask_to_video(watermark_mask, mask_template, video, start_time, end_time, clip_roi, make_clip_func(clip_roi) if clip_roi is not None else None)
+    if skip_start > 0 or skip_end > 0 or max_duration is not None:
+        output_video_path += "_skip"
+    if clip_roi is not None:
+        output_video_path += "_clip"
+
+    base_name = output_video_path + "_rmwtmk" if watermark_mask is not None else output_video_path
+    if loop_duration is None or keep_intermediate:
+        base_path = base_name + ".mp4"
+    else:
+        fd, base_path = tempfile.mkstemp(suffix=".mp4", prefix=os.path.basename(base_name) + "_", dir=output_dir)
+        os.close(fd)
 
-    processed_video = video_clip.fl_image(process_frame)
+    batch_func = make_batch_func(clip_roi, watermark_mask, reuse_tolerance, inpaint_method)
+    keep_base = loop_duration is None or keep_intermediate
+    outputs = [base_path] if keep_base else []
     try:
-        processed_video.write_videofile(f"{output_path}.mp4", codec="libx264")
-    except:
-        print("clipped_video write error")
-
-def loop_video(video_clip, loop_duration):
-    total_duration = video_clip.duration
-    loop_count = int(loop_duration / total_duration)
-    remaining_duration = loop_duration % total_duration
-
-    looped_clips = [video_clip] * loop_count
-    if remaining_duration > 0:
-        looped_clips.append(video_clip.subclip(0, remaining_duration))
+        transform_video(video, base_path, batch_func, backend, start_time, end_time, threads, profile=profile)
+        report_batch_func_stats(batch_func, video_name)
+        if loop_duration is not None:
+            loop_video_file(base_path, output_video_path + "_rec.mp4", loop_duration, threads, profile, source_video=video)
+            outputs.append(output_video_path + "_rec.mp4")
+    finally:
+        # 编码或循环失败时也删掉临时的中间文件
+        if not keep_base and os.path.exists(base_path):
+            os.remove(base_path)
 
-    final_clip = concatenate_videoclips(looped_clips)
-    return final_clip
+    print(f"Successfully processed {video_name}")
+    return outputs
 
-def process_video_pipeline(input_path, output_dir, skip_start=0, skip_end=0, max_duration=None, clip_roi=None, max_frames=None, watermark_mask=None, loop_duration=None):
+def process_video_pipeline(input_path, output_dir, skip_start=0, skip_end=0, max_duration=None, clip_roi=None, max_frames=None, watermark_mask=None, loop_duration=None, max_jobs=1, memory_budget=None, fused=False, keep_intermediate=False, backend="moviepy", save_mask_name=None, two_phase=False, reuse_tolerance=None, inpaint_method="ns", profile=None, metrics_path=None, prom_path=None, force=False, detect_confidence=DEFAULT_MIN_CONFIDENCE):
     ensure_directory_exists(output_dir)
 
     if os.path.isfile(input_path):
         videos = [input_path] if is_valid_video_file(input_path) else []
     elif os.path.isdir(input_path):
-        videos = [f for f in os.listdir(input_path) if is_valid_video_file(os.path.join(input_path, f))]
+        videos = filter_valid_videos([os.path.join(input_path, f) for f in os.listdir(input_path)])
     else:
         print(f"Invalid input path: {input_path}")
         exit(1)
 
-    for video in videos:
-        video_clip = VideoFileClip(os.path.join(input_path, video))
-        video_name = os.path.basename(video)
-        output_video_path = os.path.join(output_dir, os.path.splitext(video_name)[0])
-
-        # Step 1: Skip and limit video
-        if skip_start > 0 or skip_end > 0 or max_duration is not None:
-            video_clip = skip_and_limit_video(video_clip, skip_start, skip_end, max_duration)
-            if video_clip is None:
-                continue
-            output_video_path += "_skip"
-
-        # Step 2: Clip video
-        if clip_roi is not None:
-            if clip_roi == "auto":
-                frame = get_first_valid_frame(video_clip)
-                clip_roi = select_roi(frame, "Select ROI for clipping and press SPACE or ENTER. Press 'c' to finish.")
-            video_clip = clip_video(video_clip, clip_roi, max_frames)
-            output_video_path += "_clip"
-
-        # Step 3: Remove watermark
-        if watermark_mask is not None:
-            if watermark_mask == "auto":
-                watermark_mask = generate_watermark_mask(video_clip)
-            mask_func = lambda frame: cv2.inpaint(frame, watermark_mask, 3, cv2.INPAINT_NS)
-            process_video(video_clip, output_video_path + "_rmwtmk", mask_func, max_frames)
-            video_clip = VideoFileClip(output_video_path + "_rmwtmk.mp4")
-
-        # Step 4: Loop video
-        if loop_duration is not None:
-            looped_video = loop_video(video_clip, loop_duration)
-            try:
-                looped_video.write_videofile(output_video_path + "_rec.mp4", codec="libx264")
-            except:
-                print("clipped_video write error")
-
-        print(f"Successfully processed {video_name}")
+    if two_phase:
+        # 每个视频单独选择剪辑区域和水印，选完立即交给后台编码，操作者选下一个视频时 CPU 不闲着
+        def select_video(video):
+            video_mask_name = f"{save_mask_name}_{os.path.splitext(os.path.basename(video))[0]}" if save_mask_name else None
+            video_clip_roi, video_watermark_mask, video_mask_template, video_mask_source = prepare_pipeline_selections([video], skip_start, skip_end, max_duration, clip_roi, max_frames, watermark_mask, video_mask_name, detect_confidence)
+            return {"clip_roi": video_clip_roi, "watermark_mask": video_watermark_mask, "mask_template": video_mask_template, "mask_source": video_mask_source}
+
+        kwargs = {"output_dir": output_dir, "skip_start": skip_start, "skip_end": skip_end, "max_duration": max_duration,
+                  "max_frames": max_frames, "loop_duration": loop_duration, "backend": backend, "reuse_tolerance": reuse_tolerance,
+                  "inpaint_method": inpaint_method, "profile": profile}
+        if fused:
+            kwargs["keep_intermediate"] = keep_intermediate
+        func = process_single_video_fused if fused else process_single_video
+        # 交互选择的区域和遮罩在选之前还不知道，完成清单只按共用参数判断，已完成的视频不再让操作者选择
+        manifest = RunManifest(output_dir, [func.__name__, kwargs], force)
+        run_interactive_batch(select_video, func, videos, kwargs, max_jobs, memory_budget, metrics_path=metrics_path, prom_path=prom_path, manifest=manifest, profile=profile)
+        return
+
+    clip_roi, watermark_mask, mask_template, mask_source = prepare_pipeline_selections(videos, skip_start, skip_end, max_duration, clip_roi, max_frames, watermark_mask, save_mask_name, detect_confidence)
+
+    if fused:
+        func = process_single_video_fused
+        job_args = (output_dir, skip_start, skip_end, max_duration, clip_roi, max_frames, watermark_mask, loop_duration, keep_intermediate, backend, reuse_tolerance, inpaint_method, profile, mask_template, mask_source)
+    else:
+        func = process_single_video
+        job_args = (output_dir, skip_start, skip_end, max_duration, clip_roi, max_frames, watermark_mask, loop_duration, backend, reuse_tolerance, inpaint_method, profile, mask_template, mask_source)
+    manifest = RunManifest(output_dir, [func.__name__, job_args], force)
+    run_batch(func, videos, job_args, max_jobs, memory_budget, metrics_path=metrics_path, prom_path=prom_path, manifest=manifest, profile=profile)
 
 '''
 python video_pipeline_multi_select.py -i input_video.mp4 -o output_dir -s 5 -e 10 -m 120 -c auto -w auto -l 360
@@ -212,8 +250,22 @@ if __name__ == "__main__":
     parser.add_argument("-m", "--max_duration", type=float, default=None, help="Maximum duration in seconds to limit the video. If not provided, the entire video will be processed.")
     parser.add_argument("-c", "--clip_roi", default=None, help="Region of interest (ROI) for clipping. Use 'auto' to select ROI interactively.")
     parser.add_argument("-f", "--frames", type=int, default=None, help="Number of frames to process. If not provided, the entire video will be processed.")
-    parser.add_argument("-w", "--watermark_mask", default=None, help="Watermark mask. Use 'auto' to generate mask interactively.")
+    parser.add_argument("-w", "--watermark_mask", default=None, help="Watermark mask. Use 'auto' to generate mask interactively, 'detect' to locate the watermark automatically from the sampled frames (falls back to interactive selection when the confidence is below --detect_confidence), or give a mask name in the mask store or a path to a mask PNG.")
+    parser.add_argument("--detect_confidence", type=float, default=DEFAULT_MIN_CONFIDENCE, help="Minimum confidence (0-1) of the automatic watermark detection before falling back to interactive selection. Default is 0.5.")
+    parser.add_argument("--save_mask", default=None, help="Save the generated watermark mask under this name in the mask store (or to this path) so later runs can pass it to -w.")
     parser.add_argument("-l", "--loop_duration", type=float, default=None, help="Duration in seconds to loop the video. If not provided, the entire video will be processed.")
+    parser.add_argument("--force", action="store_true", help="Process every video again, even if the manifest in the output directory records it as completed with the same parameters.")
+    parser.add_argument("--jobs", type=int, default=1, help="Number of videos to process at the same time. Use 0 to pick from the CPU count and memory budget. Default is 1.")
+    parser.add_argument("--memory_budget", type=float, default=None, help="Memory budget in GB shared by all parallel jobs. Default is 75%% of the physical memory.")
+    parser.add_argument("--fused", action="store_true", help="Apply skip, clip and watermark removal in a single encode pass and loop the result by stream copy.")
+    parser.add_argument("--keep_intermediate", action="store_true", help="In fused mode, also keep the encoded video before looping.")
+    parser.add_argument("--two_phase", action="store_true", help="Select the clip ROI and watermark mask separately for every video. Each video starts encoding in the background as soon as its selections are made.")
+    parser.add_argument("--inpaint_method", choices=INPAINT_METHODS, default="ns", help="Inpaint method. 'ns' and 'telea' run OpenCV on every frame; 'harmonic' and 'biharmonic' factorise the fill for the fixed mask once and only solve a sparse system per frame (requires scipy). Default is 'ns'.")
+    parser.add_argument("--reuse_tolerance", type=float, default=None, help="Reuse the previous inpainted patch while the pixels around the watermark change by less than this mean absolute difference (0-255). Suited to timelapse footage. Off by default.")
+    parser.add_argument("--profile", choices=PROFILE_NAMES, default=DEFAULT_PROFILE, help="Encoding profile: 'fast' for intermediate files, 'archival', 'delivery' (moviepy's previous defaults), or 'auto' to benchmark a few seconds of the input and pick the slowest preset that still encodes in real time. Default is 'delivery'.")
+    parser.add_argument("--metrics", default=None, help="Append per-video throughput records (frames, fps, decode/transform/encode time) as JSON lines to this file.")
+    parser.add_argument("--metrics_prom", default=None, help="Write the throughput metrics of this run to a Prometheus textfile-collector file.")
+    parser.add_argument("--backend", choices=BACKENDS, default="moviepy", help="Frame reader/writer backend. 'ffmpeg' pipes raw frames into reused buffers, 'opencv' reads with cv2.VideoCapture. Default is 'moviepy'.")
     args = parser.parse_args()
 
     input_path = args.input
@@ -225,6 +277,20 @@ if __name__ == "__main__":
     max_frames = args.frames
     watermark_mask = args.watermark_mask
     loop_duration = args.loop_duration
+    force = args.force
+    max_jobs = args.jobs
+    memory_budget = int(args.memory_budget * 1024 ** 3) if args.memory_budget else None
+    fused = args.fused
+    keep_intermediate = args.keep_intermediate
+    backend = args.backend
+    save_mask_name = args.save_mask
+    detect_confidence = args.detect_confidence
+    two_phase = args.two_phase
+    reuse_tolerance = args.reuse_tolerance
+    inpaint_method = args.inpaint_method
+    profile = args.profile
+    metrics_path = args.metrics
+    prom_path = args.metrics_prom
 
     if output_dir is None:
         if os.path.isfile(input_path):
@@ -235,4 +301,4 @@ if __name__ == "__main__":
             print(f"Invalid input path: {input_path}")
             exit(1)
 
-    process_video_pipeline(input_path, output_dir, skip_start, skip_end, max_duration, clip_roi, max_frames, watermark_mask, loop_duration)
+    process_video_pipeline(input_path, output_dir, skip_start, skip_end, max_duration, clip_roi, max_frames, watermark_mask, loop_duration, max_jobs, memory_budget, fused, keep_intermediate, backend, save_mask_name, two_phase, reuse_tolerance, inpaint_method, profile, metrics_path, prom_path, force, detect_confidence)
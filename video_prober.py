@@ -0,0 +1,134 @@
+# coding:utf-8
+
+import os
+import re
+import json
+import subprocess
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from run_manifest import MANIFEST_FILE_NAME
+
+INDEX_FILE_NAME = ".video_index.json"
+DEFAULT_PROBE_WORKERS = 8
+
+def get_ffmpeg_binary():
+    # moviepy.config 会连带导入 imageio，真正要调用 ffmpeg 时才加载，脚本启动时不用付这笔开销
+    from moviepy.config import get_setting
+    return get_setting("FFMPEG_BINARY")
+
+def _parse_fps(line):
+    match = re.search(r"([\d.]+)(k?) tbr", line) or re.search(r"([\d.]+)(k?) fps", line)
+    if match is None:
+        return None
+    fps = float(match.group(1)) * (1000 if match.group(2) else 1)
+    # 与 moviepy 一致，把 29.97 这类帧率修正为 30000/1001
+    for x in [23, 24, 25, 30, 50]:
+        if fps != x and abs(fps - x * 1000.0 / 1001.0) < 0.01:
+            fps = x * 1000.0 / 1001.0
+    return fps
+
+def probe_video(video_path):
+    # ffmpeg -i 只读取容器和流的头信息，不打开解码器，也不读音频
+    cmd = [get_ffmpeg_binary(), "-hide_banner", "-i", video_path]
+    try:
+        result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    except OSError as e:
+        print(f"Could not run ffmpeg on {video_path}, Error: {e}")
+        return None
+    infos = result.stderr.decode("utf8", errors="ignore")
+
+    duration_match = re.search(r"Duration: (\d+):(\d+):([\d.]+)", infos)
+    info = {"duration": None, "fps": None, "size": None, "video_codec": None, "audio_codec": None}
+    if duration_match is not None:
+        hours, minutes, seconds = duration_match.groups()
+        info["duration"] = int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+    for line in infos.splitlines():
+        match = re.search(r"Stream #\d+:\d+.*?: (Video|Audio): (\w+)", line)
+        if match is None:
+            continue
+        if match.group(1) == "Video" and info["video_codec"] is None and "attached pic" not in line:
+            size_match = re.search(r" (\d{2,5})x(\d{2,5})[,\s]", line)
+            info["video_codec"] = match.group(2)
+            info["size"] = [int(size_match.group(1)), int(size_match.group(2))] if size_match else None
+            info["fps"] = _parse_fps(line)
+        elif match.group(1) == "Audio" and info["audio_codec"] is None:
+            info["audio_codec"] = match.group(2)
+
+    if info["video_codec"] is None or info["duration"] is None or info["fps"] is None:
+        return None
+
+    info["has_audio"] = info["audio_codec"] is not None
+    info["frame_count"] = int(info["duration"] * info["fps"])
+    return info
+
+def _file_key(video_path):
+    stat = os.stat(video_path)
+    return {"size": stat.st_size, "mtime": stat.st_mtime_ns}
+
+def _load_index(directory):
+    try:
+        with open(os.path.join(directory, INDEX_FILE_NAME), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _save_index(directory, index):
+    # 先写临时文件再替换，多个进程同时探测同一目录时不会读到写了一半的索引
+    try:
+        fd, temp_path = tempfile.mkstemp(prefix=INDEX_FILE_NAME, dir=directory)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(index, f, ensure_ascii=False, indent=1)
+        os.replace(temp_path, os.path.join(directory, INDEX_FILE_NAME))
+    except OSError as e:
+        print(f"Could not write video index in {directory}, Error: {e}")
+
+def probe_videos(video_paths, workers=DEFAULT_PROBE_WORKERS):
+    # 按目录读取旁路索引，路径、大小、修改时间都没变的文件直接使用缓存的元数据
+    results = {}
+    by_directory = {}
+    for video_path in video_paths:
+        if os.path.isfile(video_path):
+            by_directory.setdefault(os.path.dirname(os.path.abspath(video_path)), []).append(video_path)
+        else:
+            results[video_path] = None
+
+    for directory, paths in by_directory.items():
+        index = _load_index(directory)
+        keys = {path: _file_key(path) for path in paths}
+        stale = []
+        for path in paths:
+            entry = index.get(os.path.basename(path))
+            if entry is not None and entry["key"] == keys[path]:
+                results[path] = entry["info"]
+            else:
+                stale.append(path)
+
+        if not stale:
+            continue
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for path, info in zip(stale, executor.map(probe_video, stale)):
+                results[path] = info
+                index[os.path.basename(path)] = {"key": keys[path], "info": info}
+
+        existing_names = {os.path.basename(path) for path in os.listdir(directory)} if os.path.isdir(directory) else set()
+        index = {name: entry for name, entry in index.items() if name in existing_names}
+        _save_index(directory, index)
+
+    return results
+
+def get_video_info(video_path):
+    return probe_videos([video_path])[video_path]
+
+def filter_valid_videos(video_paths, workers=DEFAULT_PROBE_WORKERS):
+    # 跳过目录（亮度曲线、遮罩对齐的缓存目录）和本项目自己写的索引、清单文件
+    video_paths = [path for path in video_paths if not os.path.isdir(path) and not os.path.basename(path).startswith((INDEX_FILE_NAME, MANIFEST_FILE_NAME))]
+    infos = probe_videos(video_paths, workers)
+    valid_videos = []
+    for video_path in video_paths:
+        if infos[video_path] is None:
+            print(f"Invalid video file: {video_path}")
+        else:
+            valid_videos.append(video_path)
+    return valid_videos
@@ -1,59 +1,43 @@
 # coding:utf-8
 
-import cv2
 import os
-from moviepy.editor import VideoFileClip, concatenate_videoclips
 import argparse
-from tqdm import tqdm
-
-def ensure_directory_exists(directory):
-    if not os.path.exists(directory):
-        try:
-            os.makedirs(directory)
-            print(f"Created directory: {directory}")
-        except OSError as error:
-            print(f"Error creating directory {directory}: {error}")
-            raise
-
-def is_valid_video_file(file):
-    try:
-        with VideoFileClip(file) as video_clip:
-            return True
-    except Exception as e:
-        print(f"Invalid video file: {file}, Error: {e}")
-        return False
-
-def loop_video(video_clip, loop_duration):
-    total_duration = video_clip.duration
-    loop_count = int(loop_duration / total_duration)
-    remaining_duration = loop_duration % total_duration
-
-    # 创建循环片段
-    looped_clips = [video_clip] * loop_count
-    if remaining_duration > 0:
-        looped_clips.append(video_clip.subclip(0, remaining_duration))
-
-    # 连接所有片段
-    final_clip = concatenate_videoclips(looped_clips)
-    return final_clip
-
-def process_video(video_clip, output_path, loop_duration):
-    looped_video = loop_video(video_clip, loop_duration)
-    try:
-        looped_video.write_videofile(f"{output_path}.mp4", codec="libx264")
-    except:
-        print("clipped_video write error")
+from batch_executor import run_batch
+from video_looper import loop_video_file
+from video_prober import filter_valid_videos
+from encoding_profiles import DEFAULT_PROFILE, PROFILE_NAMES
+from video_common import ensure_directory_exists, is_valid_video_file
+
+def process_video(video_path, output_path, loop_duration, threads=None, profile=None):
+    # 源视频最多编码一次，循环部分用 concat 流复制拼接；写入失败时异常交给批处理记录
+    loop_video_file(video_path, f"{output_path}.mp4", loop_duration, threads, profile)
+
+def process_video_file(video_path, output_dir, loop_duration, profile=None, threads=None):
+    video_name = os.path.basename(video_path)
+    output_video_path = os.path.join(output_dir, os.path.splitext(video_name)[0])
+    process_video(video_path, output_video_path, loop_duration, threads, profile)
+    print(f"Successfully looped {video_name}")
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Loop a video for a specified duration.")
     parser.add_argument("-i", "--input", default="video", help="Path to the input video file or directory containing videos. Default is 'video'.")
     parser.add_argument("-o", "--output", default=None, help="Path to the output directory. If not provided, it will be generated as input_path + '_rec'.")
     parser.add_argument("-s", "--seconds", type=float, default=None, help="Duration in seconds to loop the video. If not provided, the entire video will be processed.")
+    parser.add_argument("--jobs", type=int, default=1, help="Number of videos to process at the same time. Use 0 to pick from the CPU count and memory budget. Default is 1.")
+    parser.add_argument("--memory_budget", type=float, default=None, help="Memory budget in GB shared by all parallel jobs. Default is 75%% of the physical memory.")
+    parser.add_argument("--profile", choices=PROFILE_NAMES, default=DEFAULT_PROFILE, help="Encoding profile: 'fast' for intermediate files, 'archival', 'delivery' (moviepy's previous defaults), or 'auto' to benchmark a few seconds of the input and pick the slowest preset that still encodes in real time. Default is 'delivery'.")
+    parser.add_argument("--metrics", default=None, help="Append per-video throughput records (frames, fps, decode/transform/encode time) as JSON lines to this file.")
+    parser.add_argument("--metrics_prom", default=None, help="Write the throughput metrics of this run to a Prometheus textfile-collector file.")
     args = parser.parse_args()
 
     input_path = args.input
     output_dir = args.output
     loop_duration = args.seconds
+    max_jobs = args.jobs
+    memory_budget = int(args.memory_budget * 1024 ** 3) if args.memory_budget else None
+    profile = args.profile
+    metrics_path = args.metrics
+    prom_path = args.metrics_prom
 
     # 如果未提供 output_dir，则根据 input_path 生成
     if output_dir is None:
@@ -70,14 +54,9 @@ if __name__ == "__main__":
     if os.path.isfile(input_path):
         videos = [input_path] if is_valid_video_file(input_path) else []
     elif os.path.isdir(input_path):
-        videos = [f for f in os.listdir(input_path) if is_valid_video_file(os.path.join(input_path, f))]
+        videos = filter_valid_videos([os.path.join(input_path, f) for f in os.listdir(input_path)])
     else:
         print(f"Invalid input path: {input_path}")
         exit(1)
 
-    for video in videos:
-        video_clip = VideoFileClip(os.path.join(input_path, video))
-        video_name = os.path.basename(video)
-        output_video_path = os.path.join(output_dir, os.path.splitext(video_name)[0])
-        process_video(video_clip, output_video_path, loop_duration)
-        print(f"Successfully looped {video_name}")
+    run_batch(process_video_file, videos, (output_dir, loop_duration, profile), max_jobs, memory_budget, metrics_path=metrics_path, prom_path=prom_path, profile=profile)
@@ -0,0 +1,35 @@
+# coding:utf-8
+
+import time
+import subprocess
+from video_prober import get_ffmpeg_binary, get_video_info
+from stage_metrics import record_pass
+
+# mp4 容器可以直接装下的编码，这些视频换容器或去音频时只需要流复制
+MP4_VIDEO_CODECS = {"h264", "hevc", "mpeg4", "av1", "vp9"}
+MP4_AUDIO_CODECS = {"aac", "mp3", "ac3", "eac3", "opus", "alac", "flac"}
+
+def get_stream_codecs(video_path):
+    info = get_video_info(video_path)
+    if info is None:
+        return None, None
+    return info["video_codec"], info["audio_codec"]
+
+def can_remux(video_path, drop_audio=False, info=None):
+    # 临时文件传入已经探测好的 info，不经过 get_video_info，避免把临时文件写进输出目录的索引缓存
+    video_codec, audio_codec = (info["video_codec"], info["audio_codec"]) if info is not None else get_stream_codecs(video_path)
+    if video_codec not in MP4_VIDEO_CODECS:
+        return False
+    return drop_audio or audio_codec is None or audio_codec in MP4_AUDIO_CODECS
+
+def remux_video(input_path, output_path, drop_audio=False):
+    start = time.perf_counter()
+    cmd = [get_ffmpeg_binary(), "-y", "-loglevel", "error", "-i", input_path, "-map", "0:v:0"]
+    if drop_audio:
+        cmd += ["-an"]
+    else:
+        cmd += ["-map", "0:a?"]
+    cmd += ["-c", "copy", "-movflags", "+faststart", output_path]
+    subprocess.run(cmd, check=True)
+    info = get_video_info(input_path)
+    record_pass("remux", input_path, output_path, info["frame_count"] if info else 0, start)
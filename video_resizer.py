@@ -1,40 +1,50 @@
 # coding:utf-8
 
-import cv2
 import os
-from moviepy.editor import VideoFileClip
+import time
 import argparse
-from tqdm import tqdm
-
-def ensure_directory_exists(directory):
-    if not os.path.exists(directory):
-        try:
-            os.makedirs(directory)
-            print(f"Created directory: {directory}")
-        except OSError as error:
-            print(f"Error creating directory {directory}: {error}")
-            raise
-
-def is_valid_video_file(file):
-    try:
-        with VideoFileClip(file) as video_clip:
-            return True
-    except Exception as e:
-        print(f"Invalid video file: {file}, Error: {e}")
-        return False
+from batch_executor import run_batch
+from video_remuxer import can_remux, remux_video
+from frame_io import BACKENDS, batch_from_frame_func, transform_video
+from encoding_profiles import DEFAULT_PROFILE, PROFILE_NAMES, get_profile, moviepy_write_kwargs
+from video_prober import filter_valid_videos, get_video_info
+from video_common import ensure_directory_exists, is_valid_video_file
+from stage_metrics import record_pass
 
 def resize_video(video_clip, width, height):
     # 调整视频尺寸
-    resized_clip = video_clip.resize(newsize=(width, height))
+    from moviepy.video.fx.resize import resize
+
+    resized_clip = video_clip.fx(resize, newsize=(width, height))
     return resized_clip
 
-def process_video(video_clip, output_path, width, height):
+def process_video(video_clip, output_path, width, height, threads=None, profile=None):
     resized_video = resize_video(video_clip, width, height)
     if resized_video:
-        try:
-            resized_video.write_videofile(f"{output_path}.mp4", codec="libx264")
-        except:
-            print("clipped_video write error")
+        # 写入失败时异常交给批处理记录，不再吞掉
+        start = time.perf_counter()
+        resized_video.write_videofile(f"{output_path}.mp4", **moviepy_write_kwargs(get_profile(profile), resized_video.fps, threads))
+        record_pass("resize", video_clip.filename, f"{output_path}.mp4", round(resized_video.duration * resized_video.fps), start, "moviepy")
+
+def process_video_file(video_path, output_dir, width, height, backend="moviepy", profile=None, threads=None):
+    video_name = os.path.basename(video_path)
+    output_video_path = os.path.join(output_dir, os.path.splitext(video_name)[0])
+    # 尺寸从缓存的头信息里读取，尺寸已经符合要求时只换封装，不重新编码
+    if tuple(get_video_info(video_path)["size"]) == (width, height) and can_remux(video_path):
+        remux_video(video_path, f"{output_video_path}.mp4")
+    elif backend == "moviepy":
+        from moviepy.video.io.VideoFileClip import VideoFileClip
+
+        video_clip = VideoFileClip(video_path)
+        process_video(video_clip, output_video_path, width, height, threads, get_profile(profile, video_path, threads))
+        video_clip.close()
+    else:
+        import cv2
+
+        resize_frame = lambda frame: cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+        # 写入失败时异常交给批处理记录，不再吞掉
+        transform_video(video_path, f"{output_video_path}.mp4", batch_from_frame_func(resize_frame), backend, threads=threads, profile=profile)
+    print(f"Successfully processed {video_name}")
 '''
 python video_resizer.py -i .\原神风景视频（去水印）拣选后_少量文件 -w 640 -ht 480
 '''
@@ -45,12 +55,24 @@ if __name__ == "__main__":
     parser.add_argument("-o", "--output", default=None, help="Path to the output directory. If not provided, it will be generated as input_path + '_resized'.")
     parser.add_argument("-w", "--width", type=int, required=True, help="Target width for the resized video.")
     parser.add_argument("-ht", "--height", type=int, required=True, help="Target height for the resized video.")
+    parser.add_argument("--jobs", type=int, default=1, help="Number of videos to process at the same time. Use 0 to pick from the CPU count and memory budget. Default is 1.")
+    parser.add_argument("--memory_budget", type=float, default=None, help="Memory budget in GB shared by all parallel jobs. Default is 75%% of the physical memory.")
+    parser.add_argument("--profile", choices=PROFILE_NAMES, default=DEFAULT_PROFILE, help="Encoding profile: 'fast' for intermediate files, 'archival', 'delivery' (moviepy's previous defaults), or 'auto' to benchmark a few seconds of the input and pick the slowest preset that still encodes in real time. Default is 'delivery'.")
+    parser.add_argument("--metrics", default=None, help="Append per-video throughput records (frames, fps, decode/transform/encode time) as JSON lines to this file.")
+    parser.add_argument("--metrics_prom", default=None, help="Write the throughput metrics of this run to a Prometheus textfile-collector file.")
+    parser.add_argument("--backend", choices=BACKENDS, default="moviepy", help="Frame reader/writer backend. 'ffmpeg' pipes raw frames into reused buffers, 'opencv' reads with cv2.VideoCapture. Default is 'moviepy'.")
     args = parser.parse_args()
 
     input_path = args.input
     output_dir = args.output
     width = args.width
     height = args.height
+    backend = args.backend
+    max_jobs = args.jobs
+    memory_budget = int(args.memory_budget * 1024 ** 3) if args.memory_budget else None
+    profile = args.profile
+    metrics_path = args.metrics
+    prom_path = args.metrics_prom
 
     # 如果未提供 output_dir，则根据 input_path 生成
     if output_dir is None:
@@ -67,14 +89,9 @@ if __name__ == "__main__":
     if os.path.isfile(input_path):
         videos = [input_path] if is_valid_video_file(input_path) else []
     elif os.path.isdir(input_path):
-        videos = [f for f in os.listdir(input_path) if is_valid_video_file(os.path.join(input_path, f))]
+        videos = filter_valid_videos([os.path.join(input_path, f) for f in os.listdir(input_path)])
     else:
         print(f"Invalid input path: {input_path}")
         exit(1)
 
-    for video in tqdm(videos, desc="Processing videos"):
-        video_clip = VideoFileClip(os.path.join(input_path, video))
-        video_name = os.path.basename(video)
-        output_video_path = os.path.join(output_dir, os.path.splitext(video_name)[0])
-        process_video(video_clip, output_video_path, width, height)
-        print(f"Successfully processed {video_name}")
+    run_batch(process_video_file, videos, (output_dir, width, height, backend, profile), max_jobs, memory_budget, metrics_path=metrics_path, prom_path=prom_path, profile=profile)
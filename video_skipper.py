@@ -1,53 +1,24 @@
 # coding:utf-8
 
-import cv2
 import os
-from moviepy.editor import VideoFileClip
 import argparse
-from tqdm import tqdm
+from batch_executor import run_batch
+from frame_io import BACKENDS, transform_video
+from encoding_profiles import DEFAULT_PROFILE, PROFILE_NAMES
+from video_prober import filter_valid_videos
+from video_common import ensure_directory_exists, get_time_range, is_valid_video_file
 
-def ensure_directory_exists(directory):
-    if not os.path.exists(directory):
-        try:
-            os.makedirs(directory)
-            print(f"Created directory: {directory}")
-        except OSError as error:
-            print(f"Error creating directory {directory}: {error}")
-            raise
+def process_video(video_path, output_path, skip_start, skip_end, max_duration, threads=None, backend="moviepy", profile=None):
+    time_range = get_time_range(video_path, skip_start, skip_end, max_duration)
+    if time_range:
+        # 写入失败时异常交给批处理记录，不再吞掉
+        transform_video(video_path, f"{output_path}.mp4", None, backend, time_range[0], time_range[1], threads, profile=profile)
 
-def is_valid_video_file(file):
-    try:
-        with VideoFileClip(file) as video_clip:
-            return True
-    except Exception as e:
-        print(f"Invalid video file: {file}, Error: {e}")
-        return False
-
-def skip_and_limit_video(video_clip, skip_start, skip_end, max_duration):
-    total_duration = video_clip.duration
-
-    # 检查跳过的秒数是否比视频长度长
-    if skip_start + skip_end >= total_duration:
-        print(f"Skipping duration ({skip_start}s + {skip_end}s) is longer than or equal to video duration ({total_duration}s). Skipping entire video.")
-        return None
-
-    # 先进行尾部跳过
-    end_time = total_duration - skip_end
-    skipped_clip = video_clip.subclip(skip_start, end_time)
-
-    # 再限制最长长度
-    if skipped_clip.duration > max_duration:
-        skipped_clip = skipped_clip.subclip(0, max_duration)
-
-    return skipped_clip
-
-def process_video(video_clip, output_path, skip_start, skip_end, max_duration):
-    skipped_video = skip_and_limit_video(video_clip, skip_start, skip_end, max_duration)
-    if skipped_video:
-        try:
-            skipped_video.write_videofile(f"{output_path}.mp4", codec="libx264")
-        except:
-            print("clipped_video write error")
+def process_video_file(video_path, output_dir, skip_start, skip_end, max_duration, backend="moviepy", profile=None, threads=None):
+    video_name = os.path.basename(video_path)
+    output_video_path = os.path.join(output_dir, os.path.splitext(video_name)[0])
+    process_video(video_path, output_video_path, skip_start, skip_end, max_duration, threads, backend, profile)
+    print(f"Successfully processed {video_name}")
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Skip the start and end of a video for specified durations and limit the maximum duration.")
@@ -56,6 +27,12 @@ if __name__ == "__main__":
     parser.add_argument("-s", "--skip_start", type=float, default=0, help="Duration in seconds to skip from the start of the video. Default is 0.")
     parser.add_argument("-e", "--skip_end", type=float, default=0, help="Duration in seconds to skip from the end of the video. Default is 0.")
     parser.add_argument("-m", "--max_duration", type=float, default=None, help="Maximum duration in seconds to limit the video. If not provided, the entire video will be processed.")
+    parser.add_argument("--jobs", type=int, default=1, help="Number of videos to process at the same time. Use 0 to pick from the CPU count and memory budget. Default is 1.")
+    parser.add_argument("--memory_budget", type=float, default=None, help="Memory budget in GB shared by all parallel jobs. Default is 75%% of the physical memory.")
+    parser.add_argument("--profile", choices=PROFILE_NAMES, default=DEFAULT_PROFILE, help="Encoding profile: 'fast' for intermediate files, 'archival', 'delivery' (moviepy's previous defaults), or 'auto' to benchmark a few seconds of the input and pick the slowest preset that still encodes in real time. Default is 'delivery'.")
+    parser.add_argument("--metrics", default=None, help="Append per-video throughput records (frames, fps, decode/transform/encode time) as JSON lines to this file.")
+    parser.add_argument("--metrics_prom", default=None, help="Write the throughput metrics of this run to a Prometheus textfile-collector file.")
+    parser.add_argument("--backend", choices=BACKENDS, default="moviepy", help="Frame reader/writer backend. 'ffmpeg' pipes raw frames into reused buffers, 'opencv' reads with cv2.VideoCapture. Default is 'moviepy'.")
     args = parser.parse_args()
 
     input_path = args.input
@@ -63,6 +40,12 @@ if __name__ == "__main__":
     skip_start = args.skip_start
     skip_end = args.skip_end
     max_duration = args.max_duration
+    backend = args.backend
+    max_jobs = args.jobs
+    memory_budget = int(args.memory_budget * 1024 ** 3) if args.memory_budget else None
+    profile = args.profile
+    metrics_path = args.metrics
+    prom_path = args.metrics_prom
 
     # 如果未提供 output_dir，则根据 input_path 生成
     if output_dir is None:
@@ -79,14 +62,9 @@ if __name__ == "__main__":
     if os.path.isfile(input_path):
         videos = [input_path] if is_valid_video_file(input_path) else []
     elif os.path.isdir(input_path):
-        videos = [f for f in os.listdir(input_path) if is_valid_video_file(os.path.join(input_path, f))]
+        videos = filter_valid_videos([os.path.join(input_path, f) for f in os.listdir(input_path)])
     else:
         print(f"Invalid input path: {input_path}")
         exit(1)
 
-    for video in videos:
-        video_clip = VideoFileClip(os.path.join(input_path, video))
-        video_name = os.path.basename(video)
-        output_video_path = os.path.join(output_dir, os.path.splitext(video_name)[0])
-        process_video(video_clip, output_video_path, skip_start, skip_end, max_duration)
-        print(f"Successfully processed {video_name}")
+    run_batch(process_video_file, videos, (output_dir, skip_start, skip_end, max_duration, backend, profile), max_jobs, memory_budget, metrics_path=metrics_path, prom_path=prom_path, profile=profile)
@@ -1,36 +1,38 @@
 # coding:utf-8
 
 import os
-from moviepy.editor import VideoFileClip
+import time
 import argparse
-from tqdm import tqdm
-
-def ensure_directory_exists(directory):
-    if not os.path.exists(directory):
-        try:
-            os.makedirs(directory)
-            print(f"Created directory: {directory}")
-        except OSError as error:
-            print(f"Error creating directory {directory}: {error}")
-            raise
-
-def is_valid_video_file(file):
-    try:
-        with VideoFileClip(file) as video_clip:
-            return True
-    except Exception as e:
-        print(f"Invalid video file: {file}, Error: {e}")
-        return False
+from batch_executor import run_batch
+from video_remuxer import can_remux, remux_video
+from video_prober import filter_valid_videos
+from video_common import ensure_directory_exists, is_valid_video_file
+from encoding_profiles import DEFAULT_PROFILE, PROFILE_NAMES, get_profile, moviepy_write_kwargs
+from stage_metrics import record_pass
 
 def remove_audio_from_video(video_clip):
     return video_clip.without_audio()
 
-def process_video(video_clip, output_path):
+def process_video(video_clip, output_path, threads=None, profile=None):
     video_without_audio = remove_audio_from_video(video_clip)
-    try:
-        video_without_audio.write_videofile(f"{output_path}.mp4", codec="libx264")
-    except:
-        print("Error writing video without audio")
+    # 写入失败时异常交给批处理记录，不再吞掉
+    start = time.perf_counter()
+    video_without_audio.write_videofile(f"{output_path}.mp4", **moviepy_write_kwargs(get_profile(profile), video_clip.fps, threads))
+    record_pass("silence", video_clip.filename, f"{output_path}.mp4", round(video_clip.duration * video_clip.fps), start, "moviepy")
+
+def process_video_file(video_path, output_dir, reencode=False, profile=None, threads=None):
+    video_name = os.path.basename(video_path)
+    output_video_path = os.path.join(output_dir, os.path.splitext(video_name)[0])
+    # 去掉音频不改变画面，能流复制时直接换封装，不再重新编码
+    if not reencode and can_remux(video_path, drop_audio=True):
+        remux_video(video_path, f"{output_video_path}.mp4", drop_audio=True)
+    else:
+        from moviepy.video.io.VideoFileClip import VideoFileClip
+
+        video_clip = VideoFileClip(video_path)
+        process_video(video_clip, output_video_path, threads, get_profile(profile, video_path, threads))
+        video_clip.close()
+    print(f"Successfully processed {video_name}")
 
 '''
 python video_sliencer.py -i .\原神风景视频（去水印）拣选后_单个文件夹_改变到2560x1080_skip_resized_裁剪_到人物_2560_温蒂
@@ -41,10 +43,22 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Remove audio from a video and save it to a new path.")
     parser.add_argument("-i", "--input", default="video", help="Path to the input video file or directory containing videos. Default is 'video'.")
     parser.add_argument("-o", "--output", default=None, help="Path to the output directory. If not provided, it will be generated as input_path + '_no_audio'.")
+    parser.add_argument("--reencode", action="store_true", help="Always decode and re-encode the video instead of copying the video stream.")
+    parser.add_argument("--jobs", type=int, default=1, help="Number of videos to process at the same time. Use 0 to pick from the CPU count and memory budget. Default is 1.")
+    parser.add_argument("--memory_budget", type=float, default=None, help="Memory budget in GB shared by all parallel jobs. Default is 75%% of the physical memory.")
+    parser.add_argument("--profile", choices=PROFILE_NAMES, default=DEFAULT_PROFILE, help="Encoding profile: 'fast' for intermediate files, 'archival', 'delivery' (moviepy's previous defaults), or 'auto' to benchmark a few seconds of the input and pick the slowest preset that still encodes in real time. Default is 'delivery'.")
+    parser.add_argument("--metrics", default=None, help="Append per-video throughput records (frames, fps, decode/transform/encode time) as JSON lines to this file.")
+    parser.add_argument("--metrics_prom", default=None, help="Write the throughput metrics of this run to a Prometheus textfile-collector file.")
     args = parser.parse_args()
 
     input_path = args.input
     output_dir = args.output
+    reencode = args.reencode
+    max_jobs = args.jobs
+    memory_budget = int(args.memory_budget * 1024 ** 3) if args.memory_budget else None
+    profile = args.profile
+    metrics_path = args.metrics
+    prom_path = args.metrics_prom
 
     # 如果未提供 output_dir，则根据 input_path 生成
     if output_dir is None:
@@ -61,14 +75,9 @@ if __name__ == "__main__":
     if os.path.isfile(input_path):
         videos = [input_path] if is_valid_video_file(input_path) else []
     elif os.path.isdir(input_path):
-        videos = [f for f in os.listdir(input_path) if is_valid_video_file(os.path.join(input_path, f))]
+        videos = filter_valid_videos([os.path.join(input_path, f) for f in os.listdir(input_path)])
     else:
         print(f"Invalid input path: {input_path}")
         exit(1)
 
-    for video in tqdm(videos, desc="Processing videos"):
-        video_clip = VideoFileClip(os.path.join(input_path, video))
-        video_name = os.path.basename(video)
-        output_video_path = os.path.join(output_dir, os.path.splitext(video_name)[0])
-        process_video(video_clip, output_video_path)
-        print(f"Successfully processed {video_name}")
+    run_batch(process_video_file, videos, (output_dir, reencode, profile), max_jobs, memory_budget, metrics_path=metrics_path, prom_path=prom_path, profile=profile)
@@ -1,25 +1,43 @@
 import os
-from moviepy.editor import VideoFileClip
+import time
 import argparse
+from batch_executor import run_batch
+from video_remuxer import can_remux, remux_video
+from encoding_profiles import DEFAULT_PROFILE, PROFILE_NAMES, get_profile, moviepy_write_kwargs
+from stage_metrics import record_pass
+from video_common import ensure_directory_exists
 
-def ensure_directory_exists(directory):
-    if not os.path.exists(directory):
-        try:
-            os.makedirs(directory)
-            print(f"Created directory: {directory}")
-        except OSError as error:
-            print(f"Error creating directory {directory}: {error}")
-            raise
-
-def speed_change_video(video_clip, speed_factor, output_path):
+def speed_change_video(video_clip, speed_factor, output_path, threads=None, profile=None):
+    write_kwargs = moviepy_write_kwargs(get_profile(profile), video_clip.fps, threads)
+    start = time.perf_counter()
     if speed_factor == 1:
         # 如果变速因子为1，直接复制原视频
-        video_clip.write_videofile(output_path, codec="libx264")
+        video_clip.write_videofile(output_path, **write_kwargs)
     else:
         # 否则，按变速因子调整视频速度
         new_duration = video_clip.duration / speed_factor
-        sped_up_clip = video_clip.speedx(speed_factor)
-        sped_up_clip.write_videofile(output_path, codec="libx264")
+        from moviepy.video.fx.speedx import speedx
+
+        sped_up_clip = video_clip.fx(speedx, speed_factor)
+        sped_up_clip.write_videofile(output_path, **write_kwargs)
+    record_pass("speed", video_clip.filename, output_path, round(video_clip.duration / speed_factor * video_clip.fps), start, "moviepy")
+
+def speed_change_video_file(video_file, output_dir, speed_factor, profile=None, threads=None):
+    # 生成输出视频路径
+    sped_up_video_path = os.path.join(output_dir, f"{os.path.splitext(os.path.basename(video_file))[0]}_speed_{speed_factor}x.mp4")
+
+    if speed_factor == 1 and can_remux(video_file):
+        # 不变速时只换封装为 mp4，流复制即可
+        remux_video(video_file, sped_up_video_path)
+    else:
+        # 变速处理
+        from moviepy.video.io.VideoFileClip import VideoFileClip
+
+        video_clip = VideoFileClip(video_file)
+        speed_change_video(video_clip, speed_factor, sped_up_video_path, threads, get_profile(profile, video_file, threads))
+        video_clip.close()
+
+    print(f"Successfully changed speed of {video_file} to {sped_up_video_path}")
 
 '''
 python video_speedchanger.py -i .\原神变速测试125  -s 1.25
@@ -32,11 +50,21 @@ if __name__ == "__main__":
     parser.add_argument("-i", "--input", default="video", help="Path to the input video file or directory containing videos. Default is 'video'.")
     parser.add_argument("-o", "--output", default=None, help="Path to the output directory. If not provided, it will be generated as input_path + '_speed'.")
     parser.add_argument("-s", "--speed", type=float, default=1.0, help="Speed factor for video. Default is 1.0 (no change).")
+    parser.add_argument("--jobs", type=int, default=1, help="Number of videos to process at the same time. Use 0 to pick from the CPU count and memory budget. Default is 1.")
+    parser.add_argument("--memory_budget", type=float, default=None, help="Memory budget in GB shared by all parallel jobs. Default is 75%% of the physical memory.")
+    parser.add_argument("--profile", choices=PROFILE_NAMES, default=DEFAULT_PROFILE, help="Encoding profile: 'fast' for intermediate files, 'archival', 'delivery' (moviepy's previous defaults), or 'auto' to benchmark a few seconds of the input and pick the slowest preset that still encodes in real time. Default is 'delivery'.")
+    parser.add_argument("--metrics", default=None, help="Append per-video throughput records (frames, fps, decode/transform/encode time) as JSON lines to this file.")
+    parser.add_argument("--metrics_prom", default=None, help="Write the throughput metrics of this run to a Prometheus textfile-collector file.")
     args = parser.parse_args()
 
     input_path = args.input
     output_dir = args.output
     speed_factor = args.speed
+    max_jobs = args.jobs
+    memory_budget = int(args.memory_budget * 1024 ** 3) if args.memory_budget else None
+    profile = args.profile
+    metrics_path = args.metrics
+    prom_path = args.metrics_prom
 
     # 如果未提供 output_dir，则根据 input_path 生成
     if output_dir is None:
@@ -58,13 +86,4 @@ if __name__ == "__main__":
         print(f"Invalid input path: {input_path}")
         exit(1)
 
-    for video_file in video_files:
-        video_clip = VideoFileClip(video_file)
-
-        # 生成输出视频路径
-        sped_up_video_path = os.path.join(output_dir, f"{os.path.splitext(os.path.basename(video_file))[0]}_speed_{speed_factor}x.mp4")
-
-        # 变速处理
-        speed_change_video(video_clip, speed_factor, sped_up_video_path)
-
-        print(f"Successfully changed speed of {video_file} to {sped_up_video_path}")
+    run_batch(speed_change_video_file, video_files, (output_dir, speed_factor, profile), max_jobs, memory_budget, metrics_path=metrics_path, prom_path=prom_path, profile=profile)
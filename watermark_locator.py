@@ -0,0 +1,135 @@
+# coding:utf-8
+
+import numpy as np
+
+# 低于这个置信度时退回到手动框选
+DEFAULT_MIN_CONFIDENCE = 0.5
+# 统计量在不超过这个高度的缩小帧上计算，再把候选区域换算回原始坐标
+ANALYSIS_HEIGHT = 540
+# 像素在所有采样帧上的标准差低于这个值才算静止
+STATIC_STD = 12.0
+# 候选区域外一圈的时间标准差比区域内高出这么多（灰度级）时，认为水印和画面完全可以区分
+MOTION_STD = 4.0
+# 至少在这个比例的采样帧上都是边缘才算持续边缘
+EDGE_PERSISTENCE = 0.6
+# 候选区域外接框占整帧面积的范围，过小的是噪点，过大的是整片静止的背景
+MIN_AREA_RATIO = 0.0002
+MAX_AREA_RATIO = 0.25
+# 保留得分不低于最佳候选这个比例的区域，多个角落的水印可以一起找到
+RELATIVE_SCORE = 0.5
+DARK_FRAME_MEAN = 10
+
+def _to_gray_stack(frames, scale):
+    import cv2
+
+    # 全黑的片头帧没有边缘，会拉低持续度，有足够的亮帧时去掉它们
+    frames = [frame for frame in frames if frame.mean() > DARK_FRAME_MEAN] if sum(frame.mean() > DARK_FRAME_MEAN for frame in frames) >= 3 else list(frames)
+    grays = []
+    for frame in frames:
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        if scale != 1:
+            gray = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        grays.append(gray)
+    return np.stack(grays)
+
+def compute_temporal_stats(gray):
+    import cv2
+
+    # gray 是 (N, H, W) 的灰度帧，逐像素沿时间轴统计：标准差、边缘出现的比例
+    std = gray.astype(np.float32).std(axis=0)
+    edges = np.stack([cv2.Canny(frame, 50, 150) for frame in gray]) > 0
+    # 编码噪声会让边缘偏移一个像素，先在每帧上膨胀一下再统计
+    edges = np.stack([cv2.dilate(frame.view(np.uint8), np.ones((3, 3), np.uint8)) for frame in edges]) > 0
+    persistence = edges.mean(axis=0, dtype=np.float32)
+    return std, persistence
+
+def _otsu_agreement(gray_boxes):
+    import cv2
+
+    # 每帧单独做 Otsu 二值化，前景像素在各帧上的一致程度：0 是随机，1 是每帧都一样
+    foreground = np.stack([cv2.threshold(box, 0, 1, cv2.THRESH_BINARY + cv2.THRESH_OTSU)[1] for box in gray_boxes]).mean(axis=0)
+    voted = foreground[foreground >= 0.5]
+    if voted.size == 0:
+        return 0.0
+    return float((voted.mean() - 0.5) * 2)
+
+def _merge_boxes(boxes):
+    # 外扩后重叠的框合并成一个，投票时同一像素不会被重复计数
+    boxes = [list(box) for box in boxes]
+    merged = True
+    while merged:
+        merged = False
+        for i in range(len(boxes)):
+            for j in range(i + 1, len(boxes)):
+                a, b = boxes[i], boxes[j]
+                if a[0] < b[0] + b[2] and b[0] < a[0] + a[2] and a[1] < b[1] + b[3] and b[1] < a[1] + a[3]:
+                    x0, y0 = min(a[0], b[0]), min(a[1], b[1])
+                    x1, y1 = max(a[0] + a[2], b[0] + b[2]), max(a[1] + a[3], b[1] + b[3])
+                    boxes[i] = [x0, y0, x1 - x0, y1 - y0]
+                    del boxes[j]
+                    merged = True
+                    break
+            if merged:
+                break
+    return [tuple(box) for box in boxes]
+
+def locate_watermark(frames, min_confidence=0.0):
+    import cv2
+
+    # 返回候选水印区域 [(x, y, w, h), ...]（原始坐标）和置信度（0-1）。
+    # 水印在所有帧上位置不变、边缘清晰，而周围的画面在变化：
+    # 持续边缘 + 低时间方差找出候选，再用候选区域外一圈的方差（和画面的区分度）和 Otsu 前景的一致性打分
+    height, width = frames[0].shape[:2]
+    scale = min(1.0, ANALYSIS_HEIGHT / height)
+    gray = _to_gray_stack(frames, scale)
+    if len(gray) < 2:
+        return [], 0.0
+    std, persistence = compute_temporal_stats(gray)
+    small_height, small_width = std.shape
+
+    candidates = ((persistence >= EDGE_PERSISTENCE) & (std < STATIC_STD)).astype(np.uint8)
+    # 把同一段文字的笔画连成一块
+    join = max(3, int(round(small_width * 0.01)) | 1)
+    joined = cv2.morphologyEx(candidates, cv2.MORPH_CLOSE, np.ones((join, join), np.uint8))
+    count, labels, stats, _ = cv2.connectedComponentsWithStats(joined, connectivity=8)
+
+    frame_area = small_width * small_height
+    margin = max(4, join)
+    scored = []
+    for label in range(1, count):
+        x, y, w, h, _ = stats[label]
+        if not MIN_AREA_RATIO <= w * h / frame_area <= MAX_AREA_RATIO:
+            continue
+        region = (labels[y:y + h, x:x + w] == label) & (candidates[y:y + h, x:x + w] > 0)
+        if region.sum() < 20:
+            continue
+
+        x0, y0 = max(0, x - margin), max(0, y - margin)
+        x1, y1 = min(small_width, x + w + margin), min(small_height, y + h + margin)
+        ring = np.ones((y1 - y0, x1 - x0), dtype=bool)
+        ring[y - y0:y - y0 + h, x - x0:x - x0 + w] = False
+
+        edge_score = float(persistence[y:y + h, x:x + w][region].mean())
+        inside_std = float(np.median(std[y:y + h, x:x + w][region]))
+        ring_std = float(np.median(std[y0:y1, x0:x1][ring])) if ring.any() else 0.0
+        # 周围也静止（固定机位、黑边）时区分度接近 0，这样的候选不可信
+        separation = float(np.clip((ring_std - inside_std) / MOTION_STD, 0, 1))
+        agreement = _otsu_agreement(gray[:, y0:y1, x0:x1])
+        scored.append((edge_score * separation * agreement, (x0, y0, x1 - x0, y1 - y0)))
+
+    if not scored:
+        return [], 0.0
+    confidence = max(score for score, _ in scored)
+    keep = [box for score, box in scored if score >= max(confidence * RELATIVE_SCORE, min_confidence)]
+    rois = [(int(x / scale), int(y / scale), int(np.ceil(w / scale)), int(np.ceil(h / scale))) for x, y, w, h in _merge_boxes(keep)]
+    rois = [(x, y, min(w, width - x), min(h, height - y)) for x, y, w, h in rois]
+    return rois, confidence
+
+def find_watermark_rois(frames, min_confidence=DEFAULT_MIN_CONFIDENCE):
+    # 自动定位的结果可信时返回区域列表，否则返回 None，由调用方退回到手动框选
+    rois, confidence = locate_watermark(frames)
+    if rois and confidence >= min_confidence:
+        print(f"Detected {len(rois)} watermark regions with confidence {confidence:.2f}: {rois}")
+        return rois
+    print(f"Watermark detection confidence {confidence:.2f} is below {min_confidence:.2f}, falling back to manual selection")
+    return None
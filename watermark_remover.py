@@ -1,115 +1,99 @@
 # coding:utf-8
 
-import cv2
-import numpy as np
 import glob
-from moviepy.editor import VideoFileClip
 import os
-from tqdm import tqdm
+from mask_inpainter import INPAINT_METHODS, make_mask_func, report_inpaint_stats
+from frame_sampler import FrameSampler
+from mask_store import load_mask, load_mask_template, mask_exists
+from mask_aligner import fit_mask_to_video
+from mask_builder import build_watermark_mask
+from watermark_locator import DEFAULT_MIN_CONFIDENCE, find_watermark_rois
+from segment_runner import process_video_segments
+from batch_executor import run_batch
+from frame_io import BACKENDS, transform_video
+from encoding_profiles import DEFAULT_PROFILE, PROFILE_NAMES
 import argparse
-
-def ensure_directory_exists(directory):
-    if not os.path.exists(directory):
-        try:
-            os.makedirs(directory)
-            print(f"Created directory: {directory}")
-        except OSError as error:
-            print(f"Error creating directory {directory}: {error}")
-            raise
-
-def is_valid_video_file(file):
-    try:
-        with VideoFileClip(file) as video_clip:
-            return True
-    except Exception as e:
-        print(f"Invalid video file: {file}, Error: {e}")
-        return False
-
-def get_first_valid_frame(video_clip, threshold=10, num_frames=10):
-    total_frames = int(video_clip.fps * video_clip.duration)
-    frame_indices = [int(i * total_frames / num_frames) for i in range(num_frames)]
-
-    for idx in frame_indices:
-        frame = video_clip.get_frame(idx / video_clip.fps)
-        if frame.mean() > threshold:
-            return frame
-
-    return video_clip.get_frame(0)
-
-def select_roi_for_mask(video_clip):
-    frame = get_first_valid_frame(video_clip)
-
-    # 将视频帧调整为720p显示
-    display_height = 720
-    scale_factor = display_height / frame.shape[0]
-    display_width = int(frame.shape[1] * scale_factor)
-    display_frame = cv2.resize(frame, (display_width, display_height))
-
-    instructions = "Select ROI and press SPACE or ENTER"
-    font = cv2.FONT_HERSHEY_SIMPLEX
-    cv2.putText(display_frame, instructions, (10, 30), font, 1, (255, 255, 255), 2, cv2.LINE_AA)
-
-    r = cv2.selectROI(display_frame)
-    cv2.destroyAllWindows()
-
-    r_original = (int(r[0] / scale_factor), int(r[1] / scale_factor), int(r[2] / scale_factor), int(r[3] / scale_factor))
-
-    return r_original
-
-def detect_watermark_adaptive(frame, roi):
-    roi_frame = frame[roi[1]:roi[1] + roi[3], roi[0]:roi[0] + roi[2]]
-    gray_frame = cv2.cvtColor(roi_frame, cv2.COLOR_BGR2GRAY)
-    _, binary_frame = cv2.threshold(gray_frame, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-
-    mask = np.zeros_like(frame[:, :, 0], dtype=np.uint8)
-    mask[roi[1]:roi[1] + roi[3], roi[0]:roi[0] + roi[2]] = binary_frame
-
-    return mask
-
-def generate_watermark_mask(video_clip, num_frames=10, min_frame_count=7):
-    total_frames = int(video_clip.duration * video_clip.fps)
-    frame_indices = [int(i * total_frames / num_frames) for i in range(num_frames)]
-
-    frames = [video_clip.get_frame(idx / video_clip.fps) for idx in frame_indices]
-    r_original = select_roi_for_mask(video_clip)
-
-    masks = [detect_watermark_adaptive(frame, r_original) for frame in frames]
-
-    final_mask = sum((mask == 255).astype(np.uint8) for mask in masks)
-    # 根据像素点在至少min_frame_count张以上的帧中的出现来生成最终的遮罩
-    final_mask = np.where(final_mask >= min_frame_count, 255, 0).astype(np.uint8)
-
-    kernel = np.ones((5, 5), np.uint8)
-    return cv2.dilate(final_mask, kernel)
-
-def process_video(video_clip, output_path, apply_mask_func, max_frames=None):
-    total_frames = int(video_clip.duration * video_clip.fps)
-    progress_bar = tqdm(total=total_frames, desc="Processing Frames", unit="frames")
-
+from video_prober import filter_valid_videos, get_video_info
+from run_manifest import RunManifest
+from video_common import ensure_directory_exists, is_valid_video_file, select_roi
+
+# 没有给 --save_mask 时，交互生成（或自动定位）的遮罩也存一份在输出目录里，中断后重新运行时直接读回来
+GENERATED_MASK_NAME = ".generated_mask"
+
+def generate_watermark_mask(video_path, num_frames=10, min_frame_count=7, save_name=None, detect=False, detect_confidence=DEFAULT_MIN_CONFIDENCE):
+    # 采样帧只解码一次，ROI 选择（或自动定位）和遮罩投票共用
+    sampler = FrameSampler(video_path, num_frames=num_frames)
+    frames = sampler.get_frames()
+    rois = find_watermark_rois(frames, detect_confidence) if detect else None
+    if rois is None:
+        rois = [select_roi(sampler.get_first_valid_frame(), "Select ROI and press SPACE or ENTER")]
+    # 投票生成遮罩和水印模板，其他分辨率、位置不同的视频靠模板对齐遮罩
+    return build_watermark_mask(frames, rois, min_frame_count, save_name)
+
+def process_video(video_path, output_path, apply_mask_func, max_frames=None, threads=None, backend="moviepy", profile=None):
+    end_time = None
     if max_frames is not None:
-        video_clip = video_clip.subclip(0, min(video_clip.duration, max_frames / video_clip.fps))
-
-    def process_frame(frame):
-        result = apply_mask_func(frame)
-        progress_bar.update(1)
-        return result
-
-    processed_video = video_clip.fl_image(process_frame)
-    try:
-        processed_video.write_videofile(f"{output_path}.mp4", codec="libx264")
-    except:
-        print("clipped_video write error")
+        info = get_video_info(video_path)
+        end_time = min(info["duration"], max_frames / info["fps"])
+
+    # 写入失败时异常交给批处理记录到完成清单，不再吞掉
+    transform_video(video_path, f"{output_path}.mp4", apply_mask_func.apply_batch, backend, 0, end_time, threads, profile=profile)
+
+def process_video_file(video_path, output_dir, watermark_mask, workers=1, max_frames=None, backend="moviepy", reuse_tolerance=None, inpaint_method="ns", profile=None, segment_seconds=None, mask_template=None, mask_source=None, threads=None):
+    video_name = os.path.basename(video_path)
+    output_video_path = os.path.join(output_dir, os.path.splitext(video_name)[0])
+    # 遮罩可能来自分辨率、水印位置不同的视频：有模板时在这个视频上匹配水印位置和大小，否则按分辨率等比缩放。
+    # mask_source 是生成遮罩的视频，遮罩本来就在它的坐标系里，不用再对齐
+    if video_path != mask_source:
+        watermark_mask = fit_mask_to_video(watermark_mask, mask_template, video_path)
+    if workers > 1 or segment_seconds:
+        max_segment_frames = max(1, int(segment_seconds * get_video_info(video_path)["fps"])) if segment_seconds else None
+        process_video_segments(video_path, f"{output_video_path}.mp4", watermark_mask, workers, max_frames, backend, reuse_tolerance, inpaint_method, profile, max_segment_frames, threads)
+    else:
+        mask_func = make_mask_func(watermark_mask, method=inpaint_method, reuse_tolerance=reuse_tolerance)
+        process_video(video_path, output_video_path, mask_func, max_frames, threads, backend, profile)
+        report_inpaint_stats(mask_func, video_name)
+    print(f"Successfully processed {video_name}")
+    return f"{output_video_path}.mp4"
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Process videos to detect and remove watermarks.")
     parser.add_argument("-i", "--input", default="video", help="Path to the input video file or directory containing videos. Default is 'video'.")
     parser.add_argument("-o", "--output", default=None, help="Path to the output directory. If not provided, it will be generated as input_path + '_rmwtmk'.")
     parser.add_argument("-f", "--frames", type=int, default=None, help="Number of frames to process. If not provided, the entire video will be processed.")
+    parser.add_argument("-w", "--watermark_mask", default=None, help="Name of a mask in the mask store or path to a mask PNG. Use 'detect' to locate the watermark automatically on the first video (falls back to interactive selection when the confidence is below --detect_confidence). If not provided, the mask is generated interactively on the first video and kept in the output directory, so a rerun reuses it instead of asking again.")
+    parser.add_argument("--detect_confidence", type=float, default=DEFAULT_MIN_CONFIDENCE, help="Minimum confidence (0-1) of the automatic watermark detection before falling back to interactive selection. Default is 0.5.")
+    parser.add_argument("--save_mask", default=None, help="Save the generated watermark mask under this name in the mask store (or to this path) so later runs can pass it to -w.")
+    parser.add_argument("-j", "--workers", type=int, default=1, help="Number of worker processes. Each worker inpaints and encodes one time segment, then the segments are joined by stream copy. Default is 1.")
+    parser.add_argument("--segment_seconds", type=float, default=None, help="Split each video into segments of at most this many seconds. Finished segments are kept until the video is done, so an interrupted run resumes from the last finished segment. Off by default.")
+    parser.add_argument("--force", action="store_true", help="Process every video again, even if the manifest in the output directory records it as completed with the same parameters. A generated watermark mask is also generated again.")
+    parser.add_argument("--jobs", type=int, default=1, help="Number of videos to process at the same time. Use 0 to pick from the CPU count and memory budget. Default is 1.")
+    parser.add_argument("--memory_budget", type=float, default=None, help="Memory budget in GB shared by all parallel jobs. Default is 75%% of the physical memory.")
+    parser.add_argument("--inpaint_method", choices=INPAINT_METHODS, default="ns", help="Inpaint method. 'ns' and 'telea' run OpenCV on every frame; 'harmonic' and 'biharmonic' factorise the fill for the fixed mask once and only solve a sparse system per frame (requires scipy). Default is 'ns'.")
+    parser.add_argument("--reuse_tolerance", type=float, default=None, help="Reuse the previous inpainted patch while the pixels around the watermark change by less than this mean absolute difference (0-255). Suited to timelapse footage. Off by default.")
+    parser.add_argument("--profile", choices=PROFILE_NAMES, default=DEFAULT_PROFILE, help="Encoding profile: 'fast' for intermediate files, 'archival', 'delivery' (moviepy's previous defaults), or 'auto' to benchmark a few seconds of the input and pick the slowest preset that still encodes in real time. Default is 'delivery'.")
+    parser.add_argument("--metrics", default=None, help="Append per-video throughput records (frames, fps, decode/transform/encode time) as JSON lines to this file.")
+    parser.add_argument("--metrics_prom", default=None, help="Write the throughput metrics of this run to a Prometheus textfile-collector file.")
+    parser.add_argument("--backend", choices=BACKENDS, default="moviepy", help="Frame reader/writer backend. 'ffmpeg' pipes raw frames into reused buffers, 'opencv' reads with cv2.VideoCapture. Default is 'moviepy'.")
     args = parser.parse_args()
 
     input_path = args.input
     output_dir = args.output
     max_frames = args.frames
+    workers = args.workers
+    segment_seconds = args.segment_seconds
+    force = args.force
+    watermark_mask = args.watermark_mask
+    save_mask_name = args.save_mask
+    detect_confidence = args.detect_confidence
+    backend = args.backend
+    reuse_tolerance = args.reuse_tolerance
+    inpaint_method = args.inpaint_method
+    profile = args.profile
+    metrics_path = args.metrics
+    prom_path = args.metrics_prom
+    max_jobs = args.jobs
+    memory_budget = int(args.memory_budget * 1024 ** 3) if args.memory_budget else None
 
     # 如果未提供 output_dir，则根据 input_path 生成
     if output_dir is None:
@@ -126,20 +110,35 @@ if __name__ == "__main__":
     if os.path.isfile(input_path):
         videos = [input_path] if is_valid_video_file(input_path) else []
     elif os.path.isdir(input_path):
-        videos = [f for f in glob.glob(os.path.join(input_path, "*")) if is_valid_video_file(f)]
+        videos = filter_valid_videos(glob.glob(os.path.join(input_path, "*")))
     else:
         print(f"Invalid input path: {input_path}")
         exit(1)
 
-    watermark_mask = None
-
-    for video in videos:
-        video_clip = VideoFileClip(video)
-        if watermark_mask is None:
-            watermark_mask = generate_watermark_mask(video_clip)
+    if not videos:
+        print(f"No valid video files found in {input_path}")
+        exit(1)
 
-        mask_func = lambda frame: cv2.inpaint(frame, watermark_mask, 3, cv2.INPAINT_NS)
-        video_name = os.path.basename(video)
-        output_video_path = os.path.join(output_dir, os.path.splitext(video_name)[0])
-        process_video(video_clip, output_video_path, mask_func, max_frames)
-        print(f"Successfully processed {video_name}")
+    if watermark_mask is not None and watermark_mask != "detect":
+        # 按名字或路径从遮罩库读取，不需要界面也不需要采样
+        mask_template = load_mask_template(watermark_mask)
+        watermark_mask = load_mask(watermark_mask)
+        mask_source = None
+    else:
+        mask_name = save_mask_name or os.path.join(output_dir, GENERATED_MASK_NAME)
+        if not force and mask_exists(mask_name):
+            # 上次运行生成的遮罩还在，不再让操作者重新框选；选区差一个像素也会让完成清单全部失效
+            print(f"Reusing the watermark mask generated by the previous run: {mask_name}")
+            mask_template = load_mask_template(mask_name)
+            watermark_mask = load_mask(mask_name)
+            mask_source = None
+        else:
+            # 在第一个视频上生成水印遮罩，所有视频共用
+            watermark_mask, mask_template = generate_watermark_mask(videos[0], save_name=mask_name, detect=watermark_mask == "detect", detect_confidence=detect_confidence)
+            mask_source = videos[0]
+
+    # 完成清单按输入身份和这些参数判断视频是否已经处理过；遮罩都来自保存的文件，重新运行时内容不变。
+    # 并行进程数、分段长度不影响输出，不计入参数
+    job_args = (output_dir, watermark_mask, workers, max_frames, backend, reuse_tolerance, inpaint_method, profile, segment_seconds, mask_template, mask_source)
+    manifest = RunManifest(output_dir, ["watermark_remover", watermark_mask, mask_template, max_frames, backend, reuse_tolerance, inpaint_method, profile], force)
+    run_batch(process_video_file, videos, job_args, max_jobs, memory_budget, metrics_path=metrics_path, prom_path=prom_path, manifest=manifest, profile=profile)